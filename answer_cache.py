@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import uuid
+import numpy as np
+import redis
+from dotenv import load_dotenv
+import structlog
+from embedding_cache import normalize_query
+
+load_dotenv()
+logger = structlog.get_logger()
+
+def normalize_question(question: str) -> str:
+    """Case, whitespace and trailing punctuation don't change the answer."""
+    return normalize_query(question).rstrip("?!. ")
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+class AnswerCache:
+    """Redis-backed /query answer cache with an exact and a semantic layer.
+
+    Keys are namespaced by an index version stored in Redis; bumping it (on any
+    index change) invalidates every cached answer across all workers. Entries
+    expire after ``ttl`` seconds and the least recently used ones are evicted
+    beyond ``max_entries``. The semantic layer keeps question embeddings in a
+    Redis hash mirrored in-process. Every add and eviction is also appended to
+    a log list; a lookup fetches only the log entries past the mirror's cursor
+    (one round trip, usually empty) and does a local matrix product. When the
+    log outgrows ``max_entries`` it is dropped and its epoch changes, and each
+    mirror reloads the hash once. Redis errors degrade to cache misses.
+    """
+
+    PREFIX = "qa"
+
+    def __init__(self, redis_client, ttl: int = None, max_entries: int = None, similarity: float = None):
+        self.redis = redis_client
+        self.ttl = ttl or int(os.environ.get("ANSWER_CACHE_TTL", 3600))
+        self.max_entries = max_entries or int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 10000))
+        self.similarity = similarity if similarity is not None else float(os.environ.get("ANSWER_CACHE_SIMILARITY", 0.95))
+        self._mirror = {"version": None, "epoch": None, "cursor": 0, "keys": [], "rows": {},
+                        "top_k": np.zeros(0, dtype=np.int32), "vectors": None}
+        self._lock = threading.Lock()
+        # Per-process counters for cheap hit-ratio reporting; Redis holds the cluster totals
+        self.local_counts = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    def _k(self, *parts) -> str:
+        return ":".join((self.PREFIX,) + tuple(str(p) for p in parts))
+
+    def index_version(self) -> int:
+        return int(self.redis.get(self._k("index_version")) or 0)
+
+    def invalidate(self, generation: str = None) -> bool:
+        """Move every worker to a fresh key namespace when the index changes.
+
+        With ``generation`` (a published index generation), only the first call
+        for that generation bumps the version; every other worker's call just
+        re-reads the stored generation. Returns whether this call invalidated.
+        """
+        try:
+            if generation is not None and not self._claim_generation(generation):
+                return False
+            old = self.index_version()
+            self.redis.incr(self._k("index_version"))
+            # Old entries would expire via TTL anyway; drop them now to free memory
+            for key in self.redis.scan_iter(match=self._k(f"v{old}", "*"), count=1000):
+                self.redis.delete(key)
+            logger.info("Answer cache invalidated", old_version=old, generation=generation)
+            return True
+        except redis.RedisError as e:
+            logger.warning("Answer cache invalidation failed", error=str(e))
+            return False
+
+    def _claim_generation(self, generation: str) -> bool:
+        key = self._k("generation")
+
+        def claim(pipe):
+            current = _text(pipe.get(key))
+            # Generation names sort in publish order; a late worker never moves the cache backwards
+            if current is not None and current >= generation:
+                return False
+            pipe.multi()
+            pipe.set(key, generation)
+            return True
+
+        return self.redis.transaction(claim, key, value_from_callable=True)
+
+    def _entry_key(self, version: int, question: str, top_k: int) -> str:
+        digest = hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+        return self._k(f"v{version}", "entry", top_k, digest)
+
+    def _vector_keys(self, version: int):
+        return self._k(f"v{version}", "vectors"), self._k(f"v{version}", "vectors_log"), self._k(f"v{version}", "vectors_epoch")
+
+    def _count(self, field: str) -> None:
+        with self._lock:
+            if field in self.local_counts:
+                self.local_counts[field] += 1
+        try:
+            self.redis.hincrby(self._k("stats"), field, 1)
+        except redis.RedisError:
+            pass
+
+    def _touch(self, version: int, key: str) -> None:
+        self.redis.zadd(self._k(f"v{version}", "lru"), {key: time.time()})
+
+    def _load(self, version: int, key: str):
+        raw = self.redis.get(key)
+        if raw is None:
+            return None
+        self._touch(version, key)
+        return json.loads(raw)
+
+    def get_exact(self, question: str, top_k: int):
+        try:
+            version = self.index_version()
+            entry = self._load(version, self._entry_key(version, question, top_k))
+        except redis.RedisError as e:
+            logger.warning("Answer cache lookup failed", error=str(e))
+            return None
+        if entry is not None:
+            self._count("exact_hits")
+            return entry["response"]
+        return None
+
+    def _refresh_mirror(self, version: int) -> None:
+        vectors_key, log_key, epoch_key = self._vector_keys(version)
+        with self._lock:
+            mirror = self._mirror
+        if mirror["version"] == version:
+            pipe = self.redis.pipeline()
+            pipe.get(epoch_key)
+            pipe.lrange(log_key, mirror["cursor"], -1)
+            epoch, ops = pipe.execute()
+            if epoch == mirror["epoch"]:
+                if ops:
+                    self._swap_mirror(mirror, self._replay(mirror, ops))
+                return
+        # First lookup in this namespace, or the log was compacted: reload the snapshot
+        pipe = self.redis.pipeline()
+        pipe.get(epoch_key)
+        pipe.hgetall(vectors_key)
+        pipe.llen(log_key)
+        epoch, stored, cursor = pipe.execute()
+        keys = [k.decode() if isinstance(k, bytes) else k for k in stored]
+        self._swap_mirror(mirror, {
+            "version": version, "epoch": epoch, "cursor": cursor, "keys": keys,
+            "rows": {k: i for i, k in enumerate(keys)},
+            "top_k": np.array([int(k.split(":")[-2]) for k in keys], dtype=np.int32),
+            "vectors": np.stack([np.frombuffer(v, dtype=np.float32) for v in stored.values()]) if stored else None,
+        })
+
+    def _swap_mirror(self, old: dict, new: dict) -> None:
+        with self._lock:
+            # Another thread may have refreshed meanwhile; its mirror is at least as new
+            if self._mirror is old:
+                self._mirror = new
+
+    @staticmethod
+    def _replay(mirror: dict, ops: list) -> dict:
+        """Apply log entries (b"+key\\n<vector>" adds, b"-key" evictions) to a copy of ``mirror``."""
+        keys, rows, top_k = list(mirror["keys"]), dict(mirror["rows"]), mirror["top_k"].tolist()
+        added = []
+        for op in ops:
+            key, _, vector = op[1:].partition(b"\n")
+            key = key.decode()
+            row = rows.pop(key, None)
+            if row is not None:
+                # Tombstone: a top_k of -1 never matches a lookup; rows are compacted on the next reload
+                top_k[row] = -1
+            if op[:1] == b"+":
+                rows[key] = len(keys)
+                keys.append(key)
+                top_k.append(int(key.split(":")[-2]))
+                added.append(np.frombuffer(vector, dtype=np.float32))
+        vectors = mirror["vectors"]
+        if added:
+            vectors = np.vstack(([vectors] if vectors is not None else []) + added)
+        return dict(mirror, cursor=mirror["cursor"] + len(ops), keys=keys, rows=rows,
+                    top_k=np.array(top_k, dtype=np.int32), vectors=vectors)
+
+    def get_semantic(self, embedding, top_k: int):
+        """Return the cached response whose question is most similar to ``embedding``, if close enough."""
+        try:
+            version = self.index_version()
+            self._refresh_mirror(version)
+            with self._lock:
+                mirror = self._mirror
+            if mirror["vectors"] is None:
+                self._count("misses")
+                return None
+            query = np.asarray(embedding, dtype=np.float32)
+            query = query / (np.linalg.norm(query) + 1e-12)
+            scores = mirror["vectors"] @ query
+            scores[mirror["top_k"] != top_k] = -1.0
+            best = int(np.argmax(scores))
+            if scores[best] >= self.similarity:
+                entry = self._load(version, mirror["keys"][best])
+                if entry is not None:
+                    self._count("semantic_hits")
+                    return entry["response"]
+        except redis.RedisError as e:
+            logger.warning("Answer cache lookup failed", error=str(e))
+            return None
+        self._count("misses")
+        return None
+
+    def put(self, question: str, top_k: int, embedding, response: dict, generation: str = None) -> None:
+        """Cache an answer; skipped if it came from a ``generation`` other than the one the cache is on."""
+        try:
+            version, current = self.redis.mget(self._k("index_version"), self._k("generation"))
+            if generation is not None and current is not None and _text(current) != generation:
+                return
+            version = int(version or 0)
+            key = self._entry_key(version, question, top_k)
+            lru_key = self._k(f"v{version}", "lru")
+            vectors_key, log_key, epoch_key = self._vector_keys(version)
+            pipe = self.redis.pipeline()
+            pipe.set(key, json.dumps({"question": question, "response": response}), ex=self.ttl)
+            pipe.zadd(lru_key, {key: time.time()})
+            # Lexical-only answers have no embedding and are cached for exact lookups only
+            if embedding is not None:
+                vector = np.asarray(embedding, dtype=np.float32)
+                vector = (vector / (np.linalg.norm(vector) + 1e-12)).tobytes()
+                pipe.hset(vectors_key, key, vector)
+                pipe.rpush(log_key, b"+" + key.encode() + b"\n" + vector)
+                # A log recreated after expiry gets a fresh epoch, so no mirror replays it from a stale cursor
+                pipe.set(epoch_key, uuid.uuid4().hex, nx=True)
+            for k in (lru_key, vectors_key, log_key, epoch_key):
+                pipe.expire(k, self.ttl)
+            pipe.execute()
+            self._evict(version)
+        except redis.RedisError as e:
+            logger.warning("Answer cache store failed", error=str(e))
+
+    def _evict(self, version: int) -> None:
+        lru_key = self._k(f"v{version}", "lru")
+        vectors_key, log_key, epoch_key = self._vector_keys(version)
+        pipe = self.redis.pipeline()
+        pipe.zcard(lru_key)
+        # Entries whose TTL lapsed still sit in the LRU set; drop them first
+        pipe.zrangebyscore(lru_key, 0, time.time() - self.ttl)
+        pipe.llen(log_key)
+        size, expired, log_length = pipe.execute()
+        overflow = size - self.max_entries
+        victims = list(expired)
+        if overflow > len(victims):
+            victims += [k for k, _ in self.redis.zpopmin(lru_key, overflow - len(victims))]
+        pipe = self.redis.pipeline()
+        if victims:
+            pipe.zrem(lru_key, *victims)
+            pipe.delete(*victims)
+            pipe.hdel(vectors_key, *victims)
+            pipe.rpush(log_key, *(b"-" + (k if isinstance(k, bytes) else k.encode()) for k in victims))
+            log_length += len(victims)
+        if log_length > self.max_entries:
+            # Compact: the hash is the snapshot; mirrors see the new epoch and reload it once
+            pipe.delete(log_key)
+            pipe.set(epoch_key, uuid.uuid4().hex, ex=self.ttl)
+        if len(pipe):
+            pipe.execute()
+        if victims:
+            self._count("evictions")
+
+    def record_miss(self) -> None:
+        """Count a lookup that skipped the semantic layer (lexical path) after an exact miss."""
+        self._count("misses")
+
+    def local_hit_ratio(self) -> float:
+        with self._lock:
+            hits = self.local_counts["exact_hits"] + self.local_counts["semantic_hits"]
+            lookups = hits + self.local_counts["misses"]
+        return round(hits / lookups, 4) if lookups else 0.0
+
+    def stats(self) -> dict:
+        try:
+            raw = self.redis.hgetall(self._k("stats"))
+            version = self.index_version()
+            entries = self.redis.zcard(self._k(f"v{version}", "lru"))
+        except redis.RedisError as e:
+            return {"error": str(e)}
+        counts = {(k.decode() if isinstance(k, bytes) else k): int(v) for k, v in raw.items()}
+        hits = counts.get("exact_hits", 0) + counts.get("semantic_hits", 0)
+        lookups = hits + counts.get("misses", 0)
+        return {
+            "exact_hits": counts.get("exact_hits", 0),
+            "semantic_hits": counts.get("semantic_hits", 0),
+            "misses": counts.get("misses", 0),
+            "evictions": counts.get("evictions", 0),
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "index_version": version,
+        }
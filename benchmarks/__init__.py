@@ -0,0 +1 @@
+"""Offline benchmarks for the document assistant. Run modules with ``python -m benchmarks.<name>``."""
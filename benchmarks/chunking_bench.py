@@ -0,0 +1,99 @@
+"""Chunking benchmark: chunks/sec and retrieval recall@k for several chunk sizes.
+
+    python -m benchmarks.chunking_bench --pages 200 --sizes 128 250 512 --out chunking.json
+
+Pages are synthetic service-manual markdown with one planted fact per page
+(a unique bolt id and torque value). Recall@k is the share of fact questions
+whose answer appears in one of the top-k chunks retrieved by the embedding model.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import numpy as np
+from chunking import Chunker, get_tokenizer
+
+FILLER = [
+    "Ensure the machine is locked out before opening any guard.",
+    "Wear protective gloves and eye protection during this procedure.",
+    "Clean the surface with a lint-free cloth and isopropyl alcohol.",
+    "Verify the coolant level and top up with the approved concentrate.",
+    "Inspect the cable harness for abrasion and replace damaged sections.",
+    "Record the measured values in the machine maintenance log.",
+    "Run the axis at low feed to confirm smooth motion after assembly.",
+]
+
+def synthetic_pages(num_pages: int, seed: int = 7):
+    """Return (pages, questions): markdown pages and (question, answer) pairs, one per page."""
+    rng = random.Random(seed)
+    pages, questions = [], []
+    for p in range(num_pages):
+        bolt = f"BX-{1000 + p}"
+        torque = rng.randint(10, 400)
+        paragraphs = [f"# Section {p}: Assembly procedure"]
+        facts_at = rng.randint(1, 6)
+        for i in range(8):
+            paragraphs.append(" ".join(rng.choice(FILLER) for _ in range(rng.randint(2, 6))))
+            if i == facts_at:
+                paragraphs.append(f"## Fastener {bolt}\n\nTighten fastener {bolt} to {torque} Nm in a star pattern.")
+        paragraphs.append("| Step | Tool | Check |\n|---|---|---|\n" + "\n".join(
+            f"| {s} | T{rng.randint(1, 40)} | {rng.choice(['visual', 'gauge', 'torque'])} |" for s in range(6)))
+        pages.append("\n\n".join(paragraphs))
+        questions.append((f"What torque should fastener {bolt} be tightened to?", f"{torque} Nm"))
+    return pages, questions
+
+def recall_at_k(chunks, questions, answers_by_page, k, embeddings):
+    doc_vecs = np.asarray(embeddings.embed_documents([c["text"] for c in chunks]), dtype=np.float32)
+    doc_vecs /= np.linalg.norm(doc_vecs, axis=1, keepdims=True) + 1e-12
+    hits = 0
+    for (question, answer), page in zip(questions, answers_by_page):
+        q = np.asarray(embeddings.embed_query(question), dtype=np.float32)
+        top = np.argsort(-(doc_vecs @ q))[:k]
+        hits += any(chunks[i]["page"] == page and answer in chunks[i]["text"] for i in top)
+    return hits / len(questions)
+
+def run(num_pages: int, sizes, overlap: int, k: int, with_recall: bool) -> dict:
+    pages, questions = synthetic_pages(num_pages)
+    tokenizer = get_tokenizer()
+    embeddings = None
+    if with_recall:
+        from model_registry import get_embeddings
+        embeddings = get_embeddings()
+    results = {"pages": num_pages, "tokenizer": tokenizer is not None, "overlap": overlap, "k": k, "runs": []}
+    for size in sizes:
+        chunker = Chunker(chunk_size=size, overlap=min(overlap, size // 4), tokenizer=tokenizer)
+        start = time.perf_counter()
+        chunks = [dict(c, page=p) for p, page in enumerate(pages) for c in chunker.split(page)]
+        elapsed = time.perf_counter() - start
+        run = {
+            "chunk_size": size,
+            "chunks": len(chunks),
+            "chunks_per_sec": round(len(chunks) / elapsed, 1),
+            "pages_per_sec": round(num_pages / elapsed, 1),
+            "max_tokens": max(chunker.count_tokens([c["text"] for c in chunks])),
+        }
+        if embeddings is not None:
+            run["recall_at_k"] = round(recall_at_k(chunks, questions, range(num_pages), k, embeddings), 3)
+        results["runs"].append(run)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[128, 250, 512])
+    parser.add_argument("--overlap", type=int, default=32)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--no-recall", action="store_true", help="skip the embedding-based recall measurement")
+    parser.add_argument("--out", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+    results = run(args.pages, args.sizes, args.overlap, args.k, not args.no_recall)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Synthetic manufacturing-manual corpus: small PDFs whose OCR text is generated, not stored.
+
+    python -m benchmarks.corpus --docs 50 --pages 20 --out-dir data/bench_raw
+
+Each PDF holds blank pages plus a ``/BenchSeed`` metadata entry. The stub OCR
+client (``benchmarks.stubs.StubOCRClient``) turns seed and page index back into
+the same markdown every time, so runs are reproducible without shipping text.
+"""
+import argparse
+import os
+import random
+from benchmarks.chunking_bench import FILLER
+
+def page_markdown(seed: str, page: int) -> str:
+    """Deterministic service-manual page: headings, procedure text, one fastener fact, one alarm code, a table."""
+    rng = random.Random(f"{seed}:{page}")
+    bolt = f"BX-{rng.randint(1000, 9999)}"
+    alarm = f"E-{rng.randint(1000, 9999)}"
+    parts = [
+        "WARNING: Lock out the machine and wear protective equipment before servicing.",
+        f"# Section {page + 1}: {rng.choice(['Spindle', 'Coolant', 'Axis drive', 'Tool changer', 'Hydraulics'])} maintenance",
+    ]
+    for i in range(rng.randint(4, 8)):
+        parts.append(" ".join(rng.choice(FILLER) for _ in range(rng.randint(2, 6))))
+        if i == 1:
+            parts.append(f"## Fastener {bolt}\n\nTighten fastener {bolt} to {rng.randint(10, 400)} Nm in a star pattern.")
+        if i == 2:
+            parts.append(f"Alarm {alarm} indicates {rng.choice(['low coolant pressure', 'door interlock open', 'servo overload'])}; "
+                         f"clear the cause, then press RESET.")
+    parts.append("| Step | Tool | Check |\n|---|---|---|\n" + "\n".join(
+        f"| {s} | T{rng.randint(1, 40)} | {rng.choice(['visual', 'gauge', 'torque'])} |" for s in range(rng.randint(3, 8))))
+    return "\n\n".join(parts)
+
+def questions_for(seed: str, page: int) -> list:
+    """Questions answerable from ``page_markdown(seed, page)``; used to drive the /query load test."""
+    text = page_markdown(seed, page)
+    bolt = text.split("## Fastener ", 1)[1].split("\n", 1)[0]
+    alarm = text.split("Alarm ", 1)[1].split(" ", 1)[0]
+    return [f"What torque should fastener {bolt} be tightened to?", f"How do I clear alarm {alarm}?"]
+
+def generate_corpus(out_dir: str, num_docs: int = 20, pages_per_doc: int = 10, seed: int = 7) -> dict:
+    """Write ``num_docs`` PDFs to ``out_dir``; returns {"files", "pages", "bytes", "questions"}."""
+    from pypdf import PdfWriter
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    files, questions, total_bytes = [], [], 0
+    for d in range(num_docs):
+        doc_seed = f"{seed}-{d}"
+        writer = PdfWriter()
+        for _ in range(pages_per_doc):
+            writer.add_blank_page(width=612, height=792)
+        writer.add_metadata({"/BenchSeed": doc_seed, "/Title": f"Service manual {d}"})
+        path = os.path.join(out_dir, f"manual_{d:04d}.pdf")
+        with open(path, "wb") as f:
+            writer.write(f)
+        files.append(path)
+        total_bytes += os.path.getsize(path)
+        questions.extend(questions_for(doc_seed, rng.randrange(pages_per_doc)))
+    return {"files": files, "pages": num_docs * pages_per_doc, "bytes": total_bytes, "questions": questions}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=10, help="pages per document")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out-dir", required=True)
+    args = parser.parse_args(argv)
+    corpus = generate_corpus(args.out_dir, args.docs, args.pages, args.seed)
+    print(f"Wrote {len(corpus['files'])} PDFs ({corpus['pages']} pages) to {args.out_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Embedding backend benchmark: sentences/sec, query latency, memory and parity.
+
+    python -m benchmarks.embedding_backends --backends torch onnx --sentences 2000 --out backends.json
+
+Each backend is measured in a fresh process so its memory footprint (RSS
+growth while loading, model bytes) is not mixed with the other's. The parity
+check then loads both in this process and reports the cosine agreement of the
+ONNX vectors with the PyTorch ones on the same chunks.
+"""
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from benchmarks.chunking_bench import synthetic_pages
+from benchmarks.load_test import QUESTIONS, latency_summary
+
+def sample_texts(num: int):
+    pages, _ = synthetic_pages(max(num // 8, 1))
+    paragraphs = [p for page in pages for p in page.split("\n\n")]
+    return (paragraphs * (num // max(len(paragraphs), 1) + 1))[:num]
+
+def measure(backend: str, num_sentences: int, repeats: int) -> dict:
+    from model_registry import current_rss_bytes, get_embeddings, memory_report
+    from onnx_embeddings import throughput
+    rss_before = current_rss_bytes()
+    start = time.perf_counter()
+    embeddings = get_embeddings(backend=backend)
+    load_s = time.perf_counter() - start
+    texts = sample_texts(num_sentences)
+    sentences_per_sec = throughput(embeddings, texts, repeats)
+    latencies = []
+    for _ in range(5):
+        for question in QUESTIONS:
+            t = time.perf_counter()
+            embeddings.embed_query(question)
+            latencies.append((time.perf_counter() - t) * 1000)
+    stats = next(iter(memory_report()["models"].values()))
+    return {
+        "backend": backend,
+        "load_s": round(load_s, 2),
+        "sentences_per_sec": round(sentences_per_sec, 1),
+        "query_latency": latency_summary(latencies),
+        "model_mb": round(stats["parameter_bytes"] / 2**20, 1),
+        "rss_growth_mb": round((current_rss_bytes() - rss_before) / 2**20, 1),
+    }
+
+def run(backends, num_sentences: int, repeats: int, parity: bool) -> dict:
+    results = {"sentences": num_sentences, "repeats": repeats, "backends": []}
+    ctx = multiprocessing.get_context("spawn")
+    for backend in backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            results["backends"].append(pool.submit(measure, backend, num_sentences, repeats).result())
+    if parity:
+        from model_registry import get_embeddings
+        from onnx_embeddings import parity_check
+        results["parity"] = parity_check(get_embeddings(backend="onnx"), get_embeddings(backend="torch"),
+                                         sample_texts(min(num_sentences, 500)) + QUESTIONS)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"], choices=["torch", "onnx"])
+    parser.add_argument("--sentences", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--no-parity", action="store_true", help="skip the torch vs onnx cosine agreement check")
+    parser.add_argument("--out", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+    results = run(args.backends, args.sentences, args.repeats, not args.no_parity)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Concurrent /query load test: requests/sec and p50/p95/p99 latency.
+
+    python -m benchmarks.load_test --requests 200 --concurrency 20 --llm-latency 0.5
+    python -m benchmarks.load_test --url http://localhost:8000 --requests 200
+
+Without ``--url`` the FastAPI app is served in-process through httpx's ASGI
+transport with ``LLMClient.llm`` replaced by a local stub of fixed latency, so
+the numbers measure this service (embedding, search, scheduling) rather than Groq.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import httpx
+from benchmarks.stubs import StubChatModel
+
+QUESTIONS = [
+    "How to calibrate X-axis encoder?",
+    "What is the torque for the spindle bolts?",
+    "How do I reset alarm E-4071?",
+    "Which coolant concentrate is approved?",
+    "How often should the spindle bearings be greased?",
+]
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def latency_summary(latencies_ms) -> dict:
+    values = sorted(latencies_ms)
+    return {
+        "p50_ms": round(percentile(values, 50), 1),
+        "p95_ms": round(percentile(values, 95), 1),
+        "p99_ms": round(percentile(values, 99), 1),
+        "max_ms": round(values[-1], 1) if values else 0.0,
+    }
+
+async def run_load(client: httpx.AsyncClient, num_requests: int, concurrency: int, top_k: int, questions=QUESTIONS) -> dict:
+    latencies, statuses = [], {}
+    queue = asyncio.Queue()
+    for i in range(num_requests):
+        queue.put_nowait(questions[i % len(questions)])
+
+    async def worker():
+        while True:
+            try:
+                question = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                resp = await client.post("/query", json={"question": question, "top_k": top_k})
+                status = resp.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": num_requests,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_sec": round(num_requests / elapsed, 2),
+        "statuses": {str(k): v for k, v in statuses.items()},
+        **latency_summary(latencies),
+    }
+
+def in_process_client(llm_latency: float) -> httpx.AsyncClient:
+    import main
+    main.llm_client.llm = StubChatModel(latency=llm_latency)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=300)
+
+async def _main(args) -> dict:
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=300)
+    else:
+        client = in_process_client(args.llm_latency)
+    async with client:
+        result = await run_load(client, args.requests, args.concurrency, args.top_k)
+    result["target"] = args.url or "in-process (stub LLM)"
+    if not args.url:
+        result["llm_latency_s"] = args.llm_latency
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="hit a running server instead of the in-process app")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="stub LLM latency in seconds")
+    parser.add_argument("--out", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+    result = asyncio.run(_main(args))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Deterministic local stand-ins for remote services used by the benchmarks and tests."""
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from benchmarks.corpus import page_markdown
+
+class StubChatModel:
+    """Replaces ``LLMClient.llm`` (ChatGroq): fixed latency, deterministic answer."""
+
+    def __init__(self, latency: float = 0.2, token_latency: float = 0.01):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.calls = 0
+        self.streams_closed = 0
+        self.tokens_sent = 0
+
+    def _answer(self, prompt: str):
+        self.calls += 1
+        question = prompt.rsplit("Question:", 1)[-1].strip()
+        return SimpleNamespace(content=f"Stub answer to: {question}")
+
+    def invoke(self, prompt: str, **kwargs):
+        time.sleep(self.latency)
+        return self._answer(prompt)
+
+    async def ainvoke(self, prompt: str, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._answer(prompt)
+
+    async def astream(self, prompt: str, **kwargs):
+        """First token after ``latency``, then one word every ``token_latency`` seconds."""
+        words = self._answer(prompt).content.split(" ")
+        try:
+            await asyncio.sleep(self.latency)
+            for i, word in enumerate(words):
+                if i:
+                    await asyncio.sleep(self.token_latency)
+                self.tokens_sent += 1
+                yield SimpleNamespace(content=word if i == 0 else " " + word)
+        finally:
+            self.streams_closed += 1
+
+class StubOCRClient:
+    """Replaces ``pdf_ingest.client`` (Mistral): ``client.ocr.process`` returns synthetic markdown pages.
+
+    The page count comes from the PDF itself; the text from its ``/BenchSeed``
+    metadata (see ``benchmarks.corpus``), or from a hash of the bytes for other
+    PDFs. Each call sleeps ``latency`` plus ``page_latency`` per page.
+    """
+
+    def __init__(self, latency: float = 0.5, page_latency: float = 0.0):
+        self.latency = latency
+        self.page_latency = page_latency
+        self.ocr = self
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def process(self, model: str, document: dict, **kwargs):
+        from pypdf import PdfReader
+        data = base64.b64decode(document["document_url"].split(",", 1)[1])
+        reader = PdfReader(io.BytesIO(data))
+        seed = (reader.metadata or {}).get("/BenchSeed") or hashlib.sha256(data).hexdigest()[:16]
+        num_pages = len(reader.pages)
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency + self.page_latency * num_pages)
+        return SimpleNamespace(pages=[SimpleNamespace(index=i, markdown=page_markdown(seed, i)) for i in range(num_pages)])
+
+class StubLLMServer:
+    """Local OpenAI/Groq-compatible chat completions server for ``GROQ_API_BASE``.
+
+    Serves ``POST .../chat/completions`` (plain and ``stream``) after ``latency``
+    seconds with a deterministic answer, over HTTP/1.1 keep-alive. Counts
+    ``requests``, accepted ``connections`` (pool reuse) and ``peak_in_flight``
+    (upstream concurrency). Use as a context manager; ``url`` is the base URL.
+    """
+
+    def __init__(self, latency: float = 0.2, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.requests = self.connections = self.in_flight = self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                with stub._lock:
+                    stub.requests += 1
+                    stub.in_flight += 1
+                    stub.peak_in_flight = max(stub.peak_in_flight, stub.in_flight)
+                try:
+                    time.sleep(stub.latency)
+                    question = (body.get("messages") or [{}])[-1].get("content", "").rsplit("Question:", 1)[-1].strip()
+                    self._reply(body, f"Stub answer to: {question}")
+                finally:
+                    with stub._lock:
+                        stub.in_flight -= 1
+
+            def _reply(self, body: dict, answer: str):
+                base = {"id": "stub", "created": int(time.time()), "model": body.get("model", "stub")}
+                if body.get("stream"):
+                    events = [dict(base, object="chat.completion.chunk",
+                                   choices=[{"index": 0, "delta": {"role": "assistant", "content": answer}, "finish_reason": None}]),
+                              dict(base, object="chat.completion.chunk", choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])]
+                    payload = "".join(f"data: {json.dumps(e)}\n\n" for e in events).encode() + b"data: [DONE]\n\n"
+                    content_type = "text/event-stream"
+                else:
+                    tokens = len(answer.split())
+                    payload = json.dumps(dict(base, object="chat.completion",
+                                              choices=[{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                                              usage={"prompt_tokens": 0, "completion_tokens": tokens, "total_tokens": tokens})).encode()
+                    content_type = "application/json"
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
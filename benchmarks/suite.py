@@ -0,0 +1,155 @@
+"""End-to-end offline benchmark: ingest, embedding, index size, /query load and memory, as JSON.
+
+    python -m benchmarks.suite --docs 20 --pages 10 --ocr-latency 0.2 --llm-latency 0.5 --out bench.json
+
+Everything runs in a scratch directory against a synthetic corpus
+(``benchmarks.corpus``) with ``pdf_ingest.client`` and ``LLMClient.llm``
+replaced by local stubs of fixed latency, so no Mistral, Groq or Redis is
+needed and two commits can be compared by diffing their JSON. The embedding
+model and Chroma are the real ones: they are what is being measured.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.corpus import generate_corpus
+from benchmarks.load_test import run_load
+from benchmarks.stubs import StubChatModel, StubOCRClient
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def configure_env(workdir: str) -> None:
+    """Point every data path into ``workdir``; must run before the service modules are imported."""
+    os.environ["DOCS_RAW_DIR"] = os.path.join(workdir, "raw")
+    os.environ["DOCS_PROCESSED_DIR"] = os.path.join(workdir, "processed")
+    os.environ["CHROMA_DB_PATH"] = os.path.join(workdir, "chroma")
+    os.environ["ANSWER_CACHE_ENABLED"] = "false"
+    os.environ["STARTUP_MODE"] = "eager"
+    os.environ["OCR_RATE_LIMIT"] = "0"
+    os.environ.setdefault("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def run(args, workdir: str) -> dict:
+    configure_env(workdir)
+    corpus, corpus_s = timed(lambda: generate_corpus(os.environ["DOCS_RAW_DIR"], args.docs, args.pages, args.seed))
+
+    import_start = time.perf_counter()
+    import main
+    import pdf_ingest
+    import_s = time.perf_counter() - import_start
+    ocr_client = StubOCRClient(latency=args.ocr_latency, page_latency=args.ocr_page_latency)
+    pdf_ingest.client = ocr_client
+    main.llm_client.llm = StubChatModel(latency=args.llm_latency)
+
+    pages, ocr_s = timed(lambda: list(pdf_ingest.iter_ingest(os.environ["DOCS_RAW_DIR"])))
+    chunks, chunk_s = timed(lambda: list(main.get_chunker().chunk_records(pages)))
+    (_, embedded), embed_s = timed(lambda: main.build_generation(lambda embedder: embedder.embed_stream(iter(chunks))))
+    main.index_watcher.check()
+    # A second sync over the unchanged corpus: generation copy, OCR cache hits and no re-embedding
+    resync, resync_s = timed(lambda: main.run_index_job((), True, lambda message: None))
+
+    async def load():
+        import httpx
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=300) as client:
+            return await run_load(client, args.requests, args.concurrency, args.top_k, corpus["questions"])
+
+    load_result = asyncio.run(load())
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "params": {k: v for k, v in vars(args).items() if k not in ("out", "workdir", "keep")},
+        },
+        "corpus": {"docs": len(corpus["files"]), "pages": corpus["pages"], "pdf_bytes": corpus["bytes"],
+                   "generate_s": round(corpus_s, 3)},
+        "startup": {"import_s": round(import_s, 3), **main.startup_state},
+        "ingest": {
+            "pages": len(pages),
+            "ocr_calls": ocr_client.calls,
+            "ocr_s": round(ocr_s, 3),
+            "pages_per_sec": round(len(pages) / ocr_s, 1) if ocr_s else None,
+            "chunks": len(chunks),
+            "chunk_s": round(chunk_s, 3),
+            "chunks_per_sec_chunking": round(len(chunks) / chunk_s, 1) if chunk_s else None,
+        },
+        "embedding": {
+            **embedded,
+            "embed_s": round(embed_s, 3),
+            "chunks_per_sec": round(embedded["added"] / embed_s, 1) if embed_s else None,
+            "resync_unchanged_s": round(resync_s, 3),
+            "resync": resync,
+        },
+        "index": {
+            "chunks": main.retriever.chunk_count(),
+            "index_version": main.retriever.generation,
+            "chroma_bytes": dir_size(os.environ["CHROMA_DB_PATH"]),
+            "ocr_cache_bytes": dir_size(os.environ["DOCS_PROCESSED_DIR"]),
+        },
+        "query": dict(load_result, llm_latency_s=args.llm_latency,
+                      coalescing=main.query_flights.stats() if main.query_flights is not None else None,
+                      llm_upstream_peak=main.llm_client.peak_in_flight),
+        "memory": {"peak_rss_mb": peak_rss_mb()},
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=10, help="pages per document")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--ocr-latency", type=float, default=0.2, help="stub OCR latency per request (s)")
+    parser.add_argument("--ocr-page-latency", type=float, default=0.0, help="extra stub OCR latency per page (s)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="stub LLM latency (s)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--workdir", help="scratch directory (default: a new temp dir)")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    parser.add_argument("--out", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="docassist-bench-")
+    try:
+        results = run(args, workdir)
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
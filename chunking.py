@@ -0,0 +1,209 @@
+import os
+import re
+from typing import Dict, Iterable, Iterator, List, Tuple
+from dotenv import load_dotenv
+import structlog
+from utils import attach_metadata
+
+load_dotenv()
+logger = structlog.get_logger()
+
+# Fallback token pattern when no HF tokenizer is available: words, numbers and
+# single punctuation marks, roughly one WordPiece token each.
+APPROX_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+HEADING_RE = re.compile(r"^#{1,6}\s")
+TABLE_ROW_RE = re.compile(r"^\s*\|")
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+_tokenizers = {}
+
+def get_tokenizer(model_name: str = None):
+    """Load (once) the fast tokenizer of the embedding model, or None if transformers is missing."""
+    model_name = model_name or os.environ.get("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    if model_name not in _tokenizers:
+        try:
+            from transformers import AutoTokenizer
+            _tokenizers[model_name] = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+        except Exception as e:
+            logger.warning("Tokenizer unavailable, using approximate token counts", model=model_name, error=str(e))
+            _tokenizers[model_name] = None
+    return _tokenizers[model_name]
+
+class Chunker:
+    """Token-aware markdown chunker for OCR pages.
+
+    Pages are split into blocks (paragraphs, whole tables, headings). Headings
+    stay attached to the content that follows them and every chunk that starts
+    inside a section is prefixed with that section's heading. Blocks are packed
+    into chunks of at most ``chunk_size`` tokens with ``overlap`` tokens of
+    trailing context carried into the next chunk. Oversized tables are split by
+    rows (repeating the header), other oversized blocks by sentences or token
+    windows.
+    """
+
+    def __init__(self, chunk_size: int = None, overlap: int = None, tokenizer="auto"):
+        self.chunk_size = chunk_size or int(os.environ.get("CHUNK_SIZE", 250))
+        self.overlap = overlap if overlap is not None else int(os.environ.get("CHUNK_OVERLAP", 32))
+        if self.overlap >= self.chunk_size:
+            raise ValueError("CHUNK_OVERLAP must be smaller than CHUNK_SIZE")
+        self.tokenizer = get_tokenizer() if tokenizer == "auto" else tokenizer
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        if self.tokenizer is None:
+            return [len(APPROX_TOKEN_RE.findall(t)) for t in texts]
+        encoded = self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+
+    def token_spans(self, text: str) -> List[Tuple[int, int]]:
+        if self.tokenizer is None:
+            return [m.span() for m in APPROX_TOKEN_RE.finditer(text)]
+        return self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+
+    def _blocks(self, text: str) -> List[Dict]:
+        """Split markdown into blocks with char offsets: tables, headings and paragraphs."""
+        blocks = []
+        lines = text.splitlines(keepends=True)
+        pos = 0
+        current = None
+        for line in lines:
+            start, pos = pos, pos + len(line)
+            stripped = line.strip()
+            kind = "table" if TABLE_ROW_RE.match(line) else "heading" if HEADING_RE.match(stripped) else "text"
+            if not stripped:
+                current = None
+                continue
+            if current is not None and kind == current["kind"] and kind != "heading":
+                current["end"] = pos
+                continue
+            current = {"kind": kind, "start": start, "end": pos}
+            blocks.append(current)
+        for block in blocks:
+            block["text"] = text[block["start"]:block["end"]].strip()
+        return blocks
+
+    def _split_oversized(self, text: str, block: Dict, limit: int) -> List[Dict]:
+        """Break one block over ``limit`` tokens into pieces that fit."""
+        if block["kind"] == "table":
+            rows = []
+            row_start = block["start"]
+            for line in text[block["start"]:block["end"]].splitlines(keepends=True):
+                if line.strip():
+                    rows.append({"start": row_start, "end": row_start + len(line), "text": line.strip()})
+                row_start += len(line)
+            if len(rows) > 2:
+                # Header row + separator row are repeated on every piece
+                header = rows[0]["text"] + "\n" + rows[1]["text"]
+                counts = self.count_tokens([header] + [r["text"] for r in rows[2:]])
+                budget = limit - counts[0]
+                if budget > 0 and max(counts[1:]) <= budget:
+                    pieces, group, used = [], [], 0
+                    for row, n in zip(rows[2:], counts[1:]):
+                        if group and used + n > budget:
+                            pieces.append(group)
+                            group, used = [], 0
+                        group.append(row)
+                        used += n
+                    pieces.append(group)
+                    return [{"kind": "table", "start": g[0]["start"], "end": g[-1]["end"],
+                             "text": header + "\n" + "\n".join(r["text"] for r in g)} for g in pieces]
+        # Sentences first, then hard token windows for anything still too long
+        pieces = []
+        body = text[block["start"]:block["end"]]
+        bounds = [0] + [m.end() for m in SENTENCE_END_RE.finditer(body)] + [len(body)]
+        sentences = [(block["start"] + s, block["start"] + e) for s, e in zip(bounds, bounds[1:]) if body[s:e].strip()]
+        counts = self.count_tokens([text[s:e] for s, e in sentences])
+        for (s, e), n in zip(sentences, counts):
+            if n <= limit:
+                pieces.append({"kind": "text", "start": s, "end": e, "text": text[s:e].strip()})
+                continue
+            spans = self.token_spans(text[s:e])
+            step = max(limit - self.overlap, 1)
+            for i in range(0, len(spans), step):
+                window = spans[i:i + limit]
+                ws, we = s + window[0][0], s + window[-1][1]
+                pieces.append({"kind": "text", "start": ws, "end": we, "text": text[ws:we].strip()})
+                if i + limit >= len(spans):
+                    break
+        return pieces
+
+    def split(self, text: str) -> List[Dict]:
+        """Return [{"text", "start", "end"}] chunks for one page of markdown."""
+        blocks = self._blocks(text)
+        if not blocks:
+            return []
+        counts = self.count_tokens([b["text"] for b in blocks])
+        heading_tokens = {}
+        units = []
+        heading = None
+        for block, n in zip(blocks, counts):
+            if block["kind"] == "heading" and n <= self.chunk_size // 2:
+                block["heading"] = None
+                heading = block
+                heading_tokens[id(block)] = n
+                block["tokens"] = n
+                units.append(block)
+                continue
+            block["heading"] = heading
+            # Leave room for the heading prefix a chunk may carry
+            limit = self.chunk_size - (heading_tokens[id(heading)] if heading is not None else 0)
+            if n > limit:
+                pieces = self._split_oversized(text, block, limit)
+                for piece, m in zip(pieces, self.count_tokens([p["text"] for p in pieces])):
+                    piece["heading"] = heading
+                    piece["tokens"] = m
+                    units.append(piece)
+            else:
+                block["tokens"] = n
+                units.append(block)
+
+        def cost(group):
+            total = sum(u["tokens"] for u in group)
+            first = group[0] if group else None
+            if first is not None and first["heading"] is not None:
+                total += heading_tokens[id(first["heading"])]
+            return total
+
+        chunks = []
+
+        def emit(group, keep_headings=False):
+            if not group or (not keep_headings and all(u["kind"] == "heading" for u in group)):
+                return
+            parts = [u["text"] for u in group]
+            if group[0]["heading"] is not None:
+                parts.insert(0, group[0]["heading"]["text"])
+            chunks.append({"text": "\n\n".join(parts), "start": group[0]["start"], "end": group[-1]["end"]})
+
+        current = []
+        for unit in units:
+            if current and cost(current + [unit]) > self.chunk_size:
+                # Never end a chunk on a heading: it moves to the next chunk with its content
+                carried = []
+                while current and current[-1]["kind"] == "heading":
+                    carried.insert(0, current.pop())
+                # Only carry headings that still fit in front of the unit; the rest close this chunk
+                while carried and cost(carried + [unit]) > self.chunk_size:
+                    current.append(carried.pop(0))
+                emit(current, keep_headings=True)
+                if carried:
+                    current = carried
+                else:
+                    # Overlap: trailing blocks of the same section, up to ``overlap`` tokens
+                    tail, tail_tokens = [], 0
+                    for prev in reversed(current):
+                        if prev["kind"] == "heading" or prev["heading"] is not unit["heading"] or tail_tokens + prev["tokens"] > self.overlap:
+                            break
+                        tail.insert(0, prev)
+                        tail_tokens += prev["tokens"]
+                    current = tail if cost(tail + [unit]) <= self.chunk_size else []
+            current.append(unit)
+        emit(current)
+        return chunks
+
+    def chunk_records(self, records: Iterable[Dict]) -> Iterator[Dict]:
+        """Turn page records ({"text", "doc_id", "page"}) into chunk records, lazily."""
+        for record in records:
+            for chunk in self.split(record["text"]):
+                yield attach_metadata(chunk["text"], record["doc_id"], record["page"],
+                                      start_offset=chunk["start"], end_offset=chunk["end"])
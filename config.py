@@ -13,10 +13,73 @@ class Settings:
     GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
     GROQ_API_KEY = os.getenv("GROQ_API_KEY")
     GROQ_MODEL = os.getenv("GROQ_MODEL", "llama3-8b-8192")
+    # Base URL for the Groq SDK (unset = api.groq.com); point at a local stub server for load tests
+    GROQ_API_BASE = os.getenv("GROQ_API_BASE")
+    # Shared HTTP pool to Groq: size, keep-alive and timeouts (seconds)
+    GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", 32))
+    GROQ_MAX_KEEPALIVE = int(os.getenv("GROQ_MAX_KEEPALIVE", 16))
+    GROQ_KEEPALIVE_EXPIRY = float(os.getenv("GROQ_KEEPALIVE_EXPIRY", 30))
+    GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", 60))
+    GROQ_CONNECT_TIMEOUT = float(os.getenv("GROQ_CONNECT_TIMEOUT", 5))
+    GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", 2))
+    MISTRAL_OCR_MODEL = os.getenv("MISTRAL_OCR_MODEL", "mistral-ocr-latest")
+    OCR_SEGMENT_THRESHOLD_MB = float(os.getenv("OCR_SEGMENT_THRESHOLD_MB", 32))
+    OCR_SEGMENT_PAGES = int(os.getenv("OCR_SEGMENT_PAGES", 25))
+    # Local text-layer fast path: pages passing these checks skip remote OCR
+    LOCAL_TEXT_ENABLED = os.getenv("LOCAL_TEXT_ENABLED", "true").lower() == "true"
+    LOCAL_TEXT_MIN_CHARS = int(os.getenv("LOCAL_TEXT_MIN_CHARS", 100))
+    LOCAL_TEXT_MAX_GARBAGE = float(os.getenv("LOCAL_TEXT_MAX_GARBAGE", 0.05))
+    OCR_WORKERS = int(os.getenv("OCR_WORKERS", 4))
+    OCR_RATE_LIMIT = float(os.getenv("OCR_RATE_LIMIT", 2.0))
+    OCR_MAX_RETRIES = int(os.getenv("OCR_MAX_RETRIES", 3))
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 3600))
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 10000))
+    ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
     PROMETHEUS_PORT = int(os.getenv("PROMETHEUS_PORT", 8001))
+    METRICS_SERVER_ENABLED = os.getenv("METRICS_SERVER_ENABLED", "false").lower() == "true"
+    PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
     SENTRY_DSN = os.getenv("SENTRY_DSN", "")
     CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",")
-    CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 512))
+    # Tokens per chunk; all-MiniLM-L6-v2 truncates input at 256 word pieces
+    CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 250))
+    CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 32))
+    EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 256))
+    # "torch" (sentence-transformers) or "onnx" (onnxruntime, int8 by default)
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+    ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "models/onnx")
+    ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "true").lower() == "true"
+    ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", 0))
+    ONNX_BATCH_SIZE = int(os.getenv("ONNX_BATCH_SIZE", 64))
+    ONNX_MAX_BATCH_TOKENS = int(os.getenv("ONNX_MAX_BATCH_TOKENS", 8192))
+    # Query-embedding LRU shared by all retrievers of one model (0 bytes = no byte limit)
+    QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", 2048))
+    QUERY_EMBED_CACHE_MAX_BYTES = int(os.getenv("QUERY_EMBED_CACHE_MAX_BYTES", 0))
+    # On-disk chunk vector cache keyed by (model, text hash); reused across rebuilds and generations
+    VECTOR_CACHE_ENABLED = os.getenv("VECTOR_CACHE_ENABLED", "true").lower() == "true"
+    VECTOR_CACHE_DIR = os.getenv("VECTOR_CACHE_DIR", os.path.join(DOCS_PROCESSED_DIR, "vector_cache"))
+    VECTOR_CACHE_DTYPE = os.getenv("VECTOR_CACHE_DTYPE", "float32")
+    # Async /query path: per-stage concurrency limits and timeouts (seconds)
+    QUERY_EMBED_CONCURRENCY = int(os.getenv("QUERY_EMBED_CONCURRENCY", 4))
+    QUERY_SEARCH_CONCURRENCY = int(os.getenv("QUERY_SEARCH_CONCURRENCY", 8))
+    QUERY_LLM_CONCURRENCY = int(os.getenv("QUERY_LLM_CONCURRENCY", 32))
+    QUERY_EMBED_TIMEOUT = float(os.getenv("QUERY_EMBED_TIMEOUT", 10))
+    QUERY_SEARCH_TIMEOUT = float(os.getenv("QUERY_SEARCH_TIMEOUT", 10))
+    QUERY_LLM_TIMEOUT = float(os.getenv("QUERY_LLM_TIMEOUT", 60))
+    INDEX_COALESCE_WINDOW = float(os.getenv("INDEX_COALESCE_WINDOW", 2.0))
+    # Index generations: pointer poll interval, reader lease lifetime and how long a replaced generation stays leased (seconds)
+    INDEX_POLL_INTERVAL = float(os.getenv("INDEX_POLL_INTERVAL", 2.0))
+    INDEX_LEASE_TTL = float(os.getenv("INDEX_LEASE_TTL", 120))
+    INDEX_RETIRE_GRACE = float(os.getenv("INDEX_RETIRE_GRACE", 30))
+    # Concurrent identical /query requests (question, top_k, index version) share one retrieval + LLM call
+    QUERY_COALESCING_ENABLED = os.getenv("QUERY_COALESCING_ENABLED", "true").lower() == "true"
+    QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", 256))
+    QUERY_BATCH_LLM_CONCURRENCY = int(os.getenv("QUERY_BATCH_LLM_CONCURRENCY", 8))
+    # Prompt context: approximate token budget and near-duplicate (Jaccard) threshold
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+    CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", 0.8))
+    # "eager": load models at import; "fast": serve /healthz at once, load and warm up in the background
+    STARTUP_MODE = os.getenv("STARTUP_MODE", "eager")
     TOP_K = int(os.getenv("TOP_K", 5))
     ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "admin_secret")
 
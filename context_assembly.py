@@ -0,0 +1,75 @@
+import os
+import re
+from typing import Dict, List, Tuple
+from dotenv import load_dotenv
+import structlog
+from chunking import APPROX_TOKEN_RE
+
+load_dotenv()
+logger = structlog.get_logger()
+
+WORD_RE = re.compile(r"\w+")
+
+def count_tokens(text: str) -> int:
+    """Approximate LLM token count (words, numbers and punctuation marks)."""
+    return len(APPROX_TOKEN_RE.findall(text))
+
+def _shingles(text: str, n: int = 3) -> set:
+    words = WORD_RE.findall(text.lower())
+    if len(words) < n:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+def _is_boilerplate_candidate(line: str) -> bool:
+    # Table rows and headings repeat on purpose (split tables, section prefixes)
+    return len(line) >= 40 and not line.startswith("|") and not line.startswith("#")
+
+class ContextAssembler:
+    """Turn retrieved chunks into a compact, citable prompt context.
+
+    Chunks are ordered by score, long lines already seen in a higher-ranked
+    chunk (page headers, safety boilerplate) are removed, chunks whose word
+    3-shingles overlap a kept chunk by ``dedup_threshold`` (Jaccard) are
+    dropped, and the rest are tagged ``[doc_id p.N]`` and packed until
+    ``token_budget`` approximate tokens are used.
+    """
+
+    def __init__(self, token_budget: int = None, dedup_threshold: float = None):
+        self.token_budget = token_budget or int(os.environ.get("CONTEXT_TOKEN_BUDGET", 3000))
+        self.dedup_threshold = dedup_threshold if dedup_threshold is not None else float(os.environ.get("CONTEXT_DEDUP_THRESHOLD", 0.8))
+
+    def assemble(self, docs: List[Dict]) -> Tuple[List[str], Dict]:
+        """Return (tagged context strings, stats) for result dicts with content/source/page/score."""
+        ordered = sorted(docs, key=lambda d: -(d.get("score") or 0.0))
+        seen_lines, kept_shingles, context = set(), [], []
+        used = duplicates = over_budget = 0
+        for doc in ordered:
+            lines = []
+            for line in doc["content"].splitlines():
+                key = " ".join(line.split()).lower()
+                if _is_boilerplate_candidate(key):
+                    if key in seen_lines:
+                        continue
+                    seen_lines.add(key)
+                lines.append(line)
+            text = "\n".join(lines).strip()
+            shingles = _shingles(text)
+            if not shingles or any(len(shingles & other) / len(shingles | other) >= self.dedup_threshold for other in kept_shingles):
+                duplicates += 1
+                continue
+            tagged = f"[{doc.get('source') or 'unknown'} p.{doc.get('page')}]\n{text}"
+            n = count_tokens(tagged)
+            if used + n > self.token_budget:
+                if context:
+                    over_budget += 1
+                    continue
+                # The best chunk alone is over budget: keep its head rather than nothing
+                spans = [m.span() for m in APPROX_TOKEN_RE.finditer(tagged)]
+                tagged = tagged[:spans[self.token_budget - 1][1]]
+                n = self.token_budget
+            kept_shingles.append(shingles)
+            context.append(tagged)
+            used += n
+        stats = {"chunks_in": len(docs), "chunks_kept": len(context), "duplicates_dropped": duplicates,
+                 "over_budget_dropped": over_budget, "context_tokens": used}
+        return context, stats
@@ -0,0 +1,96 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, List
+import numpy as np
+from dotenv import load_dotenv
+import structlog
+import metrics
+
+load_dotenv()
+logger = structlog.get_logger()
+
+def normalize_query(text: str) -> str:
+    """Whitespace and case differences map to one cache key (the default model is uncased)."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+class QueryEmbeddingCache:
+    """Bounded LRU of normalized question -> float32 query embedding.
+
+    Capped at ``max_entries`` vectors and, if ``max_bytes`` is set, at that many
+    bytes of vector data. One instance exists per embedding model (see
+    ``model_registry.get_query_embedding_cache``), so hot-swapped retrievers
+    share it and it is only dropped when the model changes.
+    """
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None):
+        self.max_entries = max_entries if max_entries is not None else int(os.environ.get("QUERY_EMBED_CACHE_SIZE", 2048))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.environ.get("QUERY_EMBED_CACHE_MAX_BYTES", 0))
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counts = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _lookup(self, key: str):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+            self.counts["hits" if vector is not None else "misses"] += 1
+            ratio = self.counts["hits"] / (self.counts["hits"] + self.counts["misses"])
+        metrics.observe_cache("query_embedding", "hit" if vector is not None else "miss", ratio)
+        return vector
+
+    def _store(self, key: str, vector: np.ndarray) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = vector
+            self._bytes += vector.nbytes
+            while self._entries and (len(self._entries) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes)):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.counts["evictions"] += 1
+
+    def get_or_embed(self, text: str, embed: Callable[[str], List[float]]) -> List[float]:
+        key = normalize_query(text)
+        vector = self._lookup(key)
+        if vector is None:
+            vector = np.asarray(embed(text), dtype=np.float32)
+            self._store(key, vector)
+        return vector.tolist()
+
+    def get_or_embed_many(self, texts: List[str], embed_many: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+        """Batch variant: only texts not cached (deduplicated) are passed to ``embed_many``."""
+        keys = [normalize_query(t) for t in texts]
+        vectors = [self._lookup(k) for k in keys]
+        missing = {}
+        for text, key, vector in zip(texts, keys, vectors):
+            if vector is None and key not in missing:
+                missing[key] = text
+        if missing:
+            fresh = dict(zip(missing, (np.asarray(v, dtype=np.float32) for v in embed_many(list(missing.values())))))
+            for key, vector in fresh.items():
+                self._store(key, vector)
+            vectors = [fresh[k] if v is None else v for k, v in zip(keys, vectors)]
+        return [v.tolist() for v in vectors]
+
+    def hit_ratio(self) -> float:
+        with self._lock:
+            lookups = self.counts["hits"] + self.counts["misses"]
+            return round(self.counts["hits"] / lookups, 4) if lookups else 0.0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        ratio = self.hit_ratio()
+        with self._lock:
+            return dict(self.counts, entries=len(self._entries), bytes=self._bytes, hit_ratio=ratio,
+                        max_entries=self.max_entries, max_bytes=self.max_bytes)
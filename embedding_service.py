@@ -1,10 +1,14 @@
 import os
-from langchain_huggingface import HuggingFaceEmbeddings
-from transformers import pipeline
-from langchain_chroma import Chroma
 from dotenv import load_dotenv
 import structlog
+from model_registry import get_embeddings, get_vector_cache, get_vector_store
+from vector_cache import CachedEmbeddings, text_key
+from lexical_index import get_lexical_index
+import metrics
 import json
+import hashlib
+import time
+from collections import defaultdict
 
 load_dotenv()
 logger = structlog.get_logger()
@@ -29,33 +33,215 @@ def clean_metadata(meta):
                 continue
     return clean
 
+# Chroma rejects very large upserts, so writes are split into batches
+WRITE_BATCH_SIZE = 1000
+# Texts embedded and committed per batch while streaming
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 256))
+
+def chunk_id(doc_id, page, ordinal: int, text: str) -> str:
+    """Deterministic chunk id: the same text at the same position always maps to the same id."""
+    content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+    return f"{doc_id}:{page}:{ordinal}:{content_hash}"
+
+def iter_chunk_ids(documents):
+    """Yield (chunk id, document) pairs; ordinals count chunks per (doc_id, page) in stream order."""
+    ordinals = defaultdict(int)
+    for doc in documents:
+        key = (doc.get("doc_id"), doc.get("page"))
+        yield chunk_id(key[0], key[1], ordinals[key], doc["text"]), doc
+        ordinals[key] += 1
+
+def is_chunk_id(value: str) -> bool:
+    return len(value.rsplit(":", 3)) == 4
+
+def upsert_vectors(store, ids: list, vectors: list, texts: list, metadatas: list) -> None:
+    """Write chunks with precomputed vectors into a langchain Chroma store.
+
+    langchain_chroma only exposes writes that re-encode the texts (add_texts),
+    so this is the single place that goes through the underlying collection.
+    """
+    store._collection.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+
 class Embedder:
-    def __init__(self):
+    def __init__(self, chroma_db_path: str = None):
         model_name = os.environ["EMBEDDING_MODEL"]
-        self.embeddings = HuggingFaceEmbeddings(model_name=model_name, model_kwargs={"device": "cpu"})
-        self.chroma_db_path = os.environ["CHROMA_DB_PATH"]
+        # Model weights and the Chroma handle are shared process-wide
+        self.embeddings = get_embeddings(model_name)
+        # Vectors already computed for identical text (any generation, any earlier rebuild) are reused
+        self.vector_cache = get_vector_cache(model_name)
+        self.cached_embeddings = CachedEmbeddings(self.embeddings, self.vector_cache) if self.vector_cache is not None else None
+        # An index generation directory when driven by the index writer (see index_generations)
+        self.chroma_db_path = chroma_db_path or os.environ["CHROMA_DB_PATH"]
         self.collection_name = "docs"
-        self.chroma = Chroma(
-            persist_directory=self.chroma_db_path,
-            collection_name=self.collection_name,
-            embedding_function=self.embeddings
-        )
-
-    def embed_and_store(self, documents):
-        texts = [doc['text'] for doc in documents]
+        self.chroma = get_vector_store(self.chroma_db_path, self.collection_name, model_name)
+        self.manifest_path = os.path.join(self.chroma_db_path, "index_manifest.json")
+        # BM25 index over the same chunk ids, kept in step with every write and delete
+        self.lexical = get_lexical_index(os.path.join(self.chroma_db_path, "lexical_index.pkl"))
+        self.manifest = self._load_manifest()
+        if len(self.lexical) != self.chunk_count():
+            self._rebuild_lexical()
+
+    def _load_manifest(self) -> dict:
+        """Return {doc_id: [chunk ids]} describing what the collection holds."""
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)["docs"]
+        except FileNotFoundError:
+            return self._bootstrap_manifest()
+        except Exception as e:
+            logger.warning("Index manifest unreadable, rebuilding from collection", error=str(e))
+            return self._bootstrap_manifest()
+
+    def _bootstrap_manifest(self) -> dict:
+        # Collections written before deterministic ids hold random ids and
+        # duplicate copies of the corpus; drop those so the next sync re-adds one copy.
+        stored = self.chroma.get(include=["metadatas"])
+        manifest = defaultdict(list)
+        legacy = []
+        for cid, meta in zip(stored["ids"], stored["metadatas"]):
+            if is_chunk_id(cid):
+                manifest[(meta or {}).get("doc_id") or cid.rsplit(":", 3)[0]].append(cid)
+            else:
+                legacy.append(cid)
+        if legacy:
+            logger.info("Removing legacy chunks without deterministic ids", num=len(legacy))
+            self._delete_ids(legacy)
+        manifest = dict(manifest)
+        self._save_manifest(manifest)
+        return manifest
+
+    def _save_manifest(self, manifest: dict = None) -> None:
+        os.makedirs(self.chroma_db_path, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"docs": self.manifest if manifest is None else manifest}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _rebuild_lexical(self) -> None:
+        """Rebuild the lexical index from stored chunk texts (missing, stale or pre-existing collection)."""
+        ids = [cid for cids in self.manifest.values() for cid in cids]
+        self.lexical.clear()
+        for i in range(0, len(ids), WRITE_BATCH_SIZE):
+            stored = self.chroma.get(ids=ids[i:i + WRITE_BATCH_SIZE], include=["documents"])
+            self.lexical.add(stored["ids"], stored["documents"])
+        self.lexical.save()
+        logger.info("Lexical index rebuilt from collection", chunks=len(self.lexical))
+
+    def _delete_ids(self, ids: list) -> None:
+        for i in range(0, len(ids), WRITE_BATCH_SIZE):
+            self.chroma.delete(ids=ids[i:i + WRITE_BATCH_SIZE])
+        self.lexical.remove(ids)
+
+    def _write_batch(self, batch: list) -> None:
+        texts = [doc['text'] for _, doc in batch]
         # Propagate all metadata fields except 'text', but clean for ChromaDB
-        metadatas = [clean_metadata({k: v for k, v in doc.items() if k != 'text'}) for doc in documents]
-        logger.info("Embedding sample metadata", sample=metadatas[:5])
+        metadatas = [clean_metadata({k: v for k, v in doc.items() if k != 'text'}) for _, doc in batch]
         # Extra debug: check for missing doc_ids
         missing = [i for i, m in enumerate(metadatas) if m.get("doc_id") in (None, "", "MISSING_DOC_ID")]
         if missing:
             logger.warning("Some docs missing doc_id in metadata", indices=missing, samples=[metadatas[i] for i in missing])
-        self.chroma.add_texts(texts, metadatas=metadatas)
-        logger.info("Embeddings stored via LangChain", num=len(texts))
+        ids = [cid for cid, _ in batch]
+        start = time.perf_counter()
+        if self.cached_embeddings is not None:
+            vectors = self.cached_embeddings.embed_documents(texts)
+            upsert_vectors(self.chroma, ids, vectors, texts, metadatas)
+        else:
+            self.chroma.add_texts(texts, metadatas=metadatas, ids=ids)
+        metrics.observe_embed_batch(len(batch), time.perf_counter() - start)
+        self.lexical.add(ids, texts)
+
+    def embed_stream(self, documents, batch_size: int = None, prune: bool = True, keep_doc_ids=(), on_batch=None) -> dict:
+        """Sync the collection with a stream of chunk records.
+
+        Records are consumed lazily; new chunks are embedded and committed every
+        ``batch_size`` records, so memory stays bounded and each batch is
+        searchable as soon as it is written. Chunks already stored under the
+        same deterministic id are skipped. With ``prune`` set, the stream is
+        treated as the full corpus and stored chunks it did not contain are
+        deleted, except those of ``keep_doc_ids`` (e.g. files whose OCR failed).
+        ``on_batch(added_so_far)`` is called after every committed batch.
+
+        With the vector cache on, ``batch_size`` counts texts that still need
+        encoding; chunks with cached vectors ride along, up to WRITE_BATCH_SIZE.
+        """
+        batch_size = min(batch_size or EMBED_BATCH_SIZE, WRITE_BATCH_SIZE)
+        stored = {cid for cids in self.manifest.values() for cid in cids}
+        seen = defaultdict(list)
+        batch = []
+        to_encode = added = unchanged = 0
+        cache_before = dict(self.vector_cache.counts) if self.vector_cache is not None else None
+        for cid, doc in iter_chunk_ids(documents):
+            seen[doc.get("doc_id")].append(cid)
+            if cid in stored:
+                unchanged += 1
+                continue
+            batch.append((cid, doc))
+            if self.vector_cache is None or text_key(doc["text"]) not in self.vector_cache:
+                to_encode += 1
+            if to_encode >= batch_size or len(batch) >= WRITE_BATCH_SIZE:
+                self._write_batch(batch)
+                added += len(batch)
+                logger.info("Embedded batch committed", batch=len(batch), encoded=to_encode, added=added)
+                if on_batch is not None:
+                    on_batch(added)
+                batch = []
+                to_encode = 0
+        if batch:
+            self._write_batch(batch)
+            added += len(batch)
+            if on_batch is not None:
+                on_batch(added)
+
+        manifest = dict(seen)
+        stale = []
+        for doc_id, cids in self.manifest.items():
+            if not prune or doc_id in keep_doc_ids:
+                # Keep stored chunks that the stream did not replace
+                current = set(manifest.get(doc_id, []))
+                manifest.setdefault(doc_id, []).extend(c for c in cids if c not in current)
+            else:
+                current = set(manifest.get(doc_id, []))
+                stale.extend(c for c in cids if c not in current)
+        self._delete_ids(stale)
+        self.manifest = manifest
+        self._save_manifest()
+        self.lexical.save()
+        stats = {"added": added, "deleted": len(stale), "unchanged": unchanged}
+        if self.vector_cache is not None:
+            hits = self.vector_cache.counts["hits"] - cache_before["hits"]
+            misses = self.vector_cache.counts["misses"] - cache_before["misses"]
+            stats["vector_cache"] = {"hits": hits, "misses": misses,
+                                     "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+                                     "disk_bytes": self.vector_cache.disk_bytes()}
+        logger.info("Embeddings synced via LangChain", **stats)
+        return stats
+
+    def embed_and_store(self, documents, prune: bool = True):
+        return self.embed_stream(documents, prune=prune)
+
+    def chunk_count(self) -> int:
+        return sum(len(cids) for cids in self.manifest.values())
+
+    def delete_document(self, doc_id: str) -> int:
+        """Remove every chunk of ``doc_id`` without touching the rest of the corpus."""
+        self.chroma.delete(where={"doc_id": doc_id})
+        ids = self.manifest.pop(doc_id, [])
+        self.lexical.remove(ids)
+        self._save_manifest()
+        self.lexical.save()
+        removed = len(ids)
+        logger.info("Deleted document chunks", doc_id=doc_id, num=removed)
+        return removed
 
 if __name__ == "__main__":
+    from index_generations import IndexGenerations
     chunks_path = os.path.join(os.environ["DOCS_PROCESSED_DIR"], "chunks.jsonl")
-    with open(chunks_path, "r", encoding="utf-8") as f:
-        documents = [json.loads(line) for line in f]
-    embedder = Embedder()
-    embedder.embed_and_store(documents)
+    generations = IndexGenerations()
+    # Write into a new generation so running workers keep serving theirs until it is published
+    with generations.writer_lock():
+        generation = generations.begin()
+        embedder = Embedder(generations.path(generation))
+        with open(chunks_path, "r", encoding="utf-8") as f:
+            # Stream line by line; chunks.jsonl may be a partial export, so don't prune
+            embedder.embed_stream((json.loads(line) for line in f if line.strip()), prune=False)
+        generations.publish(generation)
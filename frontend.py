@@ -54,7 +54,7 @@ def upload_document():
         files = {"file": (uploaded_file.name, uploaded_file, "application/pdf")}
         r = requests.post(f"{API_URL}/admin/upload", headers=get_headers(), files=files)
         if r.status_code == 200:
-            st.sidebar.success(f"Uploaded: {uploaded_file.name}")
+            st.sidebar.success(f"Uploaded: {uploaded_file.name} (indexing job {r.json().get('job_id', '')[:8]})")
             st.experimental_rerun()
         else:
             st.sidebar.error(f"Upload failed: {r.text}")
@@ -83,16 +83,39 @@ st.header("Ask a Manufacturing Question")
 question = st.text_input("Your question:")
 top_k = st.slider("Top-K Results", min_value=1, max_value=10, value=5)
 if st.button("Ask") and question:
-    with st.spinner("Retrieving answer..."):
-        resp = requests.post(f"{API_URL}/query", json={"question": question, "top_k": top_k})
-        if resp.status_code == 200:
-            data = resp.json()
-            st.markdown(f"### Answer\n{data['answer']}")
-            st.markdown("#### Sources:")
-            for s in data["sources"]:
-                st.write(f"- Source: `{s['source']}` — Score: {s['score']:.2f}")
-                # Optionally show a snippet of the content:
-                # st.caption(s['content'][:200] + "..." if len(s['content']) > 200 else s['content'])
-            st.caption(f"Latency: {data['latency_ms']} ms")
-        else:
+    import json
+    import sseclient
+    answer_box = st.empty()
+    sources_box = st.container()
+    caption_box = st.empty()
+    answer = ""
+    try:
+        with st.spinner("Retrieving answer..."):
+            # Tokens are rendered as they arrive from the streaming endpoint
+            resp = requests.post(f"{API_URL}/query/stream", json={"question": question, "top_k": top_k}, stream=True, timeout=300)
+        if resp.status_code != 200:
             st.error(f"Query failed: {resp.text}")
+        else:
+            for event in sseclient.SSEClient(resp).events():
+                if event.event == "sources":
+                    with sources_box:
+                        st.markdown("#### Sources:")
+                        for s in json.loads(event.data):
+                            st.write(f"- Source: `{s['source']}` (page {s.get('page')}) — Score: {s['score']:.2f}")
+                elif event.event == "token":
+                    answer += json.loads(event.data)
+                    answer_box.markdown(f"### Answer\n{answer}▌")
+                elif event.event == "done":
+                    answer_box.markdown(f"### Answer\n{answer}")
+                    timings = json.loads(event.data)
+                    caption_box.caption(
+                        f"Time to first token: {timings.get('ttft_ms', 0):.0f} ms · Total: {timings.get('total_ms', 0):.0f} ms"
+                        + (" · cached" if timings.get("cache") == "HIT" else "")
+                    )
+                    break
+                elif event.event == "error":
+                    st.error(f"Query failed: {event.data}")
+                    break
+            resp.close()
+    except Exception as e:
+        st.error(f"Query failed: {e}")
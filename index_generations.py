@@ -0,0 +1,325 @@
+import os
+import json
+import time
+import shutil
+import socket
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+from dotenv import load_dotenv
+import structlog
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: single-process deployments only
+    fcntl = None
+
+load_dotenv()
+logger = structlog.get_logger()
+
+POINTER_FILE = "CURRENT"
+GENERATIONS_DIR = "generations"
+LEASES_DIR = "leases"
+LOCK_FILE = "writer.lock"
+# Top-level entries of a pre-generations CHROMA_DB_PATH that are not index data
+_NOT_INDEX_DATA = {POINTER_FILE, GENERATIONS_DIR, LEASES_DIR, LOCK_FILE, "corpus_manifest.json"}
+
+def _clone_file(src: str, dst: str) -> str:
+    """copytree copy function using copy_file_range.
+
+    On reflink-capable filesystems (btrfs, XFS, overlay on those) the kernel
+    shares extents instead of copying, so copying a generation costs metadata
+    only. Elsewhere it is still an in-kernel copy. Falls back to shutil.copy2.
+    """
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        shutil.copystat(src, dst)
+        return dst
+    except (AttributeError, OSError):
+        # No copy_file_range (non-Linux, Python < 3.8) or unsupported across these filesystems
+        return shutil.copy2(src, dst)
+
+class IndexGenerations:
+    """Immutable, versioned index directories under ``CHROMA_DB_PATH``.
+
+    Layout::
+
+        CHROMA_DB_PATH/
+          CURRENT                  {"generation": "g000042", "published_at": ...}
+          generations/g000042/     Chroma files, index_manifest.json, lexical_index.pkl
+          leases/g000042.<host>-<pid>
+          writer.lock
+
+    A writer (holding ``writer.lock`` across processes) copies the current
+    generation into a new directory, applies its changes there and publishes
+    it by atomically replacing ``CURRENT``. Published generations are never
+    written again, so readers in any worker can keep using theirs until they
+    swap. Each reader holds a lease file it touches while it uses a generation;
+    older generations with no fresh lease are deleted.
+
+    Costs of this isolation: every build starts with a copy of the whole
+    current generation, even a one-document upload (see ``_clone_file``), and
+    batches committed during a build are only visible to queries once the
+    build is published, not as each batch lands.
+    """
+
+    def __init__(self, root: str = None, lease_ttl: float = None, owner: str = None):
+        self.root = os.path.abspath(root or os.environ["CHROMA_DB_PATH"])
+        self.lease_ttl = lease_ttl or float(os.environ.get("INDEX_LEASE_TTL", 120))
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}"
+        self._thread_lock = threading.Lock()
+
+    def path(self, generation: str) -> str:
+        return os.path.join(self.root, GENERATIONS_DIR, generation)
+
+    def current(self) -> Optional[str]:
+        """Name of the published generation, or None before the first publish."""
+        try:
+            with open(os.path.join(self.root, POINTER_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)["generation"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def current_path(self) -> str:
+        """Directory readers should open; pre-generations deployments keep using CHROMA_DB_PATH itself."""
+        generation = self.current()
+        return self.path(generation) if generation else self.root
+
+    def _generations(self) -> list:
+        try:
+            return sorted(d for d in os.listdir(os.path.join(self.root, GENERATIONS_DIR)) if d.startswith("g"))
+        except FileNotFoundError:
+            return []
+
+    @contextmanager
+    def writer_lock(self, blocking: bool = True):
+        """Cross-process writer lock; yields False when ``blocking`` is off and another writer holds it."""
+        os.makedirs(self.root, exist_ok=True)
+        if not self._thread_lock.acquire(blocking):
+            yield False
+            return
+        try:
+            with open(os.path.join(self.root, LOCK_FILE), "a+") as f:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        yield False
+                        return
+                try:
+                    yield True
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+        finally:
+            self._thread_lock.release()
+
+    def begin(self) -> str:
+        """Create the next generation as a copy of the current one. Call with the writer lock held."""
+        current = self.current()
+        for stale in self._generations():
+            # Newer than CURRENT and nobody is writing: left behind by a crashed build
+            if current is None or stale > current:
+                shutil.rmtree(self.path(stale), ignore_errors=True)
+        existing = self._generations()
+        number = int(existing[-1][1:]) + 1 if existing else 1
+        generation = f"g{number:06d}"
+        target = self.path(generation)
+        start = time.perf_counter()
+        if current is not None:
+            shutil.copytree(self.path(current), target, copy_function=_clone_file)
+        elif os.path.exists(os.path.join(self.root, "chroma.sqlite3")):
+            # First generation of an existing deployment: adopt the unversioned index
+            shutil.copytree(self.root, target, ignore=lambda d, names: _NOT_INDEX_DATA & set(names) if d == self.root else set(),
+                            copy_function=_clone_file)
+        else:
+            os.makedirs(target)
+        logger.info("Index generation started", generation=generation, base=current, copy_s=round(time.perf_counter() - start, 2))
+        return generation
+
+    def publish(self, generation: str) -> None:
+        tmp_path = os.path.join(self.root, f"{POINTER_FILE}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"generation": generation, "published_at": time.time()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.root, POINTER_FILE))
+        logger.info("Index generation published", generation=generation)
+
+    def discard(self, generation: str) -> None:
+        shutil.rmtree(self.path(generation), ignore_errors=True)
+
+    def build(self, apply: Callable, skip: Callable = None, on_discard: Callable = None, finish: Callable = None):
+        """Build and publish one generation, entirely under the writer lock.
+
+        ``skip()`` is checked once the lock is held, so a job several workers
+        queued for the same change runs once. ``apply(generation)`` returns
+        (changed, result); an unchanged build is discarded (``on_discard`` first)
+        unless nothing is published yet. ``finish(generation, result)`` also runs
+        under the lock, after publishing. Returns (published generation or None,
+        result), with result None when skipped.
+        """
+        with self.writer_lock():
+            if skip is not None and skip():
+                return None, None
+            generation = self.begin()
+            try:
+                changed, result = apply(generation)
+            except BaseException:
+                if on_discard is not None:
+                    on_discard(generation)
+                self.discard(generation)
+                raise
+            if changed or self.current() is None:
+                self.publish(generation)
+            else:
+                if on_discard is not None:
+                    on_discard(generation)
+                self.discard(generation)
+                generation = None
+            if finish is not None:
+                finish(generation, result)
+        return generation, result
+
+    def _lease_path(self, generation: str) -> str:
+        return os.path.join(self.root, LEASES_DIR, f"{generation}.{self.owner}")
+
+    def acquire_lease(self, generation: str) -> None:
+        os.makedirs(os.path.join(self.root, LEASES_DIR), exist_ok=True)
+        with open(self._lease_path(generation), "a"):
+            pass
+        os.utime(self._lease_path(generation))
+
+    def heartbeat(self, generation: str) -> None:
+        try:
+            os.utime(self._lease_path(generation))
+        except FileNotFoundError:
+            self.acquire_lease(generation)
+
+    def release_lease(self, generation: str) -> None:
+        try:
+            os.remove(self._lease_path(generation))
+        except FileNotFoundError:
+            pass
+
+    def _leased(self) -> set:
+        leased, now = set(), time.time()
+        lease_dir = os.path.join(self.root, LEASES_DIR)
+        for name in os.listdir(lease_dir) if os.path.isdir(lease_dir) else []:
+            path = os.path.join(lease_dir, name)
+            try:
+                fresh = now - os.stat(path).st_mtime < self.lease_ttl
+            except FileNotFoundError:
+                continue
+            if fresh:
+                leased.add(name.split(".", 1)[0])
+            else:
+                # Owner crashed or was killed without releasing
+                os.remove(path)
+        return leased
+
+    def collect_garbage(self) -> list:
+        """Delete generations older than CURRENT that no reader holds; skipped while a writer is busy."""
+        with self.writer_lock(blocking=False) as locked:
+            if not locked:
+                return []
+            current = self.current()
+            if current is None:
+                return []
+            leased = self._leased()
+            removed = [g for g in self._generations() if g < current and g not in leased]
+            for generation in removed:
+                self.discard(generation)
+        if removed:
+            logger.info("Old index generations removed", generations=removed, current=current)
+        return removed
+
+class GenerationWatcher:
+    """Poll ``CURRENT`` and hand each newly published generation to ``on_change``.
+
+    ``on_change(generation)`` builds and publishes the new reader; it runs on
+    this thread, so queries keep using the old reader meanwhile. The old
+    generation's lease is kept for ``grace`` seconds after the swap so in-flight
+    searches can finish, then released (``on_release(generation)``) and
+    garbage collection is attempted.
+    """
+
+    def __init__(self, generations: IndexGenerations, on_change: Callable[[str], None],
+                 on_release: Callable[[str], None] = None, interval: float = None, grace: float = None):
+        self.generations = generations
+        self.on_change = on_change
+        self.on_release = on_release
+        self.interval = interval or float(os.environ.get("INDEX_POLL_INTERVAL", 2.0))
+        self.grace = grace if grace is not None else float(os.environ.get("INDEX_RETIRE_GRACE", 30))
+        self.active: Optional[str] = None
+        self._retired = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def adopt(self, generation: Optional[str]) -> None:
+        """Record the generation the current reader was built on (e.g. at startup)."""
+        with self._lock:
+            if generation is not None:
+                self.generations.acquire_lease(generation)
+            self.active = generation
+
+    def check(self) -> bool:
+        """Swap to a newly published generation if there is one; returns True on a swap."""
+        with self._lock:
+            generation = self.generations.current()
+            if generation is not None and generation != self.active:
+                self.generations.acquire_lease(generation)
+                try:
+                    self.on_change(generation)
+                except Exception as e:
+                    self.generations.release_lease(generation)
+                    logger.error("Index generation swap failed", generation=generation, error=str(e))
+                    return False
+                if self.active is not None:
+                    self._retired.append((self.active, time.monotonic()))
+                logger.info("Switched to index generation", generation=generation, previous=self.active)
+                self.active = generation
+                swapped = True
+            else:
+                swapped = False
+            if self.active is not None:
+                self.generations.heartbeat(self.active)
+            now = time.monotonic()
+            released = [g for g, at in self._retired if now - at >= self.grace]
+            self._retired = [(g, at) for g, at in self._retired if now - at < self.grace]
+            for g, _ in self._retired:
+                self.generations.heartbeat(g)
+        for g in released:
+            self.generations.release_lease(g)
+            if self.on_release is not None:
+                self.on_release(g)
+        if released:
+            self.generations.collect_garbage()
+        return swapped
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error("Index generation poll failed", error=str(e))
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="index-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._lock:
+            leases = ([self.active] if self.active else []) + [g for g, _ in self._retired]
+        for generation in leases:
+            self.generations.release_lease(generation)
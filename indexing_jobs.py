@@ -0,0 +1,146 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+from dotenv import load_dotenv
+import structlog
+
+load_dotenv()
+logger = structlog.get_logger()
+
+class IndexJobQueue:
+    """Single-writer queue for index mutations (reindex, upload, delete).
+
+    Admin endpoints submit jobs and return immediately. One background thread
+    owns every write to the vector store: it waits ``coalesce_window`` seconds
+    after the first pending job so bursts (e.g. many uploads) pile up, then
+    serves all pending jobs with a single incremental run of ``run_fn``.
+    ``run_fn(delete_doc_ids, full_sync, progress)`` receives the doc ids to
+    drop, whether a corpus sync is needed, and a callback for progress messages;
+    it returns a stats dict. The queue itself does not isolate readers from a
+    run in progress: in the service, ``run_fn`` writes into a new index
+    generation that is published only when the run completes (index_generations).
+    """
+
+    def __init__(self, run_fn: Callable, coalesce_window: float = None, max_jobs_kept: int = 200):
+        self.run_fn = run_fn
+        self.coalesce_window = coalesce_window if coalesce_window is not None else float(os.environ.get("INDEX_COALESCE_WINDOW", 2.0))
+        self.max_jobs_kept = max_jobs_kept
+        self.jobs = OrderedDict()
+        self._pending: List[str] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._worker, name="index-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = None) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, kind: str, doc_ids=()) -> dict:
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "doc_ids": list(doc_ids),
+            "status": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+            "batch_size": None,
+            "events": [{"event": "progress", "data": f"{kind} job queued"}],
+        }
+        with self._cond:
+            self.jobs[job["id"]] = job
+            while len(self.jobs) > self.max_jobs_kept:
+                oldest_id, oldest = next(iter(self.jobs.items()))
+                if oldest["status"] in ("queued", "running"):
+                    break
+                self.jobs.pop(oldest_id)
+            self._pending.append(job["id"])
+            self._cond.notify_all()
+        logger.info("Index job queued", job_id=job["id"], kind=kind, doc_ids=job["doc_ids"])
+        return self.get(job["id"])
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = {k: v for k, v in job.items() if k != "events"}
+            snapshot["events"] = list(job["events"])
+            return snapshot
+
+    def list(self) -> list:
+        with self._cond:
+            ids = list(self.jobs)
+        return [job for job in (self.get(i) for i in reversed(ids)) if job is not None]
+
+    def events_since(self, job_id: str, cursor: int):
+        """Return (new events, next cursor, finished) for streaming a job's progress."""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return [], cursor, True
+            events = job["events"][cursor:]
+            return events, cursor + len(events), job["status"] in ("done", "failed")
+
+    def _emit(self, job_ids: List[str], event: str, data: str) -> None:
+        with self._cond:
+            for job_id in job_ids:
+                if job_id in self.jobs:
+                    self.jobs[job_id]["events"].append({"event": event, "data": data})
+
+    def _take_batch(self) -> List[str]:
+        with self._cond:
+            while not self._pending and not self._stopping:
+                self._cond.wait()
+            if self._stopping:
+                return []
+        # Let a burst of submissions accumulate into one run
+        time.sleep(self.coalesce_window)
+        with self._cond:
+            batch, self._pending = self._pending, []
+            now = time.time()
+            for job_id in batch:
+                self.jobs[job_id]["status"] = "running"
+                self.jobs[job_id]["started_at"] = now
+                self.jobs[job_id]["batch_size"] = len(batch)
+            return batch
+
+    def _worker(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            with self._cond:
+                jobs = [self.jobs[j] for j in batch]
+            delete_doc_ids = sorted({d for job in jobs if job["kind"] == "delete" for d in job["doc_ids"]})
+            full_sync = any(job["kind"] != "delete" for job in jobs)
+            self._emit(batch, "progress", f"Indexing run started for {len(batch)} coalesced job(s)")
+            start = time.time()
+            try:
+                result = self.run_fn(delete_doc_ids, full_sync, lambda msg: self._emit(batch, "progress", msg))
+                status, error = "done", None
+            except Exception as e:
+                logger.error("Index job failed", job_ids=batch, error=str(e))
+                result, status, error = None, "failed", str(e)
+            with self._cond:
+                now = time.time()
+                for job in jobs:
+                    job.update(status=status, result=result, error=error, finished_at=now)
+            self._emit(batch, "done" if status == "done" else "error", "Reindexing complete!" if status == "done" else error)
+            logger.info("Index run finished", jobs=len(batch), status=status, elapsed_s=round(time.time() - start, 2), result=result)
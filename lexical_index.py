@@ -0,0 +1,228 @@
+import os
+import re
+import math
+import pickle
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+import structlog
+
+load_dotenv()
+logger = structlog.get_logger()
+
+# Compound tokens such as E-4071, M8x1.25, SP-2000/B are kept whole
+COMPOUND_RE = re.compile(r"[A-Za-z0-9]+(?:[-./_][A-Za-z0-9]+)+|\w+")
+WORD_RE = re.compile(r"[A-Za-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it of on or should the to what when where "
+    "which who why with my me we you your this that these those there their then than into out up".split()
+)
+
+def is_identifier(token: str) -> bool:
+    """Part numbers, error codes, thread sizes: 3+ chars with a digit plus a letter or a separator."""
+    return len(token) >= 3 and any(c.isdigit() for c in token) and (any(c.isalpha() for c in token) or any(c in "-./_" for c in token))
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased terms; compound identifiers are emitted whole and as their parts."""
+    terms = []
+    for match in COMPOUND_RE.finditer(text):
+        token = match.group(0).lower()
+        parts = WORD_RE.findall(token)
+        if len(parts) > 1:
+            terms.append(token)
+            terms.extend(p for p in parts if p not in STOPWORDS)
+        elif token not in STOPWORDS:
+            terms.append(token)
+    return terms
+
+def query_identifiers(query: str) -> List[str]:
+    return [m.group(0).lower() for m in COMPOUND_RE.finditer(query) if is_identifier(m.group(0))]
+
+def is_identifier_lookup(query: str) -> bool:
+    """True when every meaningful query token is an identifier, e.g. "E-4071" or "M8x1.25 SP-2000"."""
+    tokens = [m.group(0) for m in COMPOUND_RE.finditer(query) if m.group(0).lower() not in STOPWORDS]
+    return bool(tokens) and all(is_identifier(t) for t in tokens)
+
+class LexicalIndex:
+    """In-process BM25 inverted index over chunk texts.
+
+    Postings are two compact arrays per term (chunk slot, term frequency), about
+    6 bytes per posting. Removed chunks are tombstoned and their slots skipped
+    at query time; postings are compacted once tombstones pass 20% of slots.
+    Query terms whose document frequency exceeds ``max_df_ratio`` of the corpus
+    are ignored, so lookups only walk short identifier/rare-word postings.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.2, b: float = 0.75, max_df_ratio: float = 0.1):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self._lock = threading.RLock()
+        self._mtime = None
+        self._reset()
+        if path and os.path.exists(path):
+            self.load()
+
+    def _reset(self) -> None:
+        self.ids: List[Optional[str]] = []
+        self.slots: Dict[str, int] = {}
+        self.lengths = array("I")
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.total_length = 0
+        self.deleted = 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def add(self, chunk_ids: Iterable[str], texts: Iterable[str]) -> None:
+        with self._lock:
+            for chunk_id, text in zip(chunk_ids, texts):
+                if chunk_id in self.slots:
+                    self._remove_one(chunk_id)
+                terms = Counter(tokenize(text))
+                slot = len(self.ids)
+                self.ids.append(chunk_id)
+                self.slots[chunk_id] = slot
+                length = sum(terms.values())
+                self.lengths.append(length)
+                self.total_length += length
+                for term, tf in terms.items():
+                    posting = self.postings.get(term)
+                    if posting is None:
+                        posting = self.postings[term] = (array("I"), array("H"))
+                    posting[0].append(slot)
+                    posting[1].append(min(tf, 65535))
+
+    def _remove_one(self, chunk_id: str) -> None:
+        slot = self.slots.pop(chunk_id, None)
+        if slot is None:
+            return
+        self.ids[slot] = None
+        self.total_length -= self.lengths[slot]
+        self.deleted += 1
+
+    def remove(self, chunk_ids: Iterable[str]) -> None:
+        with self._lock:
+            for chunk_id in chunk_ids:
+                self._remove_one(chunk_id)
+            if self.deleted > 0.2 * max(len(self.ids), 1):
+                self._compact()
+
+    def _compact(self) -> None:
+        remap = array("I", [0]) * len(self.ids)
+        ids, lengths = [], array("I")
+        for slot, chunk_id in enumerate(self.ids):
+            if chunk_id is not None:
+                remap[slot] = len(ids)
+                ids.append(chunk_id)
+                lengths.append(self.lengths[slot])
+        postings = {}
+        for term, (slots, tfs) in self.postings.items():
+            new_slots, new_tfs = array("I"), array("H")
+            for slot, tf in zip(slots, tfs):
+                if self.ids[slot] is not None:
+                    new_slots.append(remap[slot])
+                    new_tfs.append(tf)
+            if new_slots:
+                postings[term] = (new_slots, new_tfs)
+        self.ids, self.lengths, self.postings = ids, lengths, postings
+        self.slots = {chunk_id: slot for slot, chunk_id in enumerate(ids)}
+        self.deleted = 0
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[str, float]]:
+        """BM25 top-k as (chunk_id, score), best first."""
+        self.maybe_reload()
+        with self._lock:
+            n = len(self.slots)
+            if not n:
+                return []
+            avg_len = self.total_length / n
+            max_df = max(self.max_df_ratio * n, 1)
+            scores: Dict[int, float] = {}
+            identifiers = set(query_identifiers(query))
+            for term in set(tokenize(query)):
+                posting = self.postings.get(term)
+                if posting is None:
+                    continue
+                slots, tfs = posting
+                df = len(slots)
+                # Common words barely move BM25 but cost the most to scan; identifiers are always scored
+                if df > max_df and term not in identifiers:
+                    continue
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for slot, tf in zip(slots, tfs):
+                    if self.ids[slot] is None:
+                        continue
+                    norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[slot] / avg_len)
+                    scores[slot] = scores.get(slot, 0.0) + idf * tf * (self.k1 + 1) / norm
+            best = sorted(scores.items(), key=lambda item: -item[1])[:top_k]
+            return [(self.ids[slot], score) for slot, score in best]
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            if self.deleted:
+                self._compact()
+            state = {"ids": self.ids, "lengths": self.lengths, "postings": self.postings, "total_length": self.total_length}
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            self._mtime = os.stat(self.path).st_mtime_ns
+
+    def load(self) -> None:
+        # The file is written only by this service (Embedder) next to the Chroma store
+        with self._lock:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+            self._reset()
+            self.ids = state["ids"]
+            self.lengths = state["lengths"]
+            self.postings = state["postings"]
+            self.total_length = state["total_length"]
+            self.slots = {chunk_id: slot for slot, chunk_id in enumerate(self.ids) if chunk_id is not None}
+            self._mtime = os.stat(self.path).st_mtime_ns
+        logger.info("Lexical index loaded", path=self.path, chunks=len(self.slots), terms=len(self.postings))
+
+    def maybe_reload(self) -> None:
+        """Pick up a newer index file written by another worker process."""
+        if not self.path:
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime:
+            self.load()
+
+_indexes: Dict[str, LexicalIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_lexical_index(path: str = None) -> LexicalIndex:
+    """Process-wide index shared by Embedder (writer) and Retriever (reader)."""
+    path = os.path.abspath(path or os.path.join(os.environ["CHROMA_DB_PATH"], "lexical_index.pkl"))
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = LexicalIndex(path)
+        return _indexes[path]
+
+def release_lexical_index(path: str) -> None:
+    with _indexes_lock:
+        _indexes.pop(os.path.abspath(path), None)
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists; items ranked high in any list rise to the top."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: -item[1])
@@ -1,36 +1,127 @@
 import os
+import threading
+from contextlib import contextmanager
+import httpx
 from dotenv import load_dotenv
 import structlog
-from langchain_groq import ChatGroq
+from context_assembly import ContextAssembler, count_tokens
+import metrics
 
 load_dotenv()
 logger = structlog.get_logger()
 
+def build_http_clients(max_connections: int = None, max_keepalive: int = None, keepalive_expiry: float = None,
+                       timeout: float = None, connect_timeout: float = None) -> tuple:
+    """(sync, async) httpx clients with a bounded keep-alive pool; arguments default to the GROQ_* settings."""
+    limits = httpx.Limits(
+        max_connections=max_connections or int(os.environ.get("GROQ_MAX_CONNECTIONS", 32)),
+        max_keepalive_connections=max_keepalive or int(os.environ.get("GROQ_MAX_KEEPALIVE", 16)),
+        keepalive_expiry=keepalive_expiry or float(os.environ.get("GROQ_KEEPALIVE_EXPIRY", 30)),
+    )
+    timeout = httpx.Timeout(timeout or float(os.environ.get("GROQ_TIMEOUT", 60)),
+                            connect=connect_timeout or float(os.environ.get("GROQ_CONNECT_TIMEOUT", 5)))
+    return httpx.Client(limits=limits, timeout=timeout), httpx.AsyncClient(limits=limits, timeout=timeout)
+
+# One connection pool per process, shared by every LLMClient
+_http_clients = None
+_http_lock = threading.Lock()
+
+def get_http_clients() -> tuple:
+    global _http_clients
+    with _http_lock:
+        if _http_clients is None:
+            _http_clients = build_http_clients()
+        return _http_clients
+
 class LLMClient:
+    FAILED_ANSWER = "GROQ API call failed."
+
     def __init__(self):
         self.api_key = os.environ["GROQ_API_KEY"]
         self.model = os.environ.get("GROQ_MODEL", "llama3-8b-8192")
         assert self.api_key, "GROQ API key must be set in environment!"
+        from langchain_groq import ChatGroq
+        http_client, http_async_client = get_http_clients()
         self.llm = ChatGroq(
             groq_api_key=self.api_key,
-            model_name=self.model
+            model_name=self.model,
+            # None keeps the SDK default endpoint; point it at a local stub server for load tests
+            groq_api_base=os.environ.get("GROQ_API_BASE") or None,
+            request_timeout=float(os.environ.get("GROQ_TIMEOUT", 60)),
+            max_retries=int(os.environ.get("GROQ_MAX_RETRIES", 2)),
+            http_client=http_client,
+            http_async_client=http_async_client,
         )
+        self.context_assembler = ContextAssembler()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._in_flight_lock = threading.Lock()
+
+    @contextmanager
+    def _upstream(self):
+        """Count calls currently waiting on Groq (llm_upstream_in_flight gauge)."""
+        with self._in_flight_lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        metrics.LLM_UPSTREAM_IN_FLIGHT.inc()
+        try:
+            yield
+        finally:
+            metrics.LLM_UPSTREAM_IN_FLIGHT.dec()
+            with self._in_flight_lock:
+                self.in_flight -= 1
+
+    SYSTEM_PROMPT = (
+        "You are a helpful manufacturing documentation assistant. "
+        "Answer the user's question using ALL relevant details from the provided context below. "
+        "Always provide a complete and comprehensive answer, quoting or including full procedures, steps, or lists from the context if the question asks about them. "
+        "If the answer is not in the context, reply: 'I don't know.' Do NOT use outside knowledge. "
+        "Cite sources by doc_id and page."
+    )
+
+    def build_prompt(self, prompt: str, context: list) -> str:
+        return f"System: {self.SYSTEM_PROMPT}\n\nContext:\n{(chr(10) * 2).join(context)}\n\nQuestion: {prompt}"
+
+    def prepare_context(self, prompt: str, docs: list):
+        """Compact retrieved chunks into tagged context; returns (context, prompt token counts for timings)."""
+        context, stats = self.context_assembler.assemble(docs)
+        before = count_tokens(self.build_prompt(prompt, [d["content"] for d in docs]))
+        after = count_tokens(self.build_prompt(prompt, context))
+        logger.info("Prompt context assembled", prompt_tokens_before=before, prompt_tokens_after=after, **stats)
+        return context, {"prompt_tokens_before": before, "prompt_tokens_after": after}
 
     def query(self, prompt: str, context: list, max_tokens: int = 512) -> str:
-        system_prompt = (
-            "You are a helpful manufacturing documentation assistant. "
-            "Answer the user's question using ALL relevant details from the provided context below. "
-            "Always provide a complete and comprehensive answer, quoting or including full procedures, steps, or lists from the context if the question asks about them. "
-            "If the answer is not in the context, reply: 'I don't know.' Do NOT use outside knowledge. "
-            "Cite sources by doc_id and page."
-        )
-        full_prompt = f"System: {system_prompt}\n\nContext:\n{chr(10).join(context)}\n\nQuestion: {prompt}"
+        full_prompt = self.build_prompt(prompt, context)
         try:
-            result = self.llm.invoke(full_prompt)
-            return result
+            with self._upstream():
+                result = self.llm.invoke(full_prompt)
+            return result.content
         except Exception as e:
             logger.error("GROQ API call failed", error=str(e))
-            return "GROQ API call failed."
+            return self.FAILED_ANSWER
+
+    async def aquery(self, prompt: str, context: list, max_tokens: int = 512) -> str:
+        """Async variant of :meth:`query`; awaits the Groq call instead of blocking the event loop."""
+        full_prompt = self.build_prompt(prompt, context)
+        try:
+            with self._upstream():
+                result = await self.llm.ainvoke(full_prompt)
+            return result.content
+        except Exception as e:
+            logger.error("GROQ API call failed", error=str(e))
+            return self.FAILED_ANSWER
+
+    async def astream(self, prompt: str, context: list):
+        """Yield answer text incrementally. Closing the generator (e.g. on client
+        disconnect) closes the upstream Groq stream, so no more tokens are generated."""
+        stream = self.llm.astream(self.build_prompt(prompt, context))
+        with self._upstream():
+            try:
+                async for chunk in stream:
+                    if chunk.content:
+                        yield chunk.content
+            finally:
+                await stream.aclose()
 
 if __name__ == "__main__":
     client = LLMClient()
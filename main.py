@@ -1,10 +1,12 @@
-import os
 import time
+_import_start = time.perf_counter()
+import os
 from fastapi import FastAPI, Request, HTTPException, Depends, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from sse_starlette.sse import EventSourceResponse
 from pydantic import BaseModel
+from typing import List, Optional
 import structlog
 import sentry_sdk
 from starlette.responses import Response
@@ -17,8 +19,15 @@ import logging
 from embedding_service import Embedder
 from retrieval_service import Retriever
 from llm_client import LLMClient
-from pdf_ingest import ingest_pdfs
-from langchain.chains import RetrievalQA
+from pdf_ingest import corpus_manifest, iter_ingest
+from model_registry import get_embeddings, memory_report, release_vector_store
+from lexical_index import release_lexical_index
+from index_generations import GenerationWatcher, IndexGenerations
+from chunking import Chunker
+from answer_cache import AnswerCache, normalize_question
+from indexing_jobs import IndexJobQueue
+import metrics
+from query_service import SingleFlight, StageLimits, StageTimeoutError, aanswer_question, abatch_answer, astream_answer
 
 load_dotenv()
 logger = structlog.get_logger()
@@ -42,18 +51,94 @@ app.add_middleware(
 
 redis_client = redis.Redis.from_url(os.environ["REDIS_URL"])
 
-embedder = Embedder()
-retriever = Retriever()
-llm_client = LLMClient()
+query_limits = StageLimits()
+# Concurrent identical /query requests share one retrieval + LLM call
+query_flights = SingleFlight() if os.environ.get("QUERY_COALESCING_ENABLED", "true").lower() == "true" else None
+answer_cache = AnswerCache(redis_client) if os.environ.get("ANSWER_CACHE_ENABLED", "true").lower() == "true" else None
+
+# "eager" loads models at import (tests, benchmarks); "fast" imports and returns
+# immediately and loads them in the background while /readyz reports 503.
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "eager").lower()
+startup_state = {"ready": False, "error": None, "phases": {}}
+
+# Query-side services; the Chunker is created by the index writer on its first
+# job, and each job writes through an Embedder bound to a fresh index generation.
+retriever = None
+llm_client = None
+chunker = None
+
+_swap_lock = threading.Lock()
+
+# Workers and replicas share CHROMA_DB_PATH: writers build new generations and
+# publish them, and every worker's watcher swaps its retriever to the new one.
+generations = IndexGenerations()
+
+def _timed(phase: str, fn):
+    start = time.perf_counter()
+    result = fn()
+    startup_state["phases"][f"{phase}_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+def init_services() -> None:
+    """Load the embedding model, open the persisted collection and run one warm-up encode + search."""
+    global retriever, llm_client
+    try:
+        embeddings = _timed("embedding_model", get_embeddings)
+        generation = generations.current()
+        index_watcher.adopt(generation)
+        retriever = _timed("vector_store", lambda: open_retriever(generation))
+        if answer_cache is not None and generation is not None:
+            # A generation published while no worker was running (e.g. by the CLI) still invalidates once
+            answer_cache.invalidate(generation)
+        llm_client = _timed("llm_client", LLMClient)
+        # First calls pay for lazy kernel and collection initialisation; do it before taking traffic
+        _timed("warmup", lambda: retriever.search_by_vector(embeddings.embed_query("warm-up"), top_k=1))
+        startup_state["ready"] = True
+    except Exception as e:
+        startup_state["error"] = str(e)
+        logger.error("Service initialisation failed", error=str(e))
+        raise
+    finally:
+        startup_state["time_to_ready_ms"] = round((time.perf_counter() - _import_start) * 1000, 1)
+        logger.info("Startup phases", mode=STARTUP_MODE, ready=startup_state["ready"], **startup_state["phases"],
+                    time_to_ready_ms=startup_state["time_to_ready_ms"])
 
-def build_qa_chain():
-    return RetrievalQA.from_chain_type(
-        llm=llm_client.llm,
-        retriever=retriever.retriever,
-        return_source_documents=True
-    )
+def get_chunker() -> Chunker:
+    global chunker
+    if chunker is None:
+        chunker = Chunker()
+    return chunker
 
-qa_chain = build_qa_chain()
+def require_ready():
+    if not startup_state["ready"]:
+        raise HTTPException(status_code=503, detail="Service is starting")
+
+def open_retriever(generation: str = None) -> Retriever:
+    # Before the first published generation, keep serving an unversioned index at CHROMA_DB_PATH
+    return Retriever(generations.path(generation) if generation else generations.root, generation)
+
+def swap_retriever(generation: str = None):
+    """Open ``generation`` (default: the published one), warm it up, then swap it in for new queries.
+
+    Requests already running keep the Retriever they captured; the embedding
+    model is shared, so only the new generation's collection is opened.
+    """
+    global retriever
+    new = open_retriever(generation or generations.current())
+    new.search_by_vector(new.embed_query("warm-up"), top_k=1)
+    with _swap_lock:
+        retriever = new
+    # The publishing worker swaps first and invalidates; for the others this is one version check.
+    # Workers still on the old generation stop caching answers once the cache moves on.
+    if answer_cache is not None and new.generation is not None:
+        answer_cache.invalidate(new.generation)
+
+def release_generation(generation: str) -> None:
+    path = generations.path(generation)
+    release_vector_store(path)
+    release_lexical_index(os.path.join(path, "lexical_index.pkl"))
+
+index_watcher = GenerationWatcher(generations, swap_retriever, release_generation)
 
 class QueryRequest(BaseModel):
     question: str
@@ -63,6 +148,113 @@ class QueryResponse(BaseModel):
     answer: str
     sources: list
     latency_ms: int
+    timings: dict = {}
+    index_version: Optional[str] = None
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    top_k: int = int(os.environ.get("TOP_K", 5))
+
+def build_generation(apply, skip=None, finish=None):
+    """Run ``apply(embedder)`` on a copy of the published index and publish it if anything changed.
+
+    Returns (generation or None, stats), with stats None when ``skip()`` said
+    there is nothing to do. Everything, ``skip`` and ``finish(generation, stats)``
+    included, runs under the cross-process writer lock, so only one worker or
+    replica builds at a time; readers are never blocked.
+    """
+    def apply_to(generation):
+        stats = apply(Embedder(generations.path(generation)))
+        return bool(stats["added"] or stats["deleted"]), stats
+
+    return generations.build(apply_to, skip=skip, on_discard=release_generation, finish=finish)
+
+def sync_index(embedder: Embedder, raw_dir: str = None, progress=None) -> dict:
+    """Stream OCR pages through chunking into ``embedder``'s generation batch by batch."""
+    failed_doc_ids = set()
+    pages = iter_ingest(raw_dir or os.environ["DOCS_RAW_DIR"], failed_doc_ids=failed_doc_ids)
+    records = get_chunker().chunk_records(pages)
+    on_batch = (lambda added: progress(f"Embedded and stored {added} new chunks...")) if progress else None
+    stats = embedder.embed_stream(records, keep_doc_ids=failed_doc_ids, on_batch=on_batch)
+    if failed_doc_ids:
+        stats["ocr_failed"] = sorted(failed_doc_ids)
+    return stats
+
+def run_index_job(delete_doc_ids, full_sync, progress) -> dict:
+    """Body of one coalesced indexing run; only ever called from the index writer thread."""
+    stats = {"added": 0, "deleted": 0, "unchanged": 0, "deleted_docs": list(delete_doc_ids)}
+    corpus = {}
+
+    def apply(embedder: Embedder) -> dict:
+        for doc_id in delete_doc_ids:
+            # Drop the document's chunks by doc_id metadata instead of re-embedding the corpus
+            stats["deleted"] += embedder.delete_document(doc_id)
+        if delete_doc_ids:
+            progress(f"Deleted {len(delete_doc_ids)} document(s)")
+        if full_sync:
+            progress("Starting incremental reindex...")
+            # Snapshot before reading the files: a file edited mid-sync shows up as changed next time
+            corpus.update(corpus_manifest(os.environ["DOCS_RAW_DIR"]))
+            synced = sync_index(embedder, progress=progress)
+            for key in ("added", "deleted", "unchanged"):
+                stats[key] += synced[key]
+            for key in ("ocr_failed", "vector_cache"):
+                if key in synced:
+                    stats[key] = synced[key]
+            progress(f"Embedded and stored documents: {stats['added']} added, {stats['deleted']} deleted, {stats['unchanged']} unchanged.")
+        return stats
+
+    def already_synced() -> bool:
+        # Under the writer lock: every worker queues a reindex at boot, the first one does it
+        return full_sync and not delete_doc_ids and not corpus_changed()
+
+    def record_corpus(generation, result) -> None:
+        if full_sync and "ocr_failed" not in stats:
+            # Failed files are retried on the next boot, so only record fully indexed corpora
+            save_corpus_manifest(corpus)
+
+    generation, built = build_generation(apply, skip=already_synced, finish=record_corpus)
+    if built is None:
+        progress("Corpus unchanged since last sync, nothing to do.")
+        return stats
+    stats["index_version"] = generation or index_watcher.active
+    # This worker switches now; the others pick the pointer up within INDEX_POLL_INTERVAL
+    index_watcher.check()
+    return stats
+
+def _corpus_manifest_path() -> str:
+    return os.path.join(os.environ["CHROMA_DB_PATH"], "corpus_manifest.json")
+
+def _index_settings() -> dict:
+    # Changing any of these changes the chunks, so it forces a sync like a changed file would
+    return {key: os.environ.get(key, "") for key in ("EMBEDDING_MODEL", "CHUNK_SIZE", "CHUNK_OVERLAP")}
+
+def save_corpus_manifest(corpus: dict) -> None:
+    tmp_path = f"{_corpus_manifest_path()}.tmp"
+    os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"files": corpus, "settings": _index_settings()}, f)
+    os.replace(tmp_path, _corpus_manifest_path())
+
+def corpus_changed() -> bool:
+    """True unless the last complete sync saw exactly the current raw files and settings."""
+    try:
+        with open(_corpus_manifest_path(), "r", encoding="utf-8") as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return True
+    return stored != {"files": corpus_manifest(os.environ["DOCS_RAW_DIR"]), "settings": _index_settings()}
+
+index_jobs = IndexJobQueue(run_index_job)
+
+def _collection_chunks() -> int:
+    return retriever.chunk_count() if retriever is not None else 0
+
+metrics.track_collection_chunks(_collection_chunks)
+
+if STARTUP_MODE != "fast":
+    init_services()
+startup_state["phases"]["import_ms"] = round((time.perf_counter() - _import_start) * 1000, 1)
 
 def admin_auth(request: Request):
     token = request.headers.get("Authorization", "").replace("Bearer ", "")
@@ -71,79 +263,173 @@ def admin_auth(request: Request):
 
 @app.on_event("startup")
 def auto_reindex():
-    def reindex():
-        docs = ingest_pdfs(os.environ["DOCS_RAW_DIR"])
-        embedder.embed_and_store(docs)
-        global retriever, qa_chain
-        retriever = Retriever()
-        qa_chain = build_qa_chain()
-        logger.info("Auto reindex completed on startup.")
-    threading.Thread(target=reindex, daemon=True).start()
+    if os.environ.get("METRICS_SERVER_ENABLED", "false").lower() == "true":
+        metrics.start_metrics_server()
+    index_jobs.start()
+
+    def boot():
+        if not startup_state["ready"]:
+            init_services()
+        index_watcher.start()
+        # Reindex only when raw files or chunking settings changed since the last complete sync.
+        # A cheap unlocked pre-check; the job re-checks under the writer lock, so only one worker syncs.
+        if corpus_changed():
+            index_jobs.submit("reindex")
+        else:
+            logger.info("Corpus unchanged since last sync, skipping startup reindex")
+
+    if STARTUP_MODE == "fast":
+        threading.Thread(target=boot, name="startup", daemon=True).start()
+    else:
+        boot()
+
+@app.on_event("shutdown")
+def stop_index_jobs():
+    index_jobs.stop(timeout=5)
+    index_watcher.stop()
+    metrics.mark_process_dead()
 
 @app.post("/query", response_model=QueryResponse)
-async def query_endpoint(req: QueryRequest):
-    global qa_chain
+async def query_endpoint(req: QueryRequest, response: Response):
+    require_ready()
     start = time.time()
-    # cache_key = f"qa:{req.question}:{req.top_k}"
-    # cached = redis_client.get(cache_key)
-    # if cached:
-    #     result = JSONResponse(content=eval(cached))
-    #     result.headers["X-Cache"] = "HIT"
-    #     return result
-    # Use retriever with relevance scores if available
-    if hasattr(retriever, "search_with_relevance_scores"):
-        docs_and_scores = retriever.search_with_relevance_scores(req.question, top_k=req.top_k)
-        # New output: list of dicts with 'content', 'source', 'score'
-        source_docs = [d["content"] for d in docs_and_scores]
-        doc_score_map = {d["source"]: d["score"] for d in docs_and_scores}
-    else:
-        source_docs = retriever.search(req.question, top_k=req.top_k)
-        doc_score_map = {}
-    # If your QA chain expects Document objects, you may need to adapt here
-    response = qa_chain({"query": req.question, "source_documents": source_docs})
-    answer = response["result"]
-    sources = []
-    # Compose sources for frontend
-    for d in docs_and_scores:
-        source_info = {
-            "source": d["source"],
-            "score": d["score"]
-            # Optionally include 'content': d["content"]
-        }
-        sources.append(source_info)
+    retriever_ = retriever
+    with metrics.QUERIES_IN_FLIGHT.track_inprogress():
+        # Single pass: one embedding, one top_k search, and the LLM sees exactly those chunks.
+        # Sync stages run on a bounded executor so the event loop keeps serving other requests.
+        def answer():
+            return aanswer_question(retriever_, llm_client, req.question, req.top_k, query_limits, answer_cache)
+        try:
+            if query_flights is not None:
+                # Same question key as the exact answer cache, plus the index generation so
+                # requests on either side of a swap never share
+                key = (normalize_question(req.question), req.top_k, retriever_.generation)
+                result, shared = await query_flights.do(key, answer)
+                metrics.observe_coalescing(shared, query_flights.coalescing_ratio())
+            else:
+                result, shared = await answer(), False
+        except StageTimeoutError as e:
+            metrics.observe_query("query", "timeout", "none", {}, time.time() - start)
+            raise HTTPException(status_code=504, detail=str(e))
     latency = int((time.time() - start) * 1000)
-    resp = {"answer": answer, "sources": sources, "latency_ms": latency}
-    # redis_client.set(cache_key, str(resp), ex=3600)
-    return resp
+    cache_status = "COALESCED" if shared else result.get("cache", "none")
+    metrics.observe_query("query", "ok", cache_status, result["timings"], time.time() - start)
+    if answer_cache is not None:
+        hit_ratio = answer_cache.local_hit_ratio()
+        if not shared:
+            metrics.observe_cache("answer", cache_status.lower(), hit_ratio)
+        response.headers["X-Cache"] = cache_status
+        response.headers["X-Cache-Hit-Ratio"] = str(hit_ratio)
+    return {"answer": result["answer"], "sources": result["sources"], "latency_ms": latency, "timings": result["timings"],
+            "index_version": retriever_.generation}
+
+@app.post("/query/stream")
+async def query_stream_endpoint(req: QueryRequest):
+    """SSE variant of /query: ``sources``, then ``token`` events as the LLM produces them, then ``done``."""
+    require_ready()
+    retriever_ = retriever
+    async def event_generator():
+        start = time.time()
+        status, cache_status, timings = "cancelled", "none", {}
+        with metrics.QUERIES_IN_FLIGHT.track_inprogress():
+            try:
+                async for event in astream_answer(retriever_, llm_client, req.question, req.top_k, query_limits, answer_cache):
+                    if event["event"] == "done":
+                        done = json.loads(event["data"])
+                        event = dict(event, data=json.dumps(dict(done, index_version=retriever_.generation)))
+                        status, cache_status = "ok", done.pop("cache", "none")
+                        timings = {k: v for k, v in done.items() if k != "total_ms"}
+                    elif event["event"] == "error":
+                        status = "error"
+                    yield event
+            except StageTimeoutError as e:
+                status = "timeout"
+                yield {"event": "error", "data": str(e)}
+            finally:
+                # Also runs when sse_starlette cancels us on client disconnect
+                metrics.observe_query("query_stream", status, cache_status, timings, time.time() - start)
+    return EventSourceResponse(event_generator())
+
+@app.post("/query/batch")
+async def query_batch_endpoint(req: BatchQueryRequest):
+    """Answer N questions with one embedding call and one multi-query vector search."""
+    require_ready()
+    max_batch = int(os.environ.get("QUERY_BATCH_MAX", 256))
+    if len(req.questions) > max_batch:
+        raise HTTPException(status_code=413, detail=f"At most {max_batch} questions per batch")
+    start = time.time()
+    retriever_ = retriever
+    with metrics.QUERIES_IN_FLIGHT.track_inprogress():
+        try:
+            result = await abatch_answer(retriever_, llm_client, req.questions, req.top_k, query_limits, answer_cache)
+        except StageTimeoutError as e:
+            metrics.observe_query("query_batch", "timeout", "none", {}, time.time() - start)
+            raise HTTPException(status_code=504, detail=str(e))
+    metrics.observe_batch(result["results"], result["timings"])
+    result["latency_ms"] = int((time.time() - start) * 1000)
+    result["index_version"] = retriever_.generation
+    return result
+
+@app.get("/healthz")
+async def liveness():
+    """Liveness: the process is up and serving HTTP, even while models are still loading."""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness(response: Response):
+    """Readiness: models loaded and warmed up; 503 until then. Reports per-phase startup timings."""
+    if not startup_state["ready"]:
+        response.status_code = 503
+    return {"status": "ready" if startup_state["ready"] else "starting", "mode": STARTUP_MODE,
+            "index_version": retriever.generation if retriever is not None else None, **startup_state}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
 
 @app.post("/admin/reindex")
 async def admin_reindex(request: Request):
     admin_auth(request)
-    docs = ingest_pdfs(os.environ["DOCS_RAW_DIR"])
-    embedder.embed_and_store(docs)
-    global retriever, qa_chain
-    retriever = Retriever()
-    qa_chain = build_qa_chain()
-    return {"status": "reindexed"}
-
-@app.post("/admin/reindex-sse")
-async def admin_reindex_sse(request: Request):
+    job = index_jobs.submit("reindex")
+    return {"status": "queued", "job_id": job["id"]}
+
+@app.api_route("/admin/reindex-sse", methods=["GET", "POST"])
+async def admin_reindex_sse(request: Request, job_id: str = None):
+    """Stream progress of ``job_id``, or of a newly queued reindex job when none is given."""
     import asyncio
+    admin_auth(request)
+    if job_id is None:
+        job_id = index_jobs.submit("reindex")["id"]
+    elif index_jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
     async def event_generator():
-        yield {"event": "progress", "data": "Starting reindex..."}
-        try:
-            docs = ingest_pdfs(os.environ["DOCS_RAW_DIR"])
-            yield {"event": "progress", "data": f"Ingested {len(docs)} documents."}
-            embedder.embed_and_store(docs)
-            yield {"event": "progress", "data": "Embedded and stored documents."}
-            global retriever, qa_chain
-            retriever = Retriever()
-            qa_chain = build_qa_chain()
-            yield {"event": "done", "data": "Reindexing complete!"}
-        except Exception as e:
-            yield {"event": "error", "data": str(e)}
+        yield {"event": "job", "data": job_id}
+        cursor = 0
+        while True:
+            events, cursor, finished = index_jobs.events_since(job_id, cursor)
+            for event in events:
+                yield event
+            if finished:
+                return
+            if await request.is_disconnected():
+                return
+            await asyncio.sleep(0.5)
     return EventSourceResponse(event_generator())
 
+@app.get("/admin/jobs")
+async def admin_list_jobs(request: Request):
+    admin_auth(request)
+    return {"jobs": [{k: v for k, v in job.items() if k != "events"} for job in index_jobs.list()]}
+
+@app.get("/admin/jobs/{job_id}")
+async def admin_job_status(job_id: str, request: Request):
+    admin_auth(request)
+    job = index_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
 @app.post("/admin/upload")
 async def admin_upload(request: Request, file: UploadFile = File(...)):
     admin_auth(request)
@@ -151,27 +437,19 @@ async def admin_upload(request: Request, file: UploadFile = File(...)):
     file_path = os.path.join(raw_dir, file.filename)
     with open(file_path, "wb") as f:
         shutil.copyfileobj(file.file, f)
-    docs = ingest_pdfs(raw_dir)
-    embedder.embed_and_store(docs)
-    global retriever, qa_chain
-    retriever = Retriever()
-    qa_chain = build_qa_chain()
-    return {"status": "uploaded", "filename": file.filename}
+    # Bursts of uploads coalesce into one incremental indexing run
+    job = index_jobs.submit("upload")
+    return {"status": "uploaded", "filename": file.filename, "job_id": job["id"]}
 
 @app.delete("/admin/document/{doc_id}")
 async def admin_delete_document(doc_id: str, request: Request):
     admin_auth(request)
     raw_dir = os.environ["DOCS_RAW_DIR"]
     for fname in os.listdir(raw_dir):
-        if fname.startswith(doc_id):
+        if os.path.splitext(fname)[0] == doc_id:
             os.remove(os.path.join(raw_dir, fname))
-    # Re-ingest after deletion
-    docs = ingest_pdfs(raw_dir)
-    embedder.embed_and_store(docs)
-    global retriever, qa_chain
-    retriever = Retriever()
-    qa_chain = build_qa_chain()
-    return {"status": "deleted", "doc_id": doc_id}
+    job = index_jobs.submit("delete", doc_ids=[doc_id])
+    return {"status": "deleted", "doc_id": doc_id, "job_id": job["id"]}
 
 @app.get("/admin/documents")
 async def admin_list_documents(request: Request):
@@ -183,6 +461,26 @@ async def admin_list_documents(request: Request):
             docs.append(fname)
     return {"documents": docs}
 
+@app.get("/admin/models")
+async def admin_models(request: Request):
+    admin_auth(request)
+    return memory_report()
+
+@app.get("/admin/cache-stats")
+async def admin_cache_stats(request: Request):
+    admin_auth(request)
+    return answer_cache.stats() if answer_cache is not None else {"enabled": False}
+
+@app.get("/admin/query-stats")
+async def admin_query_stats(request: Request):
+    """Single-flight coalescing and upstream LLM concurrency for this worker."""
+    admin_auth(request)
+    return {
+        "coalescing": query_flights.stats() if query_flights is not None else {"enabled": False},
+        "llm_upstream": {"in_flight": llm_client.in_flight, "peak_in_flight": llm_client.peak_in_flight} if llm_client is not None else None,
+        "stages_in_flight": dict(query_limits.in_flight),
+    }
+
 @app.exception_handler(Exception)
 async def sentry_exception_handler(request: Request, exc: Exception):
     sentry_sdk.capture_exception(exc)
@@ -0,0 +1,116 @@
+import os
+from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST,
+                               generate_latest, multiprocess, start_http_server)
+from dotenv import load_dotenv
+import structlog
+
+load_dotenv()
+logger = structlog.get_logger()
+
+# With several uvicorn/gunicorn workers, set PROMETHEUS_MULTIPROC_DIR (an empty
+# directory, in the server's environment before it starts) so every worker writes
+# its samples there and any worker's /metrics reports the sum over all workers.
+# Without it each worker only reports its own share.
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+# Latency buckets (seconds) covering sub-ms cache hits up to slow LLM completions
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+QUERY_COUNT = Counter("query_count", "Queries served", ["endpoint", "status", "cache"])
+QUERY_STAGE_SECONDS = Histogram("query_stage_seconds", "Per-stage query latency", ["stage"], buckets=LATENCY_BUCKETS)
+QUERIES_IN_FLIGHT = Gauge("queries_in_flight", "Queries currently being served", multiprocess_mode="livesum")
+
+OCR_PAGES = Counter("ocr_pages", "Pages returned by remote OCR")
+LOCAL_TEXT_PAGES = Counter("local_text_pages", "Pages taken from the PDF text layer instead of remote OCR")
+OCR_PAGES_PER_SEC = Gauge("ocr_pages_per_second", "Remote OCR throughput of the last ingest run", multiprocess_mode="mostrecent")
+EMBEDDED_CHUNKS = Counter("embedded_chunks", "Chunks embedded and written to the vector store")
+EMBED_CHUNKS_PER_SEC = Gauge("embed_chunks_per_second", "Embedding throughput of the last committed batch", multiprocess_mode="mostrecent")
+
+CACHE_LOOKUPS = Counter("cache_lookups", "Cache lookups by result", ["cache", "result"])
+CACHE_HIT_RATIO = Gauge("cache_hit_ratio", "Hit ratio since process start", ["cache"], multiprocess_mode="mostrecent")
+
+COLLECTION_CHUNKS = Gauge("vector_collection_chunks", "Chunks in the active vector collection", multiprocess_mode="max")
+
+QUERY_COALESCED = Counter("query_coalesced", "Single-flight /query requests by role", ["role"])
+QUERY_COALESCING_RATIO = Gauge("query_coalescing_ratio", "Share of /query requests served by joining an identical in-flight request",
+                               multiprocess_mode="mostrecent")
+LLM_UPSTREAM_IN_FLIGHT = Gauge("llm_upstream_in_flight", "LLM calls currently waiting on the upstream API", multiprocess_mode="livesum")
+
+def observe_query(endpoint: str, status: str, cache: str, timings: dict, total_seconds: float) -> None:
+    QUERY_COUNT.labels(endpoint=endpoint, status=status, cache=cache).inc()
+    QUERY_STAGE_SECONDS.labels(stage="total").observe(total_seconds)
+    for name, value in (timings or {}).items():
+        if name.endswith("_ms"):
+            QUERY_STAGE_SECONDS.labels(stage=name[:-3]).observe(value / 1000)
+
+def observe_batch(results: list, timings: dict) -> None:
+    """Count every batch item, but record batch-level stage timings once under ``batch_*`` stages."""
+    for item in results:
+        QUERY_COUNT.labels(endpoint="query_batch", status="error" if item["error"] else "ok", cache=item["cache"]).inc()
+    for name, value in timings.items():
+        if name.endswith("_ms"):
+            QUERY_STAGE_SECONDS.labels(stage=f"batch_{name[:-3]}").observe(value / 1000)
+
+def observe_cache(cache: str, result: str, hit_ratio: float = None, count: int = 1) -> None:
+    CACHE_LOOKUPS.labels(cache=cache, result=result).inc(count)
+    if hit_ratio is not None:
+        CACHE_HIT_RATIO.labels(cache=cache).set(hit_ratio)
+
+def observe_coalescing(shared: bool, ratio: float) -> None:
+    QUERY_COALESCED.labels(role="follower" if shared else "leader").inc()
+    QUERY_COALESCING_RATIO.set(ratio)
+
+def observe_embed_batch(num_chunks: int, seconds: float) -> None:
+    EMBEDDED_CHUNKS.inc(num_chunks)
+    if seconds > 0:
+        EMBED_CHUNKS_PER_SEC.set(num_chunks / seconds)
+
+def observe_ocr(pages: int = 0, pages_per_sec: float = None, local_pages: int = 0) -> None:
+    if pages:
+        OCR_PAGES.inc(pages)
+    if local_pages:
+        LOCAL_TEXT_PAGES.inc(local_pages)
+    if pages_per_sec is not None:
+        OCR_PAGES_PER_SEC.set(pages_per_sec)
+
+_collection_chunks_source = None
+
+def track_collection_chunks(source) -> None:
+    """Report ``source()`` as vector_collection_chunks.
+
+    Multiprocess mode does not support Gauge.set_function, so there the value is
+    refreshed whenever this worker renders /metrics.
+    """
+    global _collection_chunks_source
+    if MULTIPROC_DIR:
+        _collection_chunks_source = source
+    else:
+        COLLECTION_CHUNKS.set_function(source)
+
+def registry():
+    """The registry to expose: an aggregate over all workers in multiprocess mode."""
+    if not MULTIPROC_DIR:
+        from prometheus_client import REGISTRY
+        return REGISTRY
+    aggregate = CollectorRegistry()
+    multiprocess.MultiProcessCollector(aggregate)
+    return aggregate
+
+def render() -> tuple:
+    if _collection_chunks_source is not None:
+        COLLECTION_CHUNKS.set(_collection_chunks_source())
+    return generate_latest(registry()), CONTENT_TYPE_LATEST
+
+def mark_process_dead() -> None:
+    """Drop this worker's live gauges (in-flight counts) from the aggregate on shutdown."""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
+
+def start_metrics_server(port: int = None) -> None:
+    """Also serve metrics on PROMETHEUS_PORT; with several workers only the first bind succeeds."""
+    port = port or int(os.environ.get("PROMETHEUS_PORT", 8001))
+    try:
+        start_http_server(port, registry=registry())
+        logger.info("Prometheus metrics server started", port=port)
+    except OSError as e:
+        logger.warning("Prometheus metrics server not started", port=port, error=str(e))
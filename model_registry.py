@@ -0,0 +1,131 @@
+import os
+import threading
+from dotenv import load_dotenv
+import structlog
+from embedding_cache import QueryEmbeddingCache
+from vector_cache import VectorCache, cache_dir_for
+
+load_dotenv()
+logger = structlog.get_logger()
+
+# Process-wide registry: one embedding model per name and one Chroma handle per
+# (path, collection), shared by Embedder and every Retriever instance.
+_lock = threading.RLock()
+_models = {}
+_stores = {}
+_memory = {}
+_query_caches = {}
+_vector_caches = {}
+
+def current_rss_bytes() -> int:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is the peak, in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _parameter_bytes(embeddings) -> int:
+    if hasattr(embeddings, "model_bytes"):
+        return embeddings.model_bytes
+    model = getattr(embeddings, "_client", None) or getattr(embeddings, "client", None)
+    if model is None or not hasattr(model, "parameters"):
+        return 0
+    return sum(p.numel() * p.element_size() for p in model.parameters())
+
+def _model_key(model_name: str = None, backend: str = None) -> tuple:
+    model_name = model_name or os.environ["EMBEDDING_MODEL"]
+    backend = (backend or os.environ.get("EMBEDDING_BACKEND", "torch")).lower()
+    return model_name, backend, model_name if backend == "torch" else f"{model_name} [{backend}]"
+
+def get_embeddings(model_name: str = None, backend: str = None):
+    """Shared embedding model; ``backend`` (EMBEDDING_BACKEND) is ``torch`` or ``onnx``."""
+    model_name, backend, key = _model_key(model_name, backend)
+    with _lock:
+        embeddings = _models.get(key)
+        if embeddings is None:
+            rss_before = current_rss_bytes()
+            if backend == "onnx":
+                from onnx_embeddings import OnnxEmbeddings
+                embeddings = OnnxEmbeddings(model_name)
+            elif backend == "torch":
+                # Heavy imports (torch, transformers) are paid on first use, not when this module loads
+                from langchain_huggingface import HuggingFaceEmbeddings
+                embeddings = HuggingFaceEmbeddings(model_name=model_name, model_kwargs={"device": "cpu"})
+            else:
+                raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+            _models[key] = embeddings
+            _memory[key] = {
+                "rss_delta_bytes": max(current_rss_bytes() - rss_before, 0),
+                "parameter_bytes": _parameter_bytes(embeddings),
+            }
+            logger.info("Embedding model loaded", model=model_name, backend=backend, **_memory[key])
+        return embeddings
+
+def query_batch_encoder(embeddings):
+    """Encode many queries in one call, giving exactly the vectors ``embed_query`` would.
+
+    Backends with a batched query path expose ``embed_queries``. For
+    HuggingFaceEmbeddings, queries and documents only differ through
+    ``query_encode_kwargs``, so without those ``embed_documents`` is the query
+    path. Anything else falls back to one ``embed_query`` call per text.
+    """
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries
+    if hasattr(embeddings, "encode_kwargs") and not getattr(embeddings, "query_encode_kwargs", None):
+        return embeddings.embed_documents
+    return lambda texts: [embeddings.embed_query(text) for text in texts]
+
+def get_query_embedding_cache(model_name: str = None, backend: str = None) -> QueryEmbeddingCache:
+    """Query-embedding LRU for one model; survives retriever swaps, a different model gets a fresh cache."""
+    key = _model_key(model_name, backend)[2]
+    with _lock:
+        if key not in _query_caches:
+            _query_caches[key] = QueryEmbeddingCache()
+        return _query_caches[key]
+
+def get_vector_cache(model_name: str = None, backend: str = None):
+    """On-disk chunk vector cache for one model, or None when VECTOR_CACHE_ENABLED is off."""
+    if os.environ.get("VECTOR_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    key = _model_key(model_name, backend)[2]
+    with _lock:
+        if key not in _vector_caches:
+            _vector_caches[key] = VectorCache(cache_dir_for(key))
+        return _vector_caches[key]
+
+def get_vector_store(persist_directory: str = None, collection_name: str = "docs", model_name: str = None):
+    persist_directory = persist_directory or os.environ["CHROMA_DB_PATH"]
+    key = (os.path.abspath(persist_directory), collection_name)
+    with _lock:
+        store = _stores.get(key)
+        if store is None:
+            from langchain_chroma import Chroma
+            store = Chroma(
+                persist_directory=persist_directory,
+                collection_name=collection_name,
+                embedding_function=get_embeddings(model_name)
+            )
+            _stores[key] = store
+        return store
+
+def release_vector_store(persist_directory: str, collection_name: str = "docs") -> None:
+    """Forget the cached handle of a retired index generation so its directory can be deleted."""
+    with _lock:
+        _stores.pop((os.path.abspath(persist_directory), collection_name), None)
+
+def memory_report() -> dict:
+    with _lock:
+        return {
+            "process_rss_bytes": current_rss_bytes(),
+            "models": {name: dict(stats) for name, stats in _memory.items()},
+            "vector_stores": [f"{path}:{collection}" for path, collection in _stores],
+            "query_embedding_caches": {name: cache.stats() for name, cache in _query_caches.items()},
+            "vector_caches": {name: cache.stats() for name, cache in _vector_caches.items()},
+        }
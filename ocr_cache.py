@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+import structlog
+
+load_dotenv()
+logger = structlog.get_logger()
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+def file_sha256(path: str) -> str:
+    """Hash a file in fixed-size blocks so large PDFs are never read whole."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class OCRCache:
+    """Persistent OCR result store keyed by file content hash, OCR model and extraction mode.
+
+    Entries live as one JSON file per key under ``<DOCS_PROCESSED_DIR>/ocr_cache``.
+    A manifest maps each source path to its key plus size/mtime, so unchanged
+    files are not re-hashed on every reindex. ``extraction`` names how pages
+    were produced besides the model (e.g. text-layer thresholds); changing it
+    misses the cache, while the empty default keeps pure-OCR keys unchanged.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, model: str = "mistral-ocr-latest", extraction: str = ""):
+        self.cache_dir = cache_dir or os.path.join(os.environ["DOCS_PROCESSED_DIR"], "ocr_cache")
+        self.model = model
+        self.extraction = extraction
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.manifest_path = os.path.join(self.cache_dir, "manifest.json")
+        self.manifest = self._load_manifest()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _load_manifest(self) -> Dict[str, Dict]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning("OCR cache manifest unreadable, starting empty", error=str(e))
+            return {}
+
+    def _write_json(self, path: str, data) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def key_for(self, pdf_path: str) -> str:
+        path = os.path.abspath(pdf_path)
+        st = os.stat(path)
+        with self._lock:
+            known = self.manifest.get(path)
+        if (known and known.get("size") == st.st_size and known.get("mtime_ns") == st.st_mtime_ns
+                and known.get("model") == self.model and known.get("extraction", "") == self.extraction):
+            return known["key"]
+        content_hash = file_sha256(path)
+        variant = f"{self.model}:{self.extraction}" if self.extraction else self.model
+        key = hashlib.sha256(f"{content_hash}:{variant}".encode("utf-8")).hexdigest()
+        with self._lock:
+            self.manifest[path] = {
+                "key": key,
+                "sha256": content_hash,
+                "model": self.model,
+                "extraction": self.extraction,
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+            }
+        return key
+
+    def get(self, pdf_path: str) -> Optional[List[Dict]]:
+        key = self.key_for(pdf_path)
+        try:
+            with open(self._entry_path(key), "r", encoding="utf-8") as f:
+                pages = json.load(f)["pages"]
+        except (FileNotFoundError, KeyError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return pages
+
+    def put(self, pdf_path: str, pages: List[Dict]) -> None:
+        # Failed or empty OCR results are not cached so the file is retried next time
+        if not pages:
+            return
+        key = self.key_for(pdf_path)
+        self._write_json(self._entry_path(key), {"model": self.model, "extraction": self.extraction, "pages": pages})
+
+    def evict_missing(self, existing_paths: List[str]) -> int:
+        """Drop manifest rows and cached results for files that no longer exist."""
+        existing = {os.path.abspath(p) for p in existing_paths}
+        with self._lock:
+            for path in list(self.manifest):
+                if path not in existing or not os.path.exists(path):
+                    del self.manifest[path]
+            live_keys = {entry["key"] for entry in self.manifest.values()}
+        evicted = 0
+        for fname in os.listdir(self.cache_dir):
+            if not fname.endswith(".json") or fname == "manifest.json":
+                continue
+            if fname[:-len(".json")] not in live_keys:
+                os.remove(os.path.join(self.cache_dir, fname))
+                evicted += 1
+        if evicted:
+            logger.info("Evicted stale OCR cache entries", evicted=evicted)
+        return evicted
+
+    def save(self) -> None:
+        with self._lock:
+            manifest = dict(self.manifest)
+        self._write_json(self.manifest_path, manifest)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "entries": len(self.manifest),
+            }
@@ -0,0 +1,148 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterable, Iterator, List, Dict
+from dotenv import load_dotenv
+import structlog
+
+load_dotenv()
+logger = structlog.get_logger()
+
+TRANSIENT_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+def is_transient_error(exc: Exception) -> bool:
+    """Rate limits, 5xx responses and network failures are worth retrying."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is not None:
+        return status in TRANSIENT_STATUS_CODES
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    # httpx transport errors (ConnectError, ReadTimeout, ...) without importing httpx
+    name = type(exc).__name__
+    return "Timeout" in name or "Connect" in name
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens/sec refilled up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float = None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Block until ``tokens`` are available; return the time spent waiting."""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            self.sleep(delay)
+            waited += delay
+
+class OCRPipeline:
+    """Run an OCR function over many files with bounded concurrency.
+
+    ``extract`` takes a file path (and, for files queued with a page subset,
+    the list of page indices to OCR) and returns its pages, raising on failure.
+    Calls are rate limited by a shared token bucket and transient failures are
+    retried with exponential backoff and jitter.
+    """
+
+    def __init__(
+        self,
+        extract: Callable[[str], List[Dict]],
+        workers: int = None,
+        rate_per_sec: float = None,
+        max_retries: int = None,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+        is_transient: Callable[[Exception], bool] = is_transient_error,
+        sleep=time.sleep,
+    ):
+        self.extract = extract
+        self.workers = workers or int(os.environ.get("OCR_WORKERS", 4))
+        rate = rate_per_sec if rate_per_sec is not None else float(os.environ.get("OCR_RATE_LIMIT", 2.0))
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get("OCR_MAX_RETRIES", 3))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.is_transient = is_transient
+        self.sleep = sleep
+        self.bucket = TokenBucket(rate, sleep=sleep)
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        with self._stats_lock:
+            self._stats = {"files": 0, "failed": 0, "pages": 0, "retries": 0, "rate_wait_s": 0.0, "elapsed_s": 0.0}
+
+    def _process(self, pdf_file: str, pages: List[int] = None) -> Dict:
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            waited = self.bucket.acquire()
+            with self._stats_lock:
+                self._stats["rate_wait_s"] += waited
+            try:
+                extracted = self.extract(pdf_file) if pages is None else self.extract(pdf_file, pages)
+                return {"file": pdf_file, "pages": extracted, "error": None, "attempts": attempt + 1,
+                        "elapsed_s": time.monotonic() - start}
+            except Exception as e:
+                if attempt >= self.max_retries or not self.is_transient(e):
+                    logger.error("OCR failed", file=pdf_file, attempts=attempt + 1, error=str(e))
+                    return {"file": pdf_file, "pages": [], "error": str(e), "attempts": attempt + 1,
+                            "elapsed_s": time.monotonic() - start}
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+                logger.warning("Transient OCR failure, retrying", file=pdf_file, attempt=attempt + 1, delay_s=round(delay, 2), error=str(e))
+                with self._stats_lock:
+                    self._stats["retries"] += 1
+                self.sleep(delay)
+                attempt += 1
+
+    def run(self, pdf_files: Iterable[str], page_subsets: Dict[str, List[int]] = None) -> Iterator[Dict]:
+        """Yield one result dict per file, in completion order.
+
+        Files in ``page_subsets`` only have the listed page indices extracted.
+        """
+        pdf_files = list(pdf_files)
+        if not pdf_files:
+            return
+        page_subsets = page_subsets or {}
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(pdf_files)), thread_name_prefix="ocr") as pool:
+            futures = [pool.submit(self._process, f, page_subsets.get(f)) for f in pdf_files]
+            try:
+                for future in as_completed(futures):
+                    result = future.result()
+                    with self._stats_lock:
+                        self._stats["files"] += 1
+                        self._stats["pages"] += len(result["pages"])
+                        self._stats["failed"] += result["error"] is not None
+                    yield result
+            finally:
+                # Consumer stopped early: don't start files that haven't begun
+                for future in futures:
+                    future.cancel()
+                with self._stats_lock:
+                    self._stats["elapsed_s"] += time.monotonic() - start
+        logger.info("OCR pipeline finished", **self.stats())
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["pages_per_sec"] = (stats["pages"] / stats["elapsed_s"]) if stats["elapsed_s"] else 0.0
+        return stats
@@ -0,0 +1,151 @@
+import os
+import time
+from typing import List
+import numpy as np
+from dotenv import load_dotenv
+import structlog
+
+load_dotenv()
+logger = structlog.get_logger()
+
+def mean_pool(token_embeddings: np.ndarray, attention_mask: np.ndarray, normalize: bool = True) -> np.ndarray:
+    """sentence-transformers pooling: mask-weighted mean over tokens, then L2 normalisation."""
+    mask = attention_mask[..., None].astype(np.float32)
+    summed = (token_embeddings * mask).sum(axis=1)
+    pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+    if normalize:
+        pooled /= np.linalg.norm(pooled, axis=1, keepdims=True) + 1e-12
+    return pooled
+
+def plan_batches(lengths: List[int], batch_size: int, max_batch_tokens: int) -> List[List[int]]:
+    """Group text indices of similar length so each padded batch stays under ``max_batch_tokens``."""
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches, current = [], []
+    for i in order:
+        # Sorted ascending, so the newest item sets the padded length of the batch
+        if current and (len(current) >= batch_size or (len(current) + 1) * lengths[i] > max_batch_tokens):
+            batches.append(current)
+            current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+def model_dir(model_name: str) -> str:
+    return os.path.join(os.environ.get("ONNX_MODEL_DIR", "models/onnx"), model_name.replace("/", "__"))
+
+def export_onnx(model_name: str, quantize: bool = True) -> str:
+    """Export ``model_name`` to ONNX once (needs torch + transformers) and optionally int8-quantize it."""
+    target_dir = model_dir(model_name)
+    fp32_path = os.path.join(target_dir, "model.onnx")
+    int8_path = os.path.join(target_dir, "model.int8.onnx")
+    path = int8_path if quantize else fp32_path
+    if os.path.exists(path):
+        return path
+    os.makedirs(target_dir, exist_ok=True)
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name).eval()
+        sample = tokenizer(["export sample"], return_tensors="pt")
+        names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+        dynamic = {n: {0: "batch", 1: "sequence"} for n in names}
+        dynamic["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        torch.onnx.export(
+            model, tuple(sample[n] for n in names), fp32_path,
+            input_names=names, output_names=["last_hidden_state"],
+            dynamic_axes=dynamic, opset_version=14,
+        )
+        logger.info("Exported ONNX embedding model", model=model_name, path=fp32_path)
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        logger.info("Quantized ONNX embedding model", model=model_name, path=int8_path,
+                    fp32_mb=round(os.path.getsize(fp32_path) / 2**20, 1), int8_mb=round(os.path.getsize(int8_path) / 2**20, 1))
+    return path
+
+class OnnxEmbeddings:
+    """CPU embedding backend on onnxruntime, drop-in for ``HuggingFaceEmbeddings``.
+
+    Runs the ONNX export of ``model_name`` (int8 dynamically quantized by
+    default) with mean pooling and normalisation matching sentence-transformers.
+    Texts are sorted by token length and packed into batches of at most
+    ``batch_size`` texts and ``max_batch_tokens`` padded tokens, so short
+    queries are not padded to the longest chunk.
+    """
+
+    def __init__(self, model_name: str = None, quantize: bool = None, threads: int = None,
+                 batch_size: int = None, max_batch_tokens: int = None, max_length: int = 256):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        self.model_name = model_name or os.environ["EMBEDDING_MODEL"]
+        self.quantize = quantize if quantize is not None else os.environ.get("ONNX_QUANTIZE", "true").lower() == "true"
+        self.threads = threads or int(os.environ.get("ONNX_INTRA_OP_THREADS", 0)) or min(os.cpu_count() or 1, 4)
+        self.batch_size = batch_size or int(os.environ.get("ONNX_BATCH_SIZE", 64))
+        self.max_batch_tokens = max_batch_tokens or int(os.environ.get("ONNX_MAX_BATCH_TOKENS", 8192))
+        self.max_length = max_length
+        self.model_path = export_onnx(self.model_name, self.quantize)
+        self.model_bytes = os.path.getsize(self.model_path)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        # One request at a time per session; parallelism comes from intra-op threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, use_fast=True)
+        logger.info("ONNX embedding backend ready", model=self.model_name, quantized=self.quantize,
+                    threads=self.threads, model_mb=round(self.model_bytes / 2**20, 1))
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(texts, truncation=True, max_length=self.max_length)
+        lengths = [len(ids) for ids in encoded["input_ids"]]
+        out = np.zeros((len(texts), 0), dtype=np.float32)
+        for batch in plan_batches(lengths, self.batch_size, self.max_batch_tokens):
+            padded = self.tokenizer.pad({k: [encoded[k][i] for i in batch] for k in encoded}, return_tensors="np")
+            feed = {k: padded[k].astype(np.int64) for k in padded if k in self.input_names}
+            hidden = self.session.run(None, feed)[0]
+            vectors = mean_pool(hidden, padded["attention_mask"])
+            if out.shape[1] == 0:
+                out = np.zeros((len(texts), vectors.shape[1]), dtype=np.float32)
+            out[batch] = vectors
+        return out
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # Queries and documents share one encoding path here
+        return self.embed_documents(texts)
+
+def parity_check(candidate, reference, texts: List[str], threshold: float = 0.99) -> dict:
+    """Cosine agreement between two embedding backends on the same texts."""
+    a = np.asarray(candidate.embed_documents(texts), dtype=np.float32)
+    b = np.asarray(reference.embed_documents(texts), dtype=np.float32)
+    a /= np.linalg.norm(a, axis=1, keepdims=True) + 1e-12
+    b /= np.linalg.norm(b, axis=1, keepdims=True) + 1e-12
+    cosine = (a * b).sum(axis=1)
+    report = {
+        "texts": len(texts),
+        "min_cosine": round(float(cosine.min()), 5),
+        "mean_cosine": round(float(cosine.mean()), 5),
+        "threshold": threshold,
+        "passed": bool(cosine.min() >= threshold),
+    }
+    logger.info("Embedding parity check", **report)
+    return report
+
+def throughput(embeddings, texts: List[str], repeats: int = 1) -> float:
+    """Sentences per second for ``embed_documents`` on ``texts``."""
+    embeddings.embed_documents(texts[:8])
+    start = time.perf_counter()
+    for _ in range(repeats):
+        embeddings.embed_documents(texts)
+    return len(texts) * repeats / (time.perf_counter() - start)
@@ -0,0 +1,319 @@
+import os
+import time
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import structlog
+from lexical_index import is_identifier_lookup
+
+load_dotenv()
+logger = structlog.get_logger()
+
+class StageTimeoutError(Exception):
+    """A query stage (embed, search, llm) exceeded its configured timeout."""
+
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(f"{stage} stage timed out after {timeout}s")
+        self.stage = stage
+        self.timeout = timeout
+
+class StageLimits:
+    """Per-stage concurrency limits and timeouts for the async query path.
+
+    Embedding and vector search are synchronous (sentence-transformers, Chroma)
+    and run on a bounded thread pool; the LLM call is awaited natively. Each
+    stage also has its own semaphore so a slow LLM cannot starve embedding.
+    """
+
+    STAGES = ("embed", "search", "llm")
+
+    def __init__(self, concurrency: dict = None, timeouts: dict = None, executor_workers: int = None):
+        self.concurrency = {
+            stage: int(os.environ.get(f"QUERY_{stage.upper()}_CONCURRENCY", default))
+            for stage, default in zip(self.STAGES, (4, 8, 32))
+        }
+        self.concurrency.update(concurrency or {})
+        self.timeouts = {
+            stage: float(os.environ.get(f"QUERY_{stage.upper()}_TIMEOUT", default))
+            for stage, default in zip(self.STAGES, (10, 10, 60))
+        }
+        self.timeouts.update(timeouts or {})
+        workers = executor_workers or int(os.environ.get("QUERY_EXECUTOR_WORKERS", self.concurrency["embed"] + self.concurrency["search"]))
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query")
+        self._semaphores = {}
+        self.in_flight = dict.fromkeys(self.STAGES, 0)
+
+    def _semaphore(self, stage: str) -> asyncio.Semaphore:
+        # Created lazily so they bind to the serving event loop, not the import-time one
+        loop = asyncio.get_running_loop()
+        key = (id(loop), stage)
+        if key not in self._semaphores:
+            self._semaphores[key] = asyncio.Semaphore(self.concurrency[stage])
+        return self._semaphores[key]
+
+    async def run(self, stage: str, awaitable_factory):
+        timeout = self.timeouts[stage]
+        async with self._semaphore(stage):
+            self.in_flight[stage] += 1
+            try:
+                return await asyncio.wait_for(awaitable_factory(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Query stage timed out", stage=stage, timeout_s=timeout)
+                raise StageTimeoutError(stage, timeout)
+            finally:
+                self.in_flight[stage] -= 1
+
+    @asynccontextmanager
+    async def slot(self, stage: str):
+        """Hold a concurrency slot for ``stage`` across a longer operation (e.g. a token stream)."""
+        async with self._semaphore(stage):
+            self.in_flight[stage] += 1
+            try:
+                yield
+            finally:
+                self.in_flight[stage] -= 1
+
+    async def run_sync(self, stage: str, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await self.run(stage, lambda: loop.run_in_executor(self.executor, lambda: fn(*args, **kwargs)))
+
+class SingleFlight:
+    """Coalesce concurrent identical requests into one execution.
+
+    The first caller for a key runs ``factory()`` as its own task; callers
+    with the same key arriving before it finishes await that task instead of
+    starting another, and get the same result (or exception). A caller that
+    is cancelled, e.g. on client disconnect, stops waiting without cancelling
+    the shared work. Shared results must be treated as read-only.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.counts = {"leaders": 0, "followers": 0}
+
+    async def do(self, key, factory):
+        """Returns (result, shared); ``shared`` is True for callers that joined an in-flight call."""
+        call_key = (id(asyncio.get_running_loop()), key)
+        task = self._calls.get(call_key)
+        shared = task is not None
+        if not shared:
+            task = asyncio.ensure_future(factory())
+            self._calls[call_key] = task
+            task.add_done_callback(lambda t: self._finish(call_key, t))
+        self.counts["followers" if shared else "leaders"] += 1
+        return await asyncio.shield(task), shared
+
+    def _finish(self, call_key, task) -> None:
+        if self._calls.get(call_key) is task:
+            del self._calls[call_key]
+        if not task.cancelled():
+            # Retrieve it so an error nobody is still waiting for is not reported as unhandled
+            task.exception()
+
+    def coalescing_ratio(self) -> float:
+        total = self.counts["leaders"] + self.counts["followers"]
+        return round(self.counts["followers"] / total, 4) if total else 0.0
+
+    def stats(self) -> dict:
+        return dict(self.counts, in_flight=len(self._calls), coalescing_ratio=self.coalescing_ratio())
+
+def _ms(start: float, end: float) -> float:
+    return round((end - start) * 1000, 1)
+
+def _sources(docs) -> list:
+    return [{"source": d["source"], "page": d["page"], "score": d["score"]} for d in docs]
+
+def _result(docs, answer, timings) -> dict:
+    return {"answer": answer, "sources": _sources(docs), "timings": timings}
+
+async def _offload(limits: StageLimits, fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(limits.executor, lambda: fn(*args))
+
+async def _lexical_lookup(retriever, questions: list, top_k: int, limits: StageLimits) -> dict:
+    """Answer pure identifier questions (e.g. "E-4071") from the lexical index, skipping embedding.
+
+    Returns {position: docs} for the questions that had lexical hits.
+    """
+    lookups = [i for i, q in enumerate(questions) if is_identifier_lookup(q)]
+    if not lookups:
+        return {}
+    found = await limits.run_sync("search", lambda: [retriever.lexical_search(questions[i], top_k) for i in lookups])
+    return {i: docs for i, docs in zip(lookups, found) if docs}
+
+async def aanswer_question(retriever, llm_client, question: str, top_k: int, limits: StageLimits, cache=None) -> dict:
+    """Embed once, search once with ``top_k`` and prompt the LLM with exactly those chunks.
+
+    Sync stages run on the executor under ``limits``; the LLM call is awaited.
+
+    With an :class:`answer_cache.AnswerCache`, the exact layer is checked before
+    embedding and the semantic layer right after it; the returned dict's
+    ``cache`` field is ``HIT``, ``SEMANTIC_HIT`` or ``MISS``. Identifier-only
+    questions are looked up lexically and never embedded.
+    """
+    t0 = time.perf_counter()
+    if cache is not None:
+        cached = await _offload(limits, cache.get_exact, question, top_k)
+        if cached is not None:
+            return dict(cached, timings={"cache_ms": _ms(t0, time.perf_counter())}, cache="HIT")
+    embedding, t1 = None, t0
+    docs = (await _lexical_lookup(retriever, [question], top_k, limits)).get(0)
+    if docs and cache is not None:
+        # No semantic lookup follows on the lexical path, so the exact miss is counted here
+        await _offload(limits, cache.record_miss)
+    if not docs:
+        embedding = await limits.run_sync("embed", retriever.embed_query, question)
+        t1 = time.perf_counter()
+        if cache is not None:
+            cached = await _offload(limits, cache.get_semantic, embedding, top_k)
+            if cached is not None:
+                return dict(cached, timings={"embed_ms": _ms(t0, t1), "cache_ms": _ms(t1, time.perf_counter())}, cache="SEMANTIC_HIT")
+            t1 = time.perf_counter()
+        docs = await limits.run_sync("search", retriever.search_by_vector, embedding, top_k=top_k, query=question)
+    t2 = time.perf_counter()
+    context, prompt_tokens = llm_client.prepare_context(question, docs)
+    answer = await limits.run("llm", lambda: llm_client.aquery(question, context))
+    t3 = time.perf_counter()
+    timings = {"embed_ms": _ms(t0, t1), "search_ms": _ms(t1, t2), "llm_ms": _ms(t2, t3), **prompt_tokens}
+    logger.info("Query answered", top_k=top_k, num_docs=len(docs), **timings)
+    result = _result(docs, answer, timings)
+    if cache is not None and answer != getattr(llm_client, "FAILED_ANSWER", None):
+        await _offload(limits, cache.put, question, top_k, embedding, {"answer": answer, "sources": result["sources"]},
+                       getattr(retriever, "generation", None))
+    result["cache"] = "MISS"
+    return result
+
+async def astream_answer(retriever, llm_client, question: str, top_k: int, limits: StageLimits, cache=None):
+    """Yield SSE events for a streamed answer: ``sources`` first, then ``token`` events, then ``done``.
+
+    Token data is JSON-encoded so whitespace and newlines survive SSE framing.
+    The ``done`` event carries stage timings plus ``ttft_ms`` (time to first
+    token) and ``total_ms``. A token gap longer than the llm stage timeout ends
+    the stream with an ``error`` event. If the consumer stops iterating (client
+    disconnect), the LLM stream is closed upstream.
+    """
+    t0 = time.perf_counter()
+    if cache is not None:
+        cached = await _offload(limits, cache.get_exact, question, top_k)
+        if cached is not None:
+            yield {"event": "sources", "data": json.dumps(cached["sources"])}
+            yield {"event": "token", "data": json.dumps(cached["answer"])}
+            total = _ms(t0, time.perf_counter())
+            yield {"event": "done", "data": json.dumps({"cache": "HIT", "ttft_ms": total, "total_ms": total})}
+            return
+        # Streaming has no semantic layer: an exact miss is the whole lookup
+        await _offload(limits, cache.record_miss)
+    embedding, t1 = None, t0
+    docs = (await _lexical_lookup(retriever, [question], top_k, limits)).get(0)
+    if not docs:
+        embedding = await limits.run_sync("embed", retriever.embed_query, question)
+        t1 = time.perf_counter()
+        docs = await limits.run_sync("search", retriever.search_by_vector, embedding, top_k=top_k, query=question)
+    t2 = time.perf_counter()
+    sources = _sources(docs)
+    yield {"event": "sources", "data": json.dumps(sources)}
+    context, prompt_tokens = llm_client.prepare_context(question, docs)
+
+    parts = []
+    ttft = None
+    timeout = limits.timeouts["llm"]
+    async with limits.slot("llm"):
+        tokens = llm_client.astream(question, context)
+        try:
+            while True:
+                try:
+                    token = await asyncio.wait_for(tokens.__anext__(), timeout=timeout)
+                except StopAsyncIteration:
+                    break
+                if ttft is None:
+                    ttft = _ms(t0, time.perf_counter())
+                parts.append(token)
+                yield {"event": "token", "data": json.dumps(token)}
+        except asyncio.TimeoutError:
+            logger.warning("LLM stream stalled", timeout_s=timeout)
+            yield {"event": "error", "data": f"llm stage timed out after {timeout}s"}
+            return
+        except Exception as e:
+            logger.error("GROQ streaming call failed", error=str(e))
+            yield {"event": "error", "data": getattr(llm_client, "FAILED_ANSWER", "LLM call failed.")}
+            return
+        finally:
+            await tokens.aclose()
+    t3 = time.perf_counter()
+    answer = "".join(parts)
+    timings = {"embed_ms": _ms(t0, t1), "search_ms": _ms(t1, t2), "llm_ms": _ms(t2, t3),
+               "ttft_ms": ttft if ttft is not None else _ms(t0, t3), "total_ms": _ms(t0, t3), **prompt_tokens}
+    logger.info("Streamed query answered", top_k=top_k, num_docs=len(docs), **timings)
+    if cache is not None and answer:
+        await _offload(limits, cache.put, question, top_k, embedding, {"answer": answer, "sources": sources},
+                       getattr(retriever, "generation", None))
+    yield {"event": "done", "data": json.dumps(dict(timings, cache="MISS"))}
+
+async def abatch_answer(retriever, llm_client, questions: list, top_k: int, limits: StageLimits, cache=None, llm_concurrency: int = None) -> dict:
+    """Answer many questions with one batched embedding call and one multi-query search.
+
+    LLM calls are dispatched concurrently, at most ``llm_concurrency`` at a time
+    for this batch (and still within the global llm stage limit). Results keep
+    the input order; a failing item carries ``error`` instead of failing the batch.
+    """
+    llm_concurrency = llm_concurrency or int(os.environ.get("QUERY_BATCH_LLM_CONCURRENCY", 8))
+    t0 = time.perf_counter()
+    results = [{"question": q, "answer": None, "sources": [], "error": None, "cache": "MISS", "timings": {}} for q in questions]
+    if cache is not None:
+        for item in results:
+            cached = await _offload(limits, cache.get_exact, item["question"], top_k)
+            if cached is not None:
+                item.update(answer=cached["answer"], sources=cached["sources"], cache="HIT")
+    todo = [i for i, item in enumerate(results) if item["cache"] == "MISS"]
+    tl = time.perf_counter()
+    found = await _lexical_lookup(retriever, [questions[i] for i in todo], top_k, limits)
+    lexical = [(todo[j], None, docs) for j, docs in found.items()]
+    if cache is not None:
+        for _ in lexical:
+            await _offload(limits, cache.record_miss)
+    todo = [i for j, i in enumerate(todo) if j not in found]
+    te = time.perf_counter()
+    embeddings = await limits.run_sync("embed", retriever.embed_queries, [questions[i] for i in todo]) if todo else []
+    t1 = time.perf_counter()
+    if cache is not None and todo:
+        remaining = []
+        for i, embedding in zip(todo, embeddings):
+            cached = await _offload(limits, cache.get_semantic, embedding, top_k)
+            if cached is not None:
+                results[i].update(answer=cached["answer"], sources=cached["sources"], cache="SEMANTIC_HIT")
+            else:
+                remaining.append((i, embedding))
+        todo, embeddings = [i for i, _ in remaining], [e for _, e in remaining]
+    t2 = time.perf_counter()
+    hits = await limits.run_sync("search", retriever.search_by_vectors, embeddings, top_k=top_k,
+                                 queries=[questions[i] for i in todo]) if todo else []
+    t3 = time.perf_counter()
+
+    batch_slots = asyncio.Semaphore(llm_concurrency)
+
+    async def answer_one(i, embedding, docs):
+        item = results[i]
+        item["sources"] = _sources(docs)
+        context, prompt_tokens = llm_client.prepare_context(item["question"], docs)
+        item["timings"].update(prompt_tokens)
+        start = time.perf_counter()
+        try:
+            async with batch_slots:
+                item["answer"] = await limits.run("llm", lambda: llm_client.aquery(item["question"], context))
+        except Exception as e:
+            item["error"] = str(e)
+        item["timings"]["llm_ms"] = _ms(start, time.perf_counter())
+        if item["error"] is None and item["answer"] == getattr(llm_client, "FAILED_ANSWER", None):
+            item["error"] = item["answer"]
+        elif item["error"] is None and cache is not None:
+            await _offload(limits, cache.put, item["question"], top_k, embedding, {"answer": item["answer"], "sources": item["sources"]},
+                           getattr(retriever, "generation", None))
+
+    await asyncio.gather(*(answer_one(i, e, d) for i, e, d in lexical + list(zip(todo, embeddings, hits))))
+    t4 = time.perf_counter()
+    timings = {"embed_ms": _ms(te, t1), "cache_ms": round(_ms(t0, tl) + _ms(t1, t2), 1), "search_ms": round(_ms(tl, te) + _ms(t2, t3), 1),
+               "llm_ms": _ms(t3, t4), "total_ms": _ms(t0, t4)}
+    logger.info("Batch answered", size=len(questions), cache_hits=len(questions) - len(todo) - len(lexical), **timings)
+    return {"results": results, "timings": timings}
@@ -1,40 +1,121 @@
 import os
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
 from dotenv import load_dotenv
 import structlog
+from model_registry import get_embeddings, get_query_embedding_cache, get_vector_store, query_batch_encoder
+from lexical_index import get_lexical_index, query_identifiers, reciprocal_rank_fusion
 
 load_dotenv()
 logger = structlog.get_logger()
 
 class Retriever:
-    def __init__(self):
+    def __init__(self, chroma_db_path: str = None, generation: str = None):
         model_name = os.environ["EMBEDDING_MODEL"]
-        self.embeddings = HuggingFaceEmbeddings(model_name=model_name, model_kwargs={"device": "cpu"})
-        self.chroma_db_path = os.environ["CHROMA_DB_PATH"]
+        # Model weights and the Chroma handle are shared process-wide
+        self.embeddings = get_embeddings(model_name)
+        self.query_cache = get_query_embedding_cache(model_name)
+        # Batched, but query-side: the cache holds embed_query vectors whichever path filled it
+        self.embed_query_batch = query_batch_encoder(self.embeddings)
+        self.chroma_db_path = chroma_db_path or os.environ["CHROMA_DB_PATH"]
+        # Published index generation this reader serves; returned to clients as index_version
+        self.generation = generation
         self.collection_name = "docs"
-        self.chroma = Chroma(
-            persist_directory=self.chroma_db_path,
-            collection_name=self.collection_name,
-            embedding_function=self.embeddings
-        )
+        self.chroma = get_vector_store(self.chroma_db_path, self.collection_name, model_name)
         self.retriever = self.chroma.as_retriever()
+        self.lexical = get_lexical_index(os.path.join(self.chroma_db_path, "lexical_index.pkl"))
+
+    def chunk_count(self) -> int:
+        return self.chroma._collection.count()
 
     def search(self, query: str, top_k: int = 5):
         return self.retriever.get_relevant_documents(query)[:top_k]
 
-    def search_with_relevance_scores(self, query: str, top_k: int = 5, score_threshold: float = None):
-        # Use Chroma's similarity_search_with_relevance_scores to get (doc, relevance_score) pairs in [0, 1]
-        kwargs = {}
-        if score_threshold is not None:
-            kwargs['score_threshold'] = score_threshold
-        docs_and_scores = self.chroma.similarity_search_with_relevance_scores(query, k=top_k, **kwargs)
+    def embed_query(self, query: str) -> list:
+        return self.query_cache.get_or_embed(query, self.embeddings.embed_query)
+
+    def search_by_vector(self, embedding: list, top_k: int = 5, score_threshold: float = None, query: str = None):
+        """Vector search with a precomputed query embedding; returns dicts with relevance scores in [0, 1].
+
+        Passing the ``query`` text fuses in lexical hits when it names identifiers.
+        """
+        docs_and_distances = self.chroma.similarity_search_by_vector_with_relevance_scores(embedding, k=top_k)
+        relevance_fn = self.chroma._select_relevance_score_fn()
         results = []
-        for doc, score in docs_and_scores:
+        for doc, distance in docs_and_distances:
+            score = relevance_fn(distance)
+            if score_threshold is not None and score < score_threshold:
+                continue
             source = doc.metadata.get("doc_id") or None
             results.append({
                 "content": doc.page_content,
                 "source": source,
+                "page": doc.metadata.get("page"),
                 "score": score
             })
+        return self.fuse(query, results, top_k) if query else results
+
+    def embed_queries(self, queries: list) -> list:
+        """Encode many questions in one batched call; cached questions are not re-encoded."""
+        return self.query_cache.get_or_embed_many(queries, self.embed_query_batch)
+
+    def search_by_vectors(self, embeddings: list, top_k: int = 5, queries: list = None) -> list:
+        """One multi-query Chroma search; returns one result list per query embedding."""
+        if not embeddings:
+            return []
+        response = self.chroma._collection.query(
+            query_embeddings=embeddings,
+            n_results=top_k,
+            include=["documents", "metadatas", "distances"],
+        )
+        relevance_fn = self.chroma._select_relevance_score_fn()
+        results = []
+        for docs, metas, distances in zip(response["documents"], response["metadatas"], response["distances"]):
+            results.append([
+                {
+                    "content": doc,
+                    "source": (meta or {}).get("doc_id") or None,
+                    "page": (meta or {}).get("page"),
+                    "score": relevance_fn(distance)
+                }
+                for doc, meta, distance in zip(docs, metas, distances)
+            ])
+        if queries:
+            results = [self.fuse(q, hits, top_k) for q, hits in zip(queries, results)]
         return results
+
+    def lexical_search(self, query: str, top_k: int = 5) -> list:
+        """BM25 lookup without embedding; scores are normalised to the best hit."""
+        hits = self.lexical.search(query, top_k)
+        if not hits:
+            return []
+        stored = self.chroma.get(ids=[cid for cid, _ in hits], include=["documents", "metadatas"])
+        by_id = dict(zip(stored["ids"], zip(stored["documents"], stored["metadatas"])))
+        best = hits[0][1]
+        results = []
+        for cid, score in hits:
+            if cid not in by_id:
+                continue
+            doc, meta = by_id[cid]
+            results.append({
+                "content": doc,
+                "source": (meta or {}).get("doc_id") or None,
+                "page": (meta or {}).get("page"),
+                "score": round(score / best, 4)
+            })
+        return results
+
+    def fuse(self, query: str, vector_results: list, top_k: int = 5) -> list:
+        """Reciprocal-rank fusion of vector and lexical hits for queries naming part numbers or codes."""
+        if not query_identifiers(query):
+            return vector_results[:top_k]
+        lexical_results = self.lexical_search(query, top_k)
+        if not lexical_results:
+            return vector_results[:top_k]
+        key = lambda d: (d["source"], d["page"], d["content"])
+        by_key = {key(d): d for d in lexical_results}
+        # Vector relevance scores are kept where a chunk was found by both
+        by_key.update({key(d): d for d in vector_results})
+        fused = reciprocal_rank_fusion([[key(d) for d in vector_results], [key(d) for d in lexical_results]])
+        return [by_key[k] for k, _ in fused[:top_k]]
+
+    def search_with_relevance_scores(self, query: str, top_k: int = 5, score_threshold: float = None):
+        return self.search_by_vector(self.embed_query(query), top_k=top_k, score_threshold=score_threshold, query=query)
@@ -21,6 +21,23 @@ def test_query_endpoint(setup_env):
     assert "sources" in data
     assert "latency_ms" in data
     assert isinstance(data["sources"], list)
+    assert set(data["timings"]) >= {"embed_ms", "search_ms", "llm_ms"}
+    assert "index_version" in data
+
+def test_query_stream_endpoint(setup_env):
+    with client.stream("POST", "/query/stream", json={"question": "How to calibrate X-axis encoder?", "top_k": 2}) as response:
+        assert response.status_code == 200
+        body = "".join(response.iter_text())
+    assert "event: sources" in body
+    assert "event: done" in body
+
+def test_query_batch_endpoint(setup_env):
+    questions = ["How to reset alarm E-4071?", "How to calibrate X-axis encoder?"]
+    response = client.post("/query/batch", json={"questions": questions, "top_k": 2})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["question"] for r in results] == questions
+    assert all("answer" in r and "error" in r for r in results)
 
 def test_admin_reindex_unauthorized():
     response = client.post("/admin/reindex")
@@ -29,7 +46,17 @@ def test_admin_reindex_unauthorized():
 def test_admin_reindex_authorized(setup_env):
     response = client.post("/admin/reindex", headers={"Authorization": "Bearer admin_secret"})
     assert response.status_code == 200
-    assert response.json()["status"] == "reindexed"
+    assert response.json()["status"] == "queued"
+    job_id = response.json()["job_id"]
+    response = client.get(f"/admin/jobs/{job_id}", headers={"Authorization": "Bearer admin_secret"})
+    assert response.status_code == 200
+    assert response.json()["status"] in ("queued", "running", "done")
+
+def test_health_probes():
+    assert client.get("/healthz").status_code == 200
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    assert "warmup_ms" in response.json()["phases"]
 
 def test_metrics():
     response = client.get("/metrics")
@@ -0,0 +1,88 @@
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+from answer_cache import AnswerCache, normalize_question
+
+RESPONSE = {"answer": "Tighten to 25 Nm.", "sources": [{"source": "mill", "page": 3, "score": 0.8}]}
+
+@pytest.fixture
+def cache():
+    return AnswerCache(fakeredis.FakeRedis(), ttl=60, max_entries=2, similarity=0.9)
+
+def test_normalize_question():
+    assert normalize_question("  What is the TORQUE\n spec? ") == "what is the torque spec"
+    # Coalescing and the exact cache agree: punctuation variants are one request
+    assert normalize_question("reset alarm?") == normalize_question("Reset  alarm")
+
+def test_exact_hit_ignores_case_and_whitespace(cache):
+    assert cache.get_exact("What is the torque spec?", 5) is None
+    cache.put("What is the torque spec?", 5, [1.0, 0.0], RESPONSE)
+    assert cache.get_exact("what is the  torque spec", 5) == RESPONSE
+    assert cache.get_exact("what is the torque spec", 3) is None
+
+def test_semantic_hit_within_threshold(cache):
+    cache.put("torque for spindle bolts", 5, [1.0, 0.0], RESPONSE)
+    assert cache.get_semantic([0.99, 0.05], 5) == RESPONSE
+    assert cache.get_semantic([0.5, 0.8], 5) is None
+    assert cache.get_semantic([0.99, 0.05], 3) is None
+    stats = cache.stats()
+    assert stats["semantic_hits"] == 1 and stats["misses"] == 2
+
+def test_invalidate_drops_entries(cache):
+    cache.put("q", 5, [1.0, 0.0], RESPONSE)
+    cache.invalidate()
+    assert cache.get_exact("q", 5) is None
+    assert cache.get_semantic([1.0, 0.0], 5) is None
+    assert cache.stats()["index_version"] == 1
+
+def test_lru_eviction(cache):
+    cache.put("a", 5, [1.0, 0.0], RESPONSE)
+    cache.put("b", 5, [0.0, 1.0], RESPONSE)
+    assert cache.get_exact("a", 5) == RESPONSE  # "b" is now least recently used
+    cache.put("c", 5, [0.7, 0.7], RESPONSE)
+    assert cache.get_exact("b", 5) is None
+    assert cache.get_exact("a", 5) == RESPONSE
+    assert cache.get_semantic([0.0, 1.0], 5) is None
+    assert cache.stats()["entries"] == 2
+
+def test_mirror_replays_only_new_log_entries():
+    server = fakeredis.FakeRedis()
+    writer = AnswerCache(server, ttl=60, max_entries=10, similarity=0.9)
+    reader = AnswerCache(server, ttl=60, max_entries=10, similarity=0.9)
+    writer.put("torque for spindle bolts", 5, [1.0, 0.0], RESPONSE)
+    assert reader.get_semantic([1.0, 0.0], 5) == RESPONSE
+    writer.put("coolant level", 5, [0.0, 1.0], RESPONSE)
+    # Wiping the snapshot hash proves the second entry reaches the reader through the log
+    server.delete("qa:v0:vectors")
+    assert reader.get_semantic([0.0, 1.0], 5) == RESPONSE
+    assert reader._mirror["cursor"] == 2 and len(reader._mirror["keys"]) == 2
+
+def test_mirror_follows_evictions_and_log_compaction():
+    server = fakeredis.FakeRedis()
+    writer = AnswerCache(server, ttl=60, max_entries=2, similarity=0.9)
+    reader = AnswerCache(server, ttl=60, max_entries=2, similarity=0.9)
+    writer.put("a", 5, [1.0, 0.0], RESPONSE)
+    assert reader.get_semantic([1.0, 0.0], 5) == RESPONSE
+    epoch = reader._mirror["epoch"]
+    for i, vector in enumerate([[0.0, 1.0], [0.7, 0.7], [0.6, -0.8]]):
+        writer.put(f"q{i}", 5, vector, RESPONSE)
+    assert reader.get_semantic([1.0, 0.0], 5) is None
+    assert reader.get_semantic([0.6, -0.8], 5) == RESPONSE
+    assert reader._mirror["epoch"] != epoch and server.llen("qa:v0:vectors_log") <= 2
+    assert len(reader._mirror["keys"]) == 2
+
+def test_generation_invalidates_once_across_workers():
+    server = fakeredis.FakeRedis()
+    workers = [AnswerCache(server, ttl=60, max_entries=10) for _ in range(3)]
+    workers[0].put("q", 5, [1.0, 0.0], RESPONSE)
+    assert [w.invalidate("g000002") for w in workers] == [True, False, False]
+    assert workers[1].stats()["index_version"] == 1 and workers[1].get_exact("q", 5) is None
+    # A worker that swaps late to an older generation doesn't move the cache back
+    assert workers[2].invalidate("g000001") is False
+    assert workers[2].invalidate("g000003") is True and workers[0].index_version() == 2
+
+def test_answers_from_a_retired_generation_are_not_cached(cache):
+    cache.invalidate("g000002")
+    cache.put("stale", 5, [1.0, 0.0], RESPONSE, generation="g000001")
+    cache.put("fresh", 5, [0.0, 1.0], RESPONSE, generation="g000002")
+    assert cache.get_exact("stale", 5) is None and cache.get_exact("fresh", 5) == RESPONSE
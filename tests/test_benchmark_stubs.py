@@ -0,0 +1,23 @@
+import os
+import pytest
+pytest.importorskip("pypdf")
+import pdf_ingest
+from benchmarks.corpus import generate_corpus, page_markdown
+from benchmarks.stubs import StubOCRClient
+
+def test_stub_ocr_returns_deterministic_corpus_pages(tmp_path):
+    corpus = generate_corpus(str(tmp_path), num_docs=2, pages_per_doc=3, seed=1)
+    assert len(corpus["files"]) == 2 and len(corpus["questions"]) == 4
+    ocr = StubOCRClient(latency=0.0)
+    pages = pdf_ingest.ocr_pdf(corpus["files"][1], ocr)
+    assert [p["page_number"] for p in pages] == [0, 1, 2]
+    assert pages[2]["content"] == page_markdown("1-1", 2)
+    assert pdf_ingest.ocr_pdf(corpus["files"][1], ocr) == pages
+    assert ocr.calls == 2
+
+def test_corpus_manifest_tracks_size_and_mtime(tmp_path):
+    generate_corpus(str(tmp_path), num_docs=2, pages_per_doc=1)
+    manifest = pdf_ingest.corpus_manifest(str(tmp_path))
+    assert sorted(manifest) == ["manual_0000.pdf", "manual_0001.pdf"]
+    os.utime(tmp_path / "manual_0000.pdf", ns=(1, 1))
+    assert pdf_ingest.corpus_manifest(str(tmp_path)) != manifest
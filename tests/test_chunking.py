@@ -0,0 +1,89 @@
+import random
+import pytest
+from chunking import Chunker
+
+PAGE = """# Spindle Maintenance
+
+Check the spindle bearings every 500 hours. Replace the grease cartridge if the temperature exceeds 60 C.
+
+## Torque Specifications
+
+| Bolt | Size | Torque |
+|------|------|--------|
+| A1 | M8x1.25 | 25 Nm |
+| A2 | M10x1.5 | 45 Nm |
+
+## Alarm E-4071
+
+Spindle overload. Reduce the feed rate and restart the cycle.
+"""
+
+def chunker(size, overlap=0):
+    return Chunker(chunk_size=size, overlap=overlap, tokenizer=None)
+
+def test_small_page_is_one_chunk_with_offsets():
+    chunks = chunker(500).split(PAGE)
+    assert len(chunks) == 1
+    assert chunks[0]["text"].startswith("# Spindle Maintenance")
+    assert PAGE[chunks[0]["start"]:chunks[0]["end"]].strip().endswith("restart the cycle.")
+
+def test_chunks_respect_size_and_keep_tables_and_headings():
+    c = chunker(60)
+    chunks = c.split(PAGE)
+    assert len(chunks) > 1
+    assert all(n <= 60 for n in c.count_tokens([ch["text"] for ch in chunks]))
+    table_chunks = [ch["text"] for ch in chunks if "| A1 |" in ch["text"]]
+    assert len(table_chunks) == 1 and "| A2 |" in table_chunks[0]
+    # Section heading travels with its content
+    assert "## Torque Specifications" in table_chunks[0]
+    assert any(ch["text"].startswith("## Alarm E-4071\n\nSpindle overload") for ch in chunks)
+    assert not any(ch["text"].rstrip().endswith("Specifications") for ch in chunks)
+
+def test_oversized_table_repeats_header():
+    rows = "\n".join(f"| B{i} | M6 | {i} Nm |" for i in range(30))
+    page = "| Bolt | Size | Torque |\n|---|---|---|\n" + rows
+    chunks = chunker(60).split(page)
+    assert len(chunks) > 1
+    assert all(ch["text"].startswith("| Bolt | Size | Torque |") for ch in chunks)
+    assert sum(ch["text"].count("| M6 |") for ch in chunks) == 30
+
+def test_long_paragraph_windows_overlap():
+    words = " ".join(f"w{i}" for i in range(300))
+    chunks = chunker(100, overlap=20).split(words)
+    assert len(chunks) == 4
+    first, second = chunks[0]["text"].split(), chunks[1]["text"].split()
+    assert first[-20:] == second[:20]
+
+def test_chunk_records_attach_metadata():
+    records = list(chunker(40).chunk_records([{"text": PAGE, "doc_id": "mill", "page": 3}]))
+    assert records and all(r["doc_id"] == "mill" and r["page"] == 3 for r in records)
+    assert all(r["end_offset"] > r["start_offset"] for r in records)
+
+def test_overlap_must_be_smaller_than_size():
+    with pytest.raises(ValueError):
+        Chunker(chunk_size=10, overlap=10, tokenizer=None)
+
+def test_carried_heading_never_pushes_chunk_over_size():
+    c = chunker(20)
+    chunks = c.split("# " + "w " * 15 + "\n\n" + "x " * 18)
+    assert c.count_tokens([ch["text"] for ch in chunks]) == [16, 18]
+
+def heading_heavy_page(rng):
+    blocks = []
+    for _ in range(rng.randint(1, 12)):
+        kind = rng.random()
+        if kind < 0.5:
+            blocks.append("#" * rng.randint(1, 4) + " " + " ".join(f"h{i}" for i in range(rng.randint(1, 30))))
+        elif kind < 0.8:
+            blocks.append(" ".join(rng.choice(["word", "spindle", "end."]) for _ in range(rng.randint(1, 60))))
+        else:
+            blocks.append("| a | b |\n|---|---|\n" + "\n".join(f"| {i} | v |" for i in range(rng.randint(1, 10))))
+    return "\n\n".join(blocks)
+
+def test_random_heading_heavy_pages_respect_size():
+    rng = random.Random(7)
+    for _ in range(500):
+        size = rng.randint(8, 60)
+        c = chunker(size, overlap=rng.randint(0, size - 1))
+        chunks = c.split(heading_heavy_page(rng))
+        assert all(n <= size for n in c.count_tokens([ch["text"] for ch in chunks]))
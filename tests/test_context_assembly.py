@@ -0,0 +1,30 @@
+from context_assembly import ContextAssembler, count_tokens
+
+HEADER = "WARNING: Lock out the machine and wear protective equipment before servicing."
+
+def doc(content, source="manual", page=1, score=0.5):
+    return {"content": content, "source": source, "page": page, "score": score}
+
+def test_orders_by_score_tags_and_strips_repeated_boilerplate():
+    docs = [
+        doc(f"{HEADER}\nReplace the coolant filter every 500 hours.", page=3, score=0.6),
+        doc(f"{HEADER}\nSpindle bearings need grease every 200 hours.", page=7, score=0.9),
+    ]
+    context, stats = ContextAssembler(token_budget=1000).assemble(docs)
+    assert context[0].startswith("[manual p.7]\n" + HEADER)
+    assert context[1] == "[manual p.3]\nReplace the coolant filter every 500 hours."
+    assert stats["chunks_kept"] == 2
+
+def test_drops_near_duplicates_and_respects_budget():
+    body = "Tighten the four M8 bolts on the spindle housing to 25 Nm in a star pattern and recheck after one hour."
+    docs = [doc(body, page=1, score=0.9), doc(body + " Done.", page=2, score=0.8)]
+    docs += [doc(f"Unrelated procedure {i} about lubrication intervals and oil grades for axis {i}.", page=10 + i, score=0.1) for i in range(20)]
+    assembler = ContextAssembler(token_budget=120)
+    context, stats = assembler.assemble(docs)
+    assert stats["duplicates_dropped"] == 1
+    assert stats["over_budget_dropped"] > 0
+    assert sum(count_tokens(c) for c in context) <= 120
+
+def test_truncates_single_oversized_chunk():
+    context, stats = ContextAssembler(token_budget=10).assemble([doc("word " * 100)])
+    assert len(context) == 1 and count_tokens(context[0]) == 10
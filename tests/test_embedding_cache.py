@@ -0,0 +1,40 @@
+from embedding_cache import QueryEmbeddingCache
+
+class CountingModel:
+    def __init__(self):
+        self.calls = []
+
+    def embed_query(self, text):
+        self.calls.append(text)
+        return [float(len(text)), 1.0]
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+def test_whitespace_and_case_variants_hit():
+    cache, model = QueryEmbeddingCache(max_entries=10), CountingModel()
+    first = cache.get_or_embed("Reset alarm  E-4071", model.embed_query)
+    assert cache.get_or_embed("  reset ALARM e-4071 ", model.embed_query) == first
+    assert model.calls == ["Reset alarm  E-4071"]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache, model = QueryEmbeddingCache(max_entries=2), CountingModel()
+    for q in ("a", "b", "a", "c"):
+        cache.get_or_embed(q, model.embed_query)
+    cache.get_or_embed("a", model.embed_query)
+    assert model.calls == ["a", "b", "c"]  # "b" was least recently used
+    assert cache.stats()["evictions"] == 1
+
+    small = QueryEmbeddingCache(max_entries=100, max_bytes=16)  # two float32 pairs
+    for q in ("x", "y", "z"):
+        small.get_or_embed(q, model.embed_query)
+    assert small.stats()["entries"] == 2 and small.stats()["bytes"] == 16
+
+def test_batch_embeds_only_missing_unique_questions():
+    cache, model = QueryEmbeddingCache(max_entries=10), CountingModel()
+    cache.get_or_embed("cached", model.embed_query)
+    vectors = cache.get_or_embed_many(["cached", "new one", "New  one", "other"], model.embed_documents)
+    assert model.calls[-1] == ["new one", "other"]
+    assert vectors[1] == vectors[2] and len(vectors) == 4
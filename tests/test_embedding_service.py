@@ -0,0 +1,131 @@
+import embedding_service
+from embedding_service import Embedder, iter_chunk_ids
+from vector_cache import VectorCache
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+class FakeStore:
+    """In-memory stand-in for the langchain Chroma handle, recording every write."""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.rows = {}
+        self.writes = []
+        self.deletes = []
+        # upsert_vectors writes through the underlying collection
+        self._collection = self
+
+    def add_texts(self, texts, metadatas=None, ids=None):
+        self.upsert(ids, self.embeddings.embed_documents(texts), texts, metadatas)
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.writes.append(list(ids))
+        for cid, vector, text, meta in zip(ids, embeddings, documents, metadatas):
+            self.rows[cid] = (text, meta, vector)
+
+    def get(self, ids=None, include=()):
+        ids = list(self.rows) if ids is None else [cid for cid in ids if cid in self.rows]
+        return {"ids": ids,
+                "documents": [self.rows[cid][0] for cid in ids],
+                "metadatas": [self.rows[cid][1] for cid in ids]}
+
+    def delete(self, ids=None, where=None):
+        if where is not None:
+            ids = [cid for cid, (_, meta, _) in self.rows.items() if meta.get("doc_id") == where["doc_id"]]
+        self.deletes.append(list(ids))
+        for cid in ids:
+            self.rows.pop(cid, None)
+
+def make_embedder(tmp_path, monkeypatch, store=None, cache=None):
+    embeddings = FakeEmbeddings()
+    store = store or FakeStore(embeddings)
+    monkeypatch.setenv("EMBEDDING_MODEL", "fake-model")
+    monkeypatch.setattr(embedding_service, "get_embeddings", lambda name: embeddings)
+    monkeypatch.setattr(embedding_service, "get_vector_store", lambda path, collection, name: store)
+    monkeypatch.setattr(embedding_service, "get_vector_cache", lambda name: cache)
+    return Embedder(str(tmp_path)), store
+
+def corpus(**docs):
+    return [{"doc_id": doc_id, "page": 1, "text": text} for doc_id, texts in docs.items() for text in texts]
+
+def test_unchanged_corpus_writes_nothing(tmp_path, monkeypatch):
+    docs = corpus(a=["alpha one", "alpha two"], b=["beta one"])
+    embedder, store = make_embedder(tmp_path, monkeypatch)
+    assert embedder.embed_stream(iter(docs))["added"] == 3
+    store.writes.clear()
+    # A fresh Embedder reads the saved manifest, as after a restart
+    embedder, _ = make_embedder(tmp_path, monkeypatch, store=store)
+    stats = embedder.embed_stream(iter(docs))
+    assert stats == {"added": 0, "deleted": 0, "unchanged": 3}
+    assert store.writes == [] and store.deletes == []
+    assert embedder.embeddings.calls == []
+
+def test_edited_file_replaces_only_its_own_chunks(tmp_path, monkeypatch):
+    embedder, store = make_embedder(tmp_path, monkeypatch)
+    embedder.embed_stream(iter(corpus(a=["alpha one", "alpha two"], b=["beta one"])))
+    b_ids = set(embedder.manifest["b"])
+    store.writes.clear()
+    stats = embedder.embed_stream(iter(corpus(a=["alpha one", "alpha 2"], b=["beta one"])))
+    assert stats == {"added": 1, "deleted": 1, "unchanged": 2}
+    assert [len(ids) for ids in store.writes] == [1] and store.writes[0][0].startswith("a:")
+    assert set(embedder.manifest["b"]) == b_ids and b_ids <= set(store.rows)
+    assert sorted(text for text, _, _ in store.rows.values()) == ["alpha 2", "alpha one", "beta one"]
+
+def test_removed_file_and_delete_document_drop_its_chunks(tmp_path, monkeypatch):
+    embedder, store = make_embedder(tmp_path, monkeypatch)
+    embedder.embed_stream(iter(corpus(a=["alpha one"], b=["beta one", "beta two"], c=["gamma"])))
+    stats = embedder.embed_stream(iter(corpus(a=["alpha one"], c=["gamma"])))
+    assert stats["deleted"] == 2 and "b" not in embedder.manifest
+    assert embedder.delete_document("c") == 1
+    assert list(embedder.manifest) == ["a"] and [t for t, _, _ in store.rows.values()] == ["alpha one"]
+    assert len(embedder.lexical) == 1
+
+def test_chunk_ids_are_stable_across_runs():
+    docs = corpus(a=["same text", "same text", "other"], b=["same text"])
+    first = [cid for cid, _ in iter_chunk_ids(iter(docs))]
+    assert first == [cid for cid, _ in iter_chunk_ids(iter(docs))]
+    # Repeated text on a page and across documents still gets distinct ids
+    assert len(set(first)) == 4
+    edited = [cid for cid, _ in iter_chunk_ids(iter(corpus(a=["same text", "same text", "changed"], b=["same text"])))]
+    assert [a == b for a, b in zip(first, edited)] == [True, True, False, True]
+
+def test_stream_commits_full_batches_then_the_remainder(tmp_path, monkeypatch):
+    embedder, store = make_embedder(tmp_path, monkeypatch)
+    committed = []
+    stats = embedder.embed_stream(iter(corpus(a=["t1", "t2", "t3", "t4", "t5"])), batch_size=2, on_batch=committed.append)
+    assert stats["added"] == 5
+    assert [len(ids) for ids in store.writes] == [2, 2, 1] and committed == [2, 4, 5]
+    assert [len(texts) for texts in embedder.embeddings.calls] == [2, 2, 1]
+
+def test_stream_is_consumed_lazily(tmp_path, monkeypatch):
+    embedder, store = make_embedder(tmp_path, monkeypatch)
+    pulled = []
+
+    def records():
+        for doc in corpus(a=["t1", "t2", "t3", "t4", "t5"]):
+            pulled.append(doc)
+            yield doc
+
+    # Each batch is written before the next records are read
+    seen_at_commit = []
+    embedder.embed_stream(records(), batch_size=2, on_batch=lambda added: seen_at_commit.append(len(pulled)))
+    assert seen_at_commit == [2, 4, 5]
+
+def test_cached_vectors_ride_along_without_encoding(tmp_path, monkeypatch):
+    cache = VectorCache(str(tmp_path / "vectors"))
+    docs = corpus(a=["t1", "t2", "t3"])
+    embedder, _ = make_embedder(tmp_path / "gen1", monkeypatch, cache=cache)
+    embedder.embed_stream(iter(docs), batch_size=2)
+    assert [len(texts) for texts in embedder.embeddings.calls] == [2, 1]
+    # A fresh generation re-adds every chunk, but nothing needs encoding and one write suffices
+    embedder, store = make_embedder(tmp_path / "gen2", monkeypatch, cache=cache)
+    stats = embedder.embed_stream(iter(docs + corpus(b=["t4"])), batch_size=2)
+    assert embedder.embeddings.calls == [["t4"]] and [len(ids) for ids in store.writes] == [4]
+    assert stats["vector_cache"]["hits"] == 3 and stats["vector_cache"]["misses"] == 1
+    assert store.rows[store.writes[0][0]][2] == [2.0, 1.0]
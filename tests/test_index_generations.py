@@ -0,0 +1,134 @@
+import os
+import time
+from index_generations import GenerationWatcher, IndexGenerations, _clone_file
+
+def write(path, name, text):
+    with open(os.path.join(path, name), "w") as f:
+        f.write(text)
+
+def read(path, name):
+    with open(os.path.join(path, name)) as f:
+        return f.read()
+
+def test_begin_copies_current_and_publish_moves_pointer(tmp_path):
+    gens = IndexGenerations(str(tmp_path))
+    assert gens.current() is None and gens.current_path() == str(tmp_path)
+    first = gens.begin()
+    write(gens.path(first), "chroma.sqlite3", "v1")
+    gens.publish(first)
+    assert gens.current() == first
+    second = gens.begin()
+    assert second > first and read(gens.path(second), "chroma.sqlite3") == "v1"
+    write(gens.path(second), "chroma.sqlite3", "v2")
+    # Unpublished builds are invisible to readers
+    assert gens.current() == first and read(gens.path(first), "chroma.sqlite3") == "v1"
+    gens.publish(second)
+    assert gens.current_path() == gens.path(second)
+
+def test_first_generation_adopts_unversioned_index(tmp_path):
+    write(str(tmp_path), "chroma.sqlite3", "legacy")
+    write(str(tmp_path), "corpus_manifest.json", "{}")
+    gens = IndexGenerations(str(tmp_path))
+    generation = gens.begin()
+    assert sorted(os.listdir(gens.path(generation))) == ["chroma.sqlite3"]
+
+def test_begin_removes_abandoned_builds(tmp_path):
+    gens = IndexGenerations(str(tmp_path))
+    gens.publish(gens.begin())
+    crashed = gens.begin()
+    write(gens.path(crashed), "half-written", "")
+    retry = gens.begin()
+    assert retry == crashed and os.listdir(gens.path(retry)) == []
+
+def test_gc_keeps_current_and_leased_generations(tmp_path):
+    gens = IndexGenerations(str(tmp_path), owner="w1")
+    old = gens.begin()
+    gens.publish(old)
+    leased = gens.begin()
+    gens.publish(leased)
+    gens.acquire_lease(leased)
+    current = gens.begin()
+    gens.publish(current)
+    assert gens.collect_garbage() == [old]
+    gens.release_lease(leased)
+    assert gens.collect_garbage() == [leased]
+    assert os.path.isdir(gens.path(current))
+
+def test_stale_lease_does_not_block_gc(tmp_path):
+    gens = IndexGenerations(str(tmp_path), lease_ttl=5, owner="crashed")
+    old = gens.begin()
+    gens.publish(old)
+    gens.acquire_lease(old)
+    expired = time.time() - 60
+    os.utime(gens._lease_path(old), (expired, expired))
+    gens.publish(gens.begin())
+    assert gens.collect_garbage() == [old]
+
+def test_gc_skipped_while_writer_holds_lock(tmp_path):
+    gens = IndexGenerations(str(tmp_path))
+    old = gens.begin()
+    gens.publish(old)
+    gens.publish(gens.begin())
+    with gens.writer_lock():
+        assert gens.collect_garbage() == []
+    assert gens.collect_garbage() == [old]
+
+def test_watcher_swaps_then_releases_after_grace(tmp_path):
+    gens = IndexGenerations(str(tmp_path), owner="w1")
+    first = gens.begin()
+    gens.publish(first)
+    swapped, released = [], []
+    watcher = GenerationWatcher(gens, swapped.append, released.append, interval=0.01, grace=0)
+    watcher.adopt(first)
+    assert watcher.check() is False and swapped == []
+    second = gens.begin()
+    gens.publish(second)
+    assert watcher.check() is True
+    assert swapped == [second] and released == [first] and watcher.active == second
+    assert not os.path.exists(gens.path(first))
+
+def test_watcher_keeps_old_generation_when_swap_fails(tmp_path):
+    gens = IndexGenerations(str(tmp_path), owner="w1")
+    first = gens.begin()
+    gens.publish(first)
+
+    def fail(generation):
+        raise RuntimeError("collection unreadable")
+
+    watcher = GenerationWatcher(gens, fail, interval=0.01, grace=0)
+    watcher.adopt(first)
+    gens.publish(gens.begin())
+    assert watcher.check() is False and watcher.active == first
+    assert os.path.exists(gens._lease_path(first))
+
+def test_clone_file_copies_contents_and_mode(tmp_path):
+    src = tmp_path / "src.bin"
+    src.write_bytes(b"x" * 100000)
+    os.chmod(src, 0o640)
+    _clone_file(str(src), str(tmp_path / "dst.bin"))
+    assert (tmp_path / "dst.bin").read_bytes() == src.read_bytes()
+    assert os.stat(tmp_path / "dst.bin").st_mode & 0o777 == 0o640
+
+def test_second_back_to_back_build_is_skipped_under_the_lock(tmp_path):
+    gens = IndexGenerations(str(tmp_path))
+    synced = tmp_path / "synced.json"
+    builds = []
+
+    def apply(generation):
+        builds.append(generation)
+        write(gens.path(generation), "chroma.sqlite3", "corpus v2")
+        return True, {"added": 1}
+
+    # Two workers queued the same reindex; the check and the record both happen under the writer lock
+    for _ in range(2):
+        result = gens.build(apply, skip=synced.exists, finish=lambda generation, stats: synced.write_text("v2"))
+    assert builds == [gens.current()] and result == (None, None)
+    assert os.listdir(os.path.join(str(tmp_path), "generations")) == builds
+
+def test_unchanged_build_is_discarded(tmp_path):
+    gens = IndexGenerations(str(tmp_path))
+    gens.publish(gens.begin())
+    discarded = []
+    generation, stats = gens.build(lambda g: (False, {"added": 0}), on_discard=discarded.append)
+    assert generation is None and stats == {"added": 0} and len(discarded) == 1
+    assert not os.path.exists(gens.path(discarded[0]))
@@ -0,0 +1,73 @@
+import threading
+import time
+from indexing_jobs import IndexJobQueue
+
+class RecordingRun:
+    def __init__(self, fail=False, hold=None):
+        self.calls = []
+        self.fail = fail
+        self.hold = hold
+
+    def __call__(self, delete_doc_ids, full_sync, progress):
+        self.calls.append((delete_doc_ids, full_sync))
+        progress("working")
+        if self.hold is not None:
+            self.hold.wait(2)
+        if self.fail:
+            raise RuntimeError("chroma unavailable")
+        return {"added": 1}
+
+def wait_done(queue, job_id, timeout=3):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if queue.get(job_id)["status"] in ("done", "failed"):
+            return queue.get(job_id)
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+def test_burst_is_coalesced_into_one_run():
+    run = RecordingRun()
+    queue = IndexJobQueue(run, coalesce_window=0.1)
+    queue.start()
+    jobs = [queue.submit("upload") for _ in range(5)] + [queue.submit("delete", doc_ids=["old"])]
+    for job in jobs:
+        assert wait_done(queue, job["id"])["status"] == "done"
+    queue.stop(1)
+    assert run.calls == [(["old"], True)]
+    assert queue.get(jobs[0]["id"])["batch_size"] == 6
+
+def test_delete_only_batch_skips_full_sync():
+    run = RecordingRun()
+    queue = IndexJobQueue(run, coalesce_window=0)
+    queue.start()
+    job = queue.submit("delete", doc_ids=["a"])
+    wait_done(queue, job["id"])
+    queue.stop(1)
+    assert run.calls == [(["a"], False)]
+
+def test_jobs_submitted_during_a_run_wait_for_the_next_one():
+    hold = threading.Event()
+    run = RecordingRun(hold=hold)
+    queue = IndexJobQueue(run, coalesce_window=0)
+    queue.start()
+    first = queue.submit("reindex")
+    while queue.get(first["id"])["status"] != "running":
+        time.sleep(0.01)
+    second, third = queue.submit("upload"), queue.submit("upload")
+    hold.set()
+    wait_done(queue, third["id"])
+    queue.stop(1)
+    assert len(run.calls) == 2
+    assert queue.get(second["id"])["batch_size"] == 2
+
+def test_failure_and_events_are_reported():
+    queue = IndexJobQueue(RecordingRun(fail=True), coalesce_window=0)
+    queue.start()
+    job = queue.submit("reindex")
+    done = wait_done(queue, job["id"])
+    queue.stop(1)
+    assert done["status"] == "failed" and done["error"] == "chroma unavailable"
+    events, cursor, finished = queue.events_since(job["id"], 0)
+    assert finished and cursor == len(events)
+    assert [e["event"] for e in events][-1] == "error"
+    assert {"event": "progress", "data": "working"} in events
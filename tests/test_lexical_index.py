@@ -0,0 +1,54 @@
+import time
+from lexical_index import LexicalIndex, is_identifier_lookup, reciprocal_rank_fusion, tokenize
+
+def test_tokenize_keeps_identifiers_whole():
+    terms = tokenize("Error E-4071 on the M8x1.25 bolt")
+    assert "e-4071" in terms and "m8x1.25" in terms
+    assert "4071" in terms and "the" not in terms
+
+def test_identifier_lookup_detection():
+    assert is_identifier_lookup("E-4071")
+    assert is_identifier_lookup("what is M8x1.25?")
+    assert not is_identifier_lookup("how do I reset alarm E-4071")
+    assert not is_identifier_lookup("spindle speed")
+
+def test_exact_identifier_ranks_first_and_updates_incrementally():
+    index = LexicalIndex()
+    index.add(["a", "b", "c"], [
+        "Alarm E-4071 means coolant pressure low.",
+        "Alarm E-4072 means door open. E-4071 is listed in chapter 3.",
+        "Tighten the M8x1.25 screw to 25 Nm.",
+    ])
+    assert index.search("E-4071", 3)[0][0] == "a"
+    assert index.search("M8x1.25", 3)[0][0] == "c"
+    index.remove(["a"])
+    assert [cid for cid, _ in index.search("E-4071", 3)] == ["b"]
+    index.add(["c"], ["Replaced text with SP-2000 spindle."])
+    assert index.search("M8x1.25", 3) == []
+    assert len(index) == 2
+
+def test_persistence_round_trip(tmp_path):
+    path = str(tmp_path / "lexical_index.pkl")
+    index = LexicalIndex(path)
+    index.add(["a", "b"], ["Part 123-456-A fits.", "Unrelated text."])
+    index.remove(["b"])
+    index.save()
+    reloaded = LexicalIndex(path)
+    assert len(reloaded) == 1
+    assert reloaded.search("123-456-A")[0][0] == "a"
+
+def test_rrf_prefers_items_found_by_both():
+    fused = reciprocal_rank_fusion([["x", "y", "z"], ["z", "w"]])
+    assert fused[0][0] == "z"
+
+def test_identifier_lookup_is_fast():
+    index = LexicalIndex()
+    n = 50000
+    index.add((f"c{i}" for i in range(n)),
+              (f"Section {i % 200} torque table for part P-{i:06d} and alarm E-{i % 9000}" for i in range(n)))
+    index.search("P-004242")
+    start = time.perf_counter()
+    for _ in range(100):
+        hits = index.search("P-004242", 5)
+    assert hits[0][0] == "c4242"
+    assert (time.perf_counter() - start) / 100 < 0.001
@@ -0,0 +1,29 @@
+import asyncio
+from benchmarks.stubs import StubLLMServer
+from llm_client import build_http_clients
+
+def completion(question):
+    return {"model": "stub", "messages": [{"role": "user", "content": f"Question: {question}"}]}
+
+def test_pool_caps_upstream_concurrency_and_reuses_connections():
+    with StubLLMServer(latency=0.05) as server:
+        sync_client, async_client = build_http_clients(max_connections=2, max_keepalive=2)
+
+        async def run():
+            async with async_client:
+                return await asyncio.gather(*(async_client.post(f"{server.url}/openai/v1/chat/completions", json=completion(i))
+                                              for i in range(8)))
+
+        responses = asyncio.run(run())
+        sync_client.close()
+    assert [r.json()["choices"][0]["message"]["content"] for r in responses][3] == "Stub answer to: 3"
+    assert server.requests == 8
+    assert server.peak_in_flight == 2
+    assert server.connections == 2
+
+def test_stub_server_streams_chunks():
+    with StubLLMServer(latency=0) as server:
+        sync_client, _ = build_http_clients()
+        with sync_client:
+            body = sync_client.post(f"{server.url}/openai/v1/chat/completions", json=dict(completion("q"), stream=True)).text
+    assert '"content": "Stub answer to: q"' in body and body.endswith("data: [DONE]\n\n")
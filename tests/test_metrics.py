@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+from prometheus_client import REGISTRY
+import metrics
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+def test_observe_query_records_count_and_stage_latencies():
+    before_count = sample("query_count_total", endpoint="query", status="ok", cache="MISS")
+    before_llm = sample("query_stage_seconds_count", stage="llm")
+    before_sum = sample("query_stage_seconds_sum", stage="llm")
+    metrics.observe_query("query", "ok", "MISS", {"embed_ms": 4.0, "llm_ms": 250.0, "prompt_tokens_after": 900}, 0.3)
+    assert sample("query_count_total", endpoint="query", status="ok", cache="MISS") == before_count + 1
+    assert sample("query_stage_seconds_count", stage="llm") == before_llm + 1
+    assert abs(sample("query_stage_seconds_sum", stage="llm") - before_sum - 0.25) < 1e-9
+    # Non-timing fields are not stages
+    assert REGISTRY.get_sample_value("query_stage_seconds_count", {"stage": "prompt_tokens_after"}) is None
+
+def test_in_flight_gauge_tracks_requests():
+    with metrics.QUERIES_IN_FLIGHT.track_inprogress():
+        assert sample("queries_in_flight") == 1
+    assert sample("queries_in_flight") == 0
+
+def test_cache_and_ingest_observers():
+    before = sample("cache_lookups_total", cache="answer", result="hit")
+    metrics.observe_cache("answer", "hit", hit_ratio=0.5, count=3)
+    assert sample("cache_lookups_total", cache="answer", result="hit") == before + 3
+    assert sample("cache_hit_ratio", cache="answer") == 0.5
+    pages = sample("ocr_pages_total")
+    metrics.observe_ocr(pages=4, pages_per_sec=2.0, local_pages=6)
+    assert sample("ocr_pages_total") == pages + 4 and sample("ocr_pages_per_second") == 2.0
+
+def test_render_reports_collection_size():
+    metrics.track_collection_chunks(lambda: 42)
+    body, content_type = metrics.render()
+    assert b"vector_collection_chunks 42.0" in body and content_type.startswith("text/plain")
+
+def test_multiprocess_mode_aggregates_workers(tmp_path):
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    worker = "import metrics; metrics.observe_query('query', 'ok', 'MISS', {'llm_ms': 100.0}, 0.2)"
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", worker], cwd=ROOT, env=env, check=True)
+    scrape = "import metrics; print(metrics.render()[0].decode())"
+    out = subprocess.run([sys.executable, "-c", scrape], cwd=ROOT, env=env, check=True, capture_output=True, text=True).stdout
+    assert 'query_count_total{cache="MISS",endpoint="query",status="ok"} 2.0' in out
+    assert 'query_stage_seconds_count{stage="llm"} 2.0' in out
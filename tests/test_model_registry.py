@@ -0,0 +1,86 @@
+import sys
+import types
+import pytest
+import model_registry
+
+class FakeModel:
+    instances = 0
+
+    def __init__(self, model_name, **kwargs):
+        FakeModel.instances += 1
+        self.model_name = model_name
+        self.model_bytes = 1024
+
+class FakeChroma:
+    def __init__(self, persist_directory, collection_name, embedding_function):
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
+        self.embedding_function = embedding_function
+
+@pytest.fixture
+def registry(monkeypatch):
+    for name in ("_models", "_stores", "_memory", "_query_caches", "_vector_caches"):
+        monkeypatch.setattr(model_registry, name, {})
+    monkeypatch.setitem(sys.modules, "langchain_huggingface", types.SimpleNamespace(HuggingFaceEmbeddings=FakeModel))
+    monkeypatch.setitem(sys.modules, "langchain_chroma", types.SimpleNamespace(Chroma=FakeChroma))
+    monkeypatch.setenv("EMBEDDING_MODEL", "model-a")
+    monkeypatch.delenv("EMBEDDING_BACKEND", raising=False)
+    FakeModel.instances = 0
+    return model_registry
+
+def test_repeated_lookups_share_one_instance(registry, tmp_path):
+    first = registry.get_embeddings()
+    assert registry.get_embeddings("model-a") is first and FakeModel.instances == 1
+    store = registry.get_vector_store(str(tmp_path))
+    assert registry.get_vector_store(str(tmp_path / ".")) is store
+    assert store.embedding_function is first
+    assert registry.get_query_embedding_cache() is registry.get_query_embedding_cache("model-a")
+
+def test_models_and_backends_get_separate_entries(registry, tmp_path, monkeypatch):
+    import onnx_embeddings
+    monkeypatch.setattr(onnx_embeddings, "OnnxEmbeddings", FakeModel)
+    torch_a = registry.get_embeddings("model-a")
+    assert registry.get_embeddings("model-b") is not torch_a
+    assert registry.get_embeddings("model-a", backend="onnx") is not torch_a
+    assert FakeModel.instances == 3
+    assert registry.get_query_embedding_cache("model-a") is not registry.get_query_embedding_cache("model-a", "onnx")
+    assert registry.get_vector_store(str(tmp_path), "docs") is not registry.get_vector_store(str(tmp_path), "other")
+    with pytest.raises(ValueError):
+        registry.get_embeddings("model-a", backend="tpu")
+
+def test_memory_report_lists_loaded_models(registry, tmp_path):
+    registry.get_embeddings("model-a")
+    registry.get_embeddings("model-b")
+    registry.get_vector_store(str(tmp_path))
+    report = registry.memory_report()
+    assert sorted(report["models"]) == ["model-a", "model-b"]
+    assert report["models"]["model-a"]["parameter_bytes"] == 1024
+    assert report["vector_stores"] == [f"{tmp_path}:docs"]
+    assert report["process_rss_bytes"] > 0
+
+def test_released_store_is_reopened(registry, tmp_path):
+    store = registry.get_vector_store(str(tmp_path))
+    registry.release_vector_store(str(tmp_path))
+    assert registry.get_vector_store(str(tmp_path)) is not store
+
+class AsymmetricModel:
+    """Query and document vectors differ, as with instruction-tuned models."""
+
+    encode_kwargs = {}
+    query_encode_kwargs = {"prompt": "query: "}
+
+    def embed_documents(self, texts):
+        return [[1.0, float(len(t))] for t in texts]
+
+    def embed_query(self, text):
+        return [0.0, float(len(text))]
+
+def test_query_batch_encoder_matches_embed_query(registry):
+    asymmetric = AsymmetricModel()
+    encode = registry.query_batch_encoder(asymmetric)
+    assert encode(["ab", "abc"]) == [asymmetric.embed_query("ab"), asymmetric.embed_query("abc")]
+    symmetric = AsymmetricModel()
+    symmetric.query_encode_kwargs = {}
+    assert registry.query_batch_encoder(symmetric) == symmetric.embed_documents
+    onnx = types.SimpleNamespace(embed_queries=lambda texts: texts)
+    assert registry.query_batch_encoder(onnx) is onnx.embed_queries
@@ -0,0 +1,53 @@
+import os
+from ocr_cache import OCRCache
+
+PAGES = [{"page_number": 0, "content": "# Spindle\nTorque 25 Nm"}]
+
+def write_pdf(path, data=b"%PDF-1.4\n%dummy\n%%EOF"):
+    path.write_bytes(data)
+    return str(path)
+
+def test_miss_then_hit_persists_across_instances(tmp_path):
+    pdf = write_pdf(tmp_path / "manual.pdf")
+    cache = OCRCache(cache_dir=str(tmp_path / "cache"))
+    assert cache.get(pdf) is None
+    cache.put(pdf, PAGES)
+    cache.save()
+    reopened = OCRCache(cache_dir=str(tmp_path / "cache"))
+    assert reopened.get(pdf) == PAGES
+    assert cache.stats()["misses"] == 1
+    assert reopened.stats()["hits"] == 1
+
+def test_changed_content_or_model_misses(tmp_path):
+    pdf = write_pdf(tmp_path / "manual.pdf")
+    cache = OCRCache(cache_dir=str(tmp_path / "cache"))
+    cache.put(pdf, PAGES)
+    assert OCRCache(cache_dir=str(tmp_path / "cache"), model="other-ocr").get(pdf) is None
+    write_pdf(tmp_path / "manual.pdf", b"%PDF-1.4\n%revised manual\n%%EOF")
+    assert cache.get(pdf) is None
+
+def test_empty_results_not_cached(tmp_path):
+    pdf = write_pdf(tmp_path / "manual.pdf")
+    cache = OCRCache(cache_dir=str(tmp_path / "cache"))
+    cache.put(pdf, [])
+    assert cache.get(pdf) is None
+
+def test_evict_missing_files(tmp_path):
+    keep = write_pdf(tmp_path / "keep.pdf", b"%PDF keep")
+    gone = write_pdf(tmp_path / "gone.pdf", b"%PDF gone")
+    cache = OCRCache(cache_dir=str(tmp_path / "cache"))
+    cache.put(keep, PAGES)
+    cache.put(gone, PAGES)
+    os.remove(gone)
+    assert cache.evict_missing([keep]) == 1
+    assert cache.get(keep) == PAGES
+    assert cache.stats()["entries"] == 1
+
+def test_extraction_mode_is_part_of_the_key(tmp_path):
+    pdf = write_pdf(tmp_path / "manual.pdf")
+    cache_dir = str(tmp_path / "cache")
+    OCRCache(cache_dir=cache_dir, extraction="text-layer:min_chars=100").put(pdf, PAGES)
+    assert OCRCache(cache_dir=cache_dir, extraction="text-layer:min_chars=100").get(pdf) == PAGES
+    # Same file, but pages produced with other thresholds or by OCR alone are a different entry
+    assert OCRCache(cache_dir=cache_dir, extraction="text-layer:min_chars=20").get(pdf) is None
+    assert OCRCache(cache_dir=cache_dir).get(pdf) is None
@@ -0,0 +1,85 @@
+import threading
+import time
+import pytest
+from ocr_pipeline import OCRPipeline, TokenBucket, is_transient_error
+
+class RateLimited(Exception):
+    status_code = 429
+
+class StubOCRClient:
+    """Local stand-in for the Mistral OCR client: fixed latency, scripted failures."""
+
+    def __init__(self, latency=0.02, failures=None):
+        self.latency = latency
+        self.failures = dict(failures or {})
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def extract(self, pdf_file):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            remaining = self.failures.get(pdf_file, [])
+            error = remaining.pop(0) if remaining else None
+        try:
+            time.sleep(self.latency)
+            if error:
+                raise error
+            return [{"page_number": i, "content": f"{pdf_file} page {i}"} for i in range(3)]
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+def make_pipeline(stub, **kwargs):
+    kwargs.setdefault("workers", 4)
+    kwargs.setdefault("rate_per_sec", 0)
+    kwargs.setdefault("max_retries", 2)
+    return OCRPipeline(stub.extract, backoff_base=0.001, **kwargs)
+
+def test_runs_files_concurrently_and_reports_throughput():
+    stub = StubOCRClient()
+    pipeline = make_pipeline(stub)
+    files = [f"doc{i}.pdf" for i in range(8)]
+    results = list(pipeline.run(files))
+    assert sorted(r["file"] for r in results) == files
+    assert 1 < stub.max_in_flight <= 4
+    stats = pipeline.stats()
+    assert stats["pages"] == 24
+    assert stats["pages_per_sec"] > 0
+
+def test_retries_transient_failures_only():
+    stub = StubOCRClient(failures={
+        "flaky.pdf": [RateLimited("slow down"), ConnectionError("reset")],
+        "broken.pdf": [ValueError("not a pdf")],
+    })
+    pipeline = make_pipeline(stub)
+    results = {r["file"]: r for r in pipeline.run(["flaky.pdf", "broken.pdf"])}
+    assert results["flaky.pdf"]["error"] is None
+    assert results["flaky.pdf"]["attempts"] == 3
+    assert results["broken.pdf"]["error"] == "not a pdf"
+    assert results["broken.pdf"]["attempts"] == 1
+    assert pipeline.stats()["retries"] == 2
+    assert pipeline.stats()["failed"] == 1
+
+def test_gives_up_after_max_retries():
+    stub = StubOCRClient(failures={"down.pdf": [RateLimited("busy")] * 5})
+    result, = make_pipeline(stub, max_retries=1).run(["down.pdf"])
+    assert result["error"] == "busy"
+    assert result["attempts"] == 2
+
+def test_token_bucket_limits_rate():
+    now = [0.0]
+    def sleep(s):
+        now[0] += s
+    bucket = TokenBucket(rate=2.0, capacity=1.0, clock=lambda: now[0], sleep=sleep)
+    for _ in range(5):
+        bucket.acquire()
+    assert now[0] == pytest.approx(2.0)
+
+def test_is_transient_error():
+    assert is_transient_error(RateLimited())
+    assert is_transient_error(TimeoutError())
+    assert not is_transient_error(ValueError())
@@ -0,0 +1,29 @@
+import numpy as np
+from onnx_embeddings import mean_pool, parity_check, plan_batches
+
+def test_mean_pool_ignores_padding():
+    hidden = np.array([[[1.0, 0.0], [3.0, 0.0], [100.0, 100.0]]], dtype=np.float32)
+    mask = np.array([[1, 1, 0]])
+    assert np.allclose(mean_pool(hidden, mask, normalize=False), [[2.0, 0.0]])
+    assert np.allclose(mean_pool(hidden, mask), [[1.0, 0.0]])
+
+def test_plan_batches_groups_by_length_under_token_budget():
+    lengths = [5, 200, 6, 190, 7, 8]
+    batches = plan_batches(lengths, batch_size=4, max_batch_tokens=400)
+    assert sorted(i for b in batches for i in b) == list(range(6))
+    for batch in batches:
+        assert len(batch) <= 4
+        assert len(batch) == 1 or len(batch) * max(lengths[i] for i in batch) <= 400
+    assert [0, 2, 4, 5] in batches
+
+def test_parity_check_reports_cosine():
+    class Fixed:
+        def __init__(self, vectors):
+            self.vectors = vectors
+
+        def embed_documents(self, texts):
+            return self.vectors
+
+    report = parity_check(Fixed([[1.0, 0.0], [0.0, 2.0]]), Fixed([[2.0, 0.1], [0.0, 1.0]]), ["a", "b"])
+    assert report["passed"] and report["min_cosine"] > 0.99
+    assert not parity_check(Fixed([[1.0, 0.0]]), Fixed([[0.0, 1.0]]), ["a"])["passed"]
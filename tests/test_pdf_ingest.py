@@ -0,0 +1,130 @@
+import base64
+import io
+import os
+import tracemalloc
+from types import SimpleNamespace
+import pytest
+
+pypdf = pytest.importorskip("pypdf")
+import pdf_ingest
+from ocr_cache import OCRCache
+
+class StubOCR:
+    """Stand-in for ``client.ocr``: returns one markdown page per PDF page in the request."""
+
+    def __init__(self):
+        self.requests = []
+
+    def process(self, model, document):
+        data = base64.b64decode(document["document_url"].split(",", 1)[1])
+        self.requests.append(len(data))
+        reader = pypdf.PdfReader(io.BytesIO(data))
+        pages = [SimpleNamespace(index=i, markdown=f"page {i} of segment") for i in range(len(reader.pages))]
+        return SimpleNamespace(pages=pages)
+
+def stub_client():
+    return SimpleNamespace(ocr=StubOCR())
+
+def write_pdf(path, num_pages):
+    writer = pypdf.PdfWriter()
+    for _ in range(num_pages):
+        writer.add_blank_page(width=200, height=200)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+def test_pdf_data_url_matches_single_shot_encoding(monkeypatch):
+    monkeypatch.setattr(pdf_ingest, "B64_BLOCK_SIZE", 3 * 7)
+    data = bytes(range(256)) * 5
+    url = pdf_ingest.pdf_data_url(data)
+    assert url == "data:application/pdf;base64," + base64.b64encode(data).decode()
+    assert pdf_ingest.b64_string(data) == base64.b64encode(data).decode()
+
+def test_pdf_data_url_holds_the_encoding_once(monkeypatch):
+    monkeypatch.setattr(pdf_ingest, "B64_BLOCK_SIZE", 3 * 64 * 1024)
+    data = os.urandom(8 * 2**20)
+    tracemalloc.start()
+    try:
+        url = pdf_ingest.pdf_data_url(data)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # One encoded copy plus a block's worth of slack, not a second full copy
+    assert peak < len(url) * 1.2
+
+def test_large_pdf_is_segmented_and_keeps_page_numbers(tmp_path, monkeypatch):
+    pdf = write_pdf(tmp_path / "big.pdf", 7)
+    monkeypatch.setattr(pdf_ingest, "OCR_SEGMENT_THRESHOLD_MB", 0)
+    monkeypatch.setattr(pdf_ingest, "OCR_SEGMENT_PAGES", 3)
+    client = stub_client()
+    pages = pdf_ingest.ocr_pdf(pdf, client)
+    assert [p["page_number"] for p in pages] == list(range(7))
+    assert len(client.ocr.requests) == 3
+
+def test_iter_ingest_serves_cache_hits_without_ocr(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    write_pdf(raw / "manual.pdf", 2)
+    cache = OCRCache(cache_dir=str(tmp_path / "cache"))
+    client = stub_client()
+    pipeline = pdf_ingest.build_ocr_pipeline(client, workers=2, rate_per_sec=0)
+    first = list(pdf_ingest.iter_ingest(str(raw), cache, pipeline))
+    second = list(pdf_ingest.iter_ingest(str(raw), cache, pipeline))
+    assert first == second
+    assert [d["doc_id"] for d in first] == ["manual", "manual"]
+    assert len(client.ocr.requests) == 1
+    assert cache.stats()["hits"] == 1
+
+LINE = "Tighten fastener BX-1234 to 40 Nm in a star pattern, then check torque."
+
+def write_mixed_pdf(path, text_pages):
+    """``text_pages`` is one entry per page: True for a born-digital page with a text layer, False for a blank (scan-like) one."""
+    from pypdf.generic import DictionaryObject, DecodedStreamObject, NameObject
+    writer = pypdf.PdfWriter()
+    font = writer._add_object(DictionaryObject({NameObject("/Type"): NameObject("/Font"), NameObject("/Subtype"): NameObject("/Type1"),
+                                                NameObject("/BaseFont"): NameObject("/Helvetica")}))
+    for i, has_text in enumerate(text_pages):
+        page = writer.add_blank_page(width=612, height=792)
+        if has_text:
+            page[NameObject("/Resources")] = DictionaryObject({NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})})
+            stream = DecodedStreamObject()
+            stream.set_data(f"BT /F1 10 Tf 72 720 Td (Page {i}: {LINE}) Tj 0 -14 Td ({LINE}) Tj ET".encode())
+            page[NameObject("/Contents")] = writer._add_object(stream)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+def test_text_layer_issue_scores_pages():
+    assert pdf_ingest.text_layer_issue(LINE * 3, has_images=False) is None
+    assert pdf_ingest.text_layer_issue("Fig. 3", has_images=True) == "image_only"
+    assert pdf_ingest.text_layer_issue("", has_images=False) == "too_little_text"
+    assert pdf_ingest.text_layer_issue(LINE * 3 + "\ufffd" * 20, has_images=False) == "garbage"
+
+def test_only_pages_without_text_layer_go_to_ocr(tmp_path):
+    pdf = write_mixed_pdf(tmp_path / "mixed.pdf", [True, False, True, False])
+    client = stub_client()
+    pages = pdf_ingest.extract_pdf(pdf, client)
+    assert [p["page_number"] for p in pages] == [0, 1, 2, 3]
+    assert set(pages[0]) == {"page_number", "content"} and pages[2]["content"].startswith("Page 2: Tighten")
+    # The two scan-like pages are sent as one sub-PDF and mapped back to pages 1 and 3
+    assert len(client.ocr.requests) == 1
+    assert [pages[1]["content"], pages[3]["content"]] == ["page 0 of segment", "page 1 of segment"]
+
+def test_iter_ingest_skips_ocr_for_born_digital_files(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    write_mixed_pdf(raw / "digital.pdf", [True, True])
+    write_mixed_pdf(raw / "scanned.pdf", [False])
+    client = stub_client()
+    pipeline = pdf_ingest.build_ocr_pipeline(client, workers=2, rate_per_sec=0)
+    records = list(pdf_ingest.iter_ingest(str(raw), OCRCache(cache_dir=str(tmp_path / "cache")), pipeline))
+    assert sorted((r["doc_id"], r["page"]) for r in records) == [("digital", 0), ("digital", 1), ("scanned", 0)]
+    assert len(client.ocr.requests) == 1
+    assert pipeline.stats()["pages"] == 1
+
+def test_extraction_mode_tracks_text_layer_settings(monkeypatch):
+    mode = pdf_ingest.extraction_mode()
+    monkeypatch.setattr(pdf_ingest, "LOCAL_TEXT_MIN_CHARS", 20)
+    assert pdf_ingest.extraction_mode() not in (mode, "")
+    monkeypatch.setattr(pdf_ingest, "LOCAL_TEXT_ENABLED", False)
+    assert pdf_ingest.extraction_mode() == ""
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import time
+import pytest
+from benchmarks.stubs import StubChatModel
+from context_assembly import ContextAssembler, count_tokens
+from query_service import SingleFlight, StageLimits, StageTimeoutError, aanswer_question, abatch_answer, astream_answer
+
+class FakeRetriever:
+    def __init__(self, embed_latency=0.0):
+        self.embed_latency = embed_latency
+
+    def embed_query(self, query):
+        time.sleep(self.embed_latency)
+        return [0.1, 0.2]
+
+    def search_by_vector(self, embedding, top_k=5, query=None):
+        return [{"content": f"chunk {i}", "source": "manual", "page": i, "score": 0.9} for i in range(top_k)]
+
+    def lexical_search(self, query, top_k=5):
+        self.lexical_calls = getattr(self, "lexical_calls", 0) + 1
+        return [{"content": f"{query} spec", "source": "parts", "page": 1, "score": 1.0}]
+
+    def embed_queries(self, queries):
+        self.batch_calls = getattr(self, "batch_calls", 0) + 1
+        return [[0.1, float(i)] for i in range(len(queries))]
+
+    def search_by_vectors(self, embeddings, top_k=5, queries=None):
+        self.multi_searches = getattr(self, "multi_searches", 0) + 1
+        return [self.search_by_vector(e, top_k) for e in embeddings]
+
+class StubLLMClient:
+    def __init__(self, latency):
+        self.llm = StubChatModel(latency)
+        self.context_assembler = ContextAssembler()
+
+    def prepare_context(self, prompt, docs):
+        context, _ = self.context_assembler.assemble(docs)
+        before = count_tokens(prompt + "".join(d["content"] for d in docs))
+        return context, {"prompt_tokens_before": before, "prompt_tokens_after": count_tokens(prompt + "".join(context))}
+
+    async def aquery(self, prompt, context):
+        return (await self.llm.ainvoke(f"Question: {prompt}")).content
+
+    async def astream(self, prompt, context):
+        stream = self.llm.astream(f"Question: {prompt}")
+        try:
+            async for chunk in stream:
+                yield chunk.content
+        finally:
+            await stream.aclose()
+
+def test_concurrent_queries_overlap_llm_waits():
+    limits = StageLimits(concurrency={"llm": 10})
+    retriever, llm = FakeRetriever(), StubLLMClient(latency=0.2)
+
+    async def run():
+        return await asyncio.gather(*(aanswer_question(retriever, llm, f"q{i}", 2, limits) for i in range(10)))
+
+    start = time.perf_counter()
+    results = asyncio.run(run())
+    assert time.perf_counter() - start < 1.0  # serial would take 2s
+    assert results[3]["answer"] == "Stub answer to: q3"
+    assert len(results[0]["sources"]) == 2
+    assert set(results[0]["timings"]) == {"embed_ms", "search_ms", "llm_ms", "prompt_tokens_before", "prompt_tokens_after"}
+
+def test_llm_concurrency_limit_serialises_calls():
+    limits = StageLimits(concurrency={"llm": 1})
+    retriever, llm = FakeRetriever(), StubLLMClient(latency=0.05)
+
+    async def run():
+        await asyncio.gather(*(aanswer_question(retriever, llm, "q", 1, limits) for _ in range(4)))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    assert time.perf_counter() - start >= 0.2
+
+def test_stage_timeout():
+    limits = StageLimits(timeouts={"llm": 0.05})
+    with pytest.raises(StageTimeoutError) as exc:
+        asyncio.run(aanswer_question(FakeRetriever(), StubLLMClient(latency=1), "q", 1, limits))
+    assert exc.value.stage == "llm"
+
+def test_stream_sends_sources_then_tokens_then_done():
+    llm = StubLLMClient(latency=0.05)
+
+    async def run():
+        return [e async for e in astream_answer(FakeRetriever(), llm, "torque", 2, StageLimits())]
+
+    events = asyncio.run(run())
+    assert events[0]["event"] == "sources" and len(json.loads(events[0]["data"])) == 2
+    tokens = [json.loads(e["data"]) for e in events if e["event"] == "token"]
+    assert "".join(tokens) == "Stub answer to: torque"
+    done = json.loads(events[-1]["data"])
+    assert events[-1]["event"] == "done"
+    assert 0 < done["ttft_ms"] <= done["total_ms"]
+
+def test_stream_consumer_disconnect_closes_upstream():
+    llm = StubLLMClient(latency=0.0)
+    llm.llm.token_latency = 0.05
+
+    async def run():
+        stream = astream_answer(FakeRetriever(), llm, "a long question with many words", 1, StageLimits())
+        async for event in stream:
+            if event["event"] == "token":
+                break
+        await stream.aclose()
+
+    asyncio.run(run())
+    assert llm.llm.streams_closed == 1
+    assert llm.llm.tokens_sent == 1
+
+def test_batch_embeds_and_searches_once_and_keeps_order():
+    retriever = FakeRetriever()
+
+    class FlakyLLM(StubLLMClient):
+        async def aquery(self, prompt, context):
+            if prompt == "bad":
+                raise RuntimeError("upstream 500")
+            return await super().aquery(prompt, context)
+
+    questions = [f"alarm {i}" for i in range(20)] + ["bad"]
+    result = asyncio.run(abatch_answer(retriever, FlakyLLM(latency=0.05), questions, 2, StageLimits(), llm_concurrency=10))
+    assert retriever.batch_calls == 1 and retriever.multi_searches == 1
+    assert [r["question"] for r in result["results"]] == questions
+    assert result["results"][4]["answer"] == "Stub answer to: alarm 4"
+    assert result["results"][-1]["error"] == "upstream 500"
+    assert all("llm_ms" in r["timings"] for r in result["results"])
+    assert result["timings"]["llm_ms"] < 500  # 21 calls, 10 at a time
+
+def test_identifier_query_skips_embedding():
+    class NoEmbedRetriever(FakeRetriever):
+        def embed_query(self, query):
+            raise AssertionError("identifier lookups must not embed")
+
+    retriever = NoEmbedRetriever()
+    result = asyncio.run(aanswer_question(retriever, StubLLMClient(latency=0.0), "E-4071", 3, StageLimits()))
+    assert retriever.lexical_calls == 1
+    assert result["sources"] == [{"source": "parts", "page": 1, "score": 1.0}]
+    assert result["timings"]["embed_ms"] == 0.0
+
+    batch = asyncio.run(abatch_answer(retriever, StubLLMClient(latency=0.0), ["M8x1.25", "how do I reset the spindle"], 2, StageLimits()))
+    assert retriever.batch_calls == 1
+    assert batch["results"][0]["sources"][0]["source"] == "parts"
+    assert batch["results"][1]["sources"][0]["source"] == "manual"
+
+def test_identical_concurrent_queries_share_one_llm_call():
+    limits, flights = StageLimits(), SingleFlight()
+    retriever, llm = FakeRetriever(), StubLLMClient(latency=0.1)
+
+    async def ask(question):
+        return await flights.do((question, 2), lambda: aanswer_question(retriever, llm, question, 2, limits))
+
+    async def run():
+        return await asyncio.gather(*(ask("how to reset?" if i < 8 else "other?") for i in range(10)))
+
+    results = asyncio.run(run())
+    assert llm.llm.calls == 2
+    assert [shared for _, shared in results].count(True) == 8
+    assert results[5][0] is results[0][0]
+    assert flights.stats() == {"leaders": 2, "followers": 8, "in_flight": 0, "coalescing_ratio": 0.8}
+    # Once finished, the same question runs again instead of reusing a stale result
+    asyncio.run(ask("how to reset?"))
+    assert llm.llm.calls == 3
+
+def test_cancelled_leader_does_not_cancel_followers():
+    flights = SingleFlight()
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def run():
+        leader = asyncio.ensure_future(flights.do("q", work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("q", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(run()) == ("answer", True)
+    assert runs == [1]
+
+class CountingCache:
+    def __init__(self):
+        self.misses = 0
+        self.semantic_lookups = 0
+
+    def get_exact(self, question, top_k):
+        return None
+
+    def get_semantic(self, embedding, top_k):
+        self.semantic_lookups += 1
+        self.misses += 1
+        return None
+
+    def record_miss(self):
+        self.misses += 1
+
+    def put(self, *args):
+        pass
+
+def test_lexical_and_streamed_misses_are_counted():
+    limits = StageLimits()
+    retriever, llm, cache = FakeRetriever(), StubLLMClient(latency=0), CountingCache()
+
+    async def run():
+        await aanswer_question(retriever, llm, "E-4071", 2, limits, cache=cache)
+        await aanswer_question(retriever, llm, "how do I reset the alarm", 2, limits, cache=cache)
+        [event async for event in astream_answer(retriever, llm, "how do I reset the alarm", 2, limits, cache=cache)]
+        await abatch_answer(retriever, llm, ["E-4071", "A-12", "what is the torque"], 2, limits, cache=cache)
+
+    asyncio.run(run())
+    # One miss per lookup, whichever path answered it
+    assert cache.misses == 6 and cache.semantic_lookups == 2
@@ -0,0 +1,74 @@
+import os
+import numpy as np
+import pytest
+from vector_cache import CachedEmbeddings, VectorCache, cache_dir_for, text_key
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0, 0.5] for t in texts]
+
+    def embed_query(self, text):
+        return [0.0, 0.0, 1.0]
+
+def test_only_misses_are_encoded_once(tmp_path):
+    model = CountingEmbeddings()
+    cached = CachedEmbeddings(model, VectorCache(str(tmp_path)))
+    assert cached.embed_documents(["alpha", "beta"]) == [[5.0, 1.0, 0.5], [4.0, 1.0, 0.5]]
+    assert cached.embed_documents(["beta", "gamma", "gamma", "alpha"])[1:3] == [[5.0, 1.0, 0.5]] * 2
+    assert model.calls == [["alpha", "beta"], ["gamma"]]
+    stats = cached.cache.stats()
+    assert stats["entries"] == 3 and stats["hits"] == 2 and stats["misses"] == 4
+    assert stats["disk_bytes"] == 3 * (3 * 4 + 16)
+
+def test_vectors_persist_across_reopen(tmp_path):
+    VectorCache(str(tmp_path)).put_many([text_key("a"), text_key("b")], [[1, 2], [3, 4]])
+    cache = VectorCache(str(tmp_path))
+    a, missing, b = cache.get_many([text_key("a"), text_key("zz"), text_key("b")])
+    assert missing is None
+    np.testing.assert_array_equal(a, [1, 2])
+    np.testing.assert_array_equal(b, [3, 4])
+
+def test_float16_halves_vector_bytes(tmp_path):
+    cache = VectorCache(str(tmp_path), dtype="float16")
+    cache.put_many([text_key("a")], [[0.1, 0.2, 0.3, 0.4]])
+    assert os.path.getsize(cache.vectors_path) == 8
+    np.testing.assert_allclose(cache.get_many([text_key("a")])[0], [0.1, 0.2, 0.3, 0.4], atol=1e-3)
+    # A different dtype setting starts a fresh cache instead of misreading rows
+    assert len(VectorCache(str(tmp_path), dtype="float32")) == 0
+
+def test_torn_append_is_truncated_on_open(tmp_path):
+    cache = VectorCache(str(tmp_path))
+    cache.put_many([text_key("a")], [[1.0, 2.0]])
+    with open(cache.vectors_path, "ab") as f:
+        f.write(np.zeros(2, dtype=np.float32).tobytes())
+    reopened = VectorCache(str(tmp_path))
+    assert len(reopened) == 1 and os.path.getsize(reopened.vectors_path) == 8
+
+def test_dimension_mismatch_is_rejected(tmp_path):
+    cache = VectorCache(str(tmp_path))
+    cache.put_many([text_key("a")], [[1.0, 2.0]])
+    with pytest.raises(ValueError):
+        cache.put_many([text_key("b")], [[1.0, 2.0, 3.0]])
+
+def test_models_get_separate_directories(tmp_path):
+    root = str(tmp_path)
+    assert cache_dir_for("all-MiniLM-L6-v2", root) != cache_dir_for("all-MiniLM-L6-v2 [onnx]", root)
+
+def test_instances_sharing_a_directory_see_each_others_rows(tmp_path):
+    # One instance per worker process; index jobs may run in any of them
+    a, b = VectorCache(str(tmp_path)), VectorCache(str(tmp_path))
+    a.put_many([text_key("x")], [[1, 0]])
+    b.put_many([text_key("y")], [[0, 1]])
+    np.testing.assert_array_equal(b.get_many([text_key("y")])[0], [0, 1])
+    x, y = a.get_many([text_key("x"), text_key("y")])
+    np.testing.assert_array_equal(x, [1, 0])
+    np.testing.assert_array_equal(y, [0, 1])
+    assert text_key("y") in a and len(a) == 2
+    # Rows one instance already wrote are not appended again by the other
+    a.put_many([text_key("y")], [[0, 1]])
+    assert os.path.getsize(a.keys_path) == 2 * 16
+    np.testing.assert_array_equal(VectorCache(str(tmp_path)).get_many([text_key("y")])[0], [0, 1])
@@ -12,5 +12,5 @@ def chunk_text(text: str, chunk_size: int = 512) -> List[str]:
     words = text.split()
     return [" ".join(words[i:i+chunk_size]) for i in range(0, len(words), chunk_size)]
 
-def attach_metadata(chunk: str, doc_id: str, page_num: int) -> Dict:
-    return {"text": chunk, "doc_id": doc_id, "page": page_num}
+def attach_metadata(chunk: str, doc_id: str, page_num: int, **extra) -> Dict:
+    return {"text": chunk, "doc_id": doc_id, "page": page_num, **extra}
@@ -0,0 +1,237 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import List, Optional
+import numpy as np
+from dotenv import load_dotenv
+import structlog
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: single-process deployments only
+    fcntl = None
+
+load_dotenv()
+logger = structlog.get_logger()
+
+KEY_BYTES = 16
+
+def text_key(text: str) -> bytes:
+    """Content address of a chunk text (first 128 bits of its SHA-256)."""
+    return hashlib.sha256(text.encode("utf-8")).digest()[:KEY_BYTES]
+
+class VectorCache:
+    """Persistent, append-only store of chunk text -> embedding for one model.
+
+    ``<directory>/vectors.bin`` holds fixed-width rows of ``dtype`` (float32 or
+    float16) and is read through a memory map; ``keys.bin`` holds the 16-byte
+    text key of each row in the same order, so a key's row number is its
+    offset into the vector file. Rows are appended vectors-first, and on open
+    both files are cut back to the rows present in both, so a crash mid-append
+    only loses that append. Every worker process has its own instance: appends
+    take a file lock and lookups first read any keys other processes appended.
+    Delete the directory to drop the cache.
+    """
+
+    def __init__(self, directory: str, dtype: str = None):
+        self.directory = directory
+        self.dtype = np.dtype(dtype or os.environ.get("VECTOR_CACHE_DTYPE", "float32"))
+        if self.dtype not in (np.float16, np.float32):
+            raise ValueError(f"VECTOR_CACHE_DTYPE must be float32 or float16, not {self.dtype}")
+        self.vectors_path = os.path.join(directory, "vectors.bin")
+        self.keys_path = os.path.join(directory, "keys.bin")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.lock_path = os.path.join(directory, "append.lock")
+        self.dim = None
+        self._offsets = {}
+        self._map = None
+        self._lock = threading.Lock()
+        self.counts = {"hits": 0, "misses": 0}
+        os.makedirs(directory, exist_ok=True)
+        with self._lock, self._file_lock():
+            self._open()
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialise appends and repairs across processes sharing the directory."""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _open(self, repair: bool = True) -> None:
+        """Load the key index; with ``repair`` (file lock held) also reset or truncate damaged files."""
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+        if not repair and (meta is None or np.dtype(meta["dtype"]) != self.dtype):
+            self.dim, self._offsets, self._map = None, {}, None
+            return
+        if meta is None or np.dtype(meta["dtype"]) != self.dtype:
+            if meta is not None:
+                logger.info("Vector cache dtype changed, starting empty", directory=self.directory, old=meta["dtype"], new=self.dtype.name)
+            self._reset()
+            return
+        self.dim = meta["dim"]
+        row_bytes = self.dim * self.dtype.itemsize
+        rows = min(os.path.getsize(self.keys_path) // KEY_BYTES, os.path.getsize(self.vectors_path) // row_bytes)
+        for path, size in ((self.keys_path, rows * KEY_BYTES), (self.vectors_path, rows * row_bytes)):
+            if repair and os.path.getsize(path) != size:
+                os.truncate(path, size)
+        with open(self.keys_path, "rb") as f:
+            keys = f.read(rows * KEY_BYTES)
+        self._offsets = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(rows)}
+
+    def _reset(self) -> None:
+        for path in (self.vectors_path, self.keys_path, self.meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+        open(self.vectors_path, "wb").close()
+        open(self.keys_path, "wb").close()
+        self.dim = None
+        self._offsets = {}
+        self._map = None
+
+    def _refresh(self) -> None:
+        """Index rows other processes appended since we last looked. Call with ``_lock`` held."""
+        try:
+            size = os.path.getsize(self.keys_path)
+        except OSError:
+            size = 0
+        known = len(self._offsets)
+        if size // KEY_BYTES == known:
+            return
+        if size < known * KEY_BYTES or self.dim is None:
+            # Reset elsewhere, or the first rows (and meta.json) came from another process
+            self._offsets, self._map = {}, None
+            self._open(repair=False)
+            return
+        # Vectors are appended before keys, so every complete key has its row
+        with open(self.keys_path, "rb") as f:
+            f.seek(known * KEY_BYTES)
+            keys = f.read((size // KEY_BYTES - known) * KEY_BYTES)
+        for i in range(len(keys) // KEY_BYTES):
+            self._offsets[keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]] = known + i
+
+    def _rows(self, needed: int) -> np.ndarray:
+        # Remap only when rows were appended past the current mapping
+        if self._map is None or len(self._map) < needed:
+            self._map = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(len(self._offsets), self.dim))
+        return self._map
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._offsets)
+
+    def __contains__(self, key: bytes) -> bool:
+        with self._lock:
+            self._refresh()
+            return key in self._offsets
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        """float32 vectors for ``keys`` (None for misses), gathered from the memory map in one read."""
+        with self._lock:
+            self._refresh()
+            offsets = [self._offsets.get(k) for k in keys]
+            found = [o for o in offsets if o is not None]
+            rows = iter(np.asarray(self._rows(max(found) + 1)[found], dtype=np.float32)) if found else iter(())
+            hits = len(found)
+            self.counts["hits"] += hits
+            self.counts["misses"] += len(keys) - hits
+            ratio = self.counts["hits"] / max(self.counts["hits"] + self.counts["misses"], 1)
+        if hits:
+            metrics.observe_cache("vector", "hit", ratio, count=hits)
+        if len(keys) > hits:
+            metrics.observe_cache("vector", "miss", ratio, count=len(keys) - hits)
+        return [next(rows) if o is not None else None for o in offsets]
+
+    def put_many(self, keys: List[bytes], vectors) -> None:
+        with self._lock, self._file_lock():
+            self._refresh()
+            new = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._offsets and key not in new:
+                    new[key] = vector
+            if not new:
+                return
+            block = np.asarray(list(new.values()), dtype=np.float32)
+            if self.dim is None:
+                self.dim = block.shape[1]
+                tmp_path = f"{self.meta_path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim, "dtype": self.dtype.name}, f)
+                os.replace(tmp_path, self.meta_path)
+            elif block.shape[1] != self.dim:
+                raise ValueError(f"Vector cache holds {self.dim}-d vectors, got {block.shape[1]}-d")
+            # Row numbers come from the files, not from what this instance has seen
+            start = os.path.getsize(self.keys_path) // KEY_BYTES
+            row_bytes = self.dim * self.dtype.itemsize
+            if os.path.getsize(self.vectors_path) != start * row_bytes:
+                # Leftover of an append that crashed before its keys were written
+                os.truncate(self.vectors_path, start * row_bytes)
+            with open(self.vectors_path, "ab") as f:
+                f.write(block.astype(self.dtype).tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(new))
+            for i, key in enumerate(new):
+                self._offsets[key] = start + i
+
+    def hit_ratio(self) -> float:
+        lookups = self.counts["hits"] + self.counts["misses"]
+        return round(self.counts["hits"] / lookups, 4) if lookups else 0.0
+
+    def disk_bytes(self) -> int:
+        return sum(os.path.getsize(p) for p in (self.vectors_path, self.keys_path) if os.path.exists(p))
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refresh()
+            return dict(self.counts, entries=len(self._offsets), hit_ratio=self.hit_ratio(),
+                        disk_bytes=self.disk_bytes(), dim=self.dim, dtype=self.dtype.name)
+
+def cache_dir_for(model_key: str, root: str = None) -> str:
+    """One subdirectory per model (and backend): vectors from different models never mix."""
+    root = root or os.environ.get("VECTOR_CACHE_DIR") or os.path.join(os.environ["DOCS_PROCESSED_DIR"], "vector_cache")
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_key).strip("_")
+    return os.path.join(root, f"{slug}-{hashlib.sha256(model_key.encode('utf-8')).hexdigest()[:8]}")
+
+class CachedEmbeddings:
+    """Embeddings wrapper that serves document vectors from a ``VectorCache``.
+
+    ``embed_documents`` looks every text up in one bulk read and sends only the
+    (deduplicated) misses to the wrapped model, in one call; query embedding
+    is passed through.
+    """
+
+    def __init__(self, embeddings, cache: VectorCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [text_key(t) for t in texts]
+        vectors = self.cache.get_many(keys)
+        missing = {}
+        for text, key, vector in zip(texts, keys, vectors):
+            if vector is None and key not in missing:
+                missing[key] = text
+        if missing:
+            fresh = self.embeddings.embed_documents(list(missing.values()))
+            self.cache.put_many(list(missing), fresh)
+            fresh = dict(zip(missing, fresh))
+            vectors = [fresh[k] if v is None else v for k, v in zip(keys, vectors)]
+        return [v.tolist() if isinstance(v, np.ndarray) else list(v) for v in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)